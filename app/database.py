@@ -1,23 +1,259 @@
-from sqlalchemy import create_engine
+import asyncio
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from passlib.context import CryptContext
+from starlette.requests import HTTPConnection
+from app.config import (
+    BCRYPT_ROUNDS,
+    DATABASE_URL as CONFIGURED_DATABASE_URL,
+    DATABASE_READ_URL as CONFIGURED_READ_URL,
+    DB_READ_POOL_SIZE,
+    DB_READ_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_STATEMENT_TIMEOUT,
+    SQLITE_PRAGMAS,
+)
+
+# Drivers used for each backend by the sync and async engines
+SYNC_DRIVERS = {"sqlite": "sqlite", "postgresql": "postgresql+psycopg2"}
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def database_url(url: str, asynchronous: bool = False) -> str:
+    """Normalize a configured URL to the driver for the sync or async engine"""
+    # Hosting providers often hand out postgres:// URLs
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    drivers = ASYNC_DRIVERS if asynchronous else SYNC_DRIVERS
+    if backend not in drivers:
+        raise ValueError(f"Unsupported database backend: {backend}")
+
+    # Keep a driver named in the URL when it suits this engine
+    explicit = "+" in parsed.drivername
+    if explicit and (parsed.drivername in ASYNC_DRIVERS.values()) == asynchronous:
+        return url
+    return parsed.set(drivername=drivers[backend]).render_as_string(hide_password=False)
+
+
+def read_only_url(url: str) -> str:
+    """URL opening the same database read-only (SQLite URI mode=ro)"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite" or parsed.database in (None, "", ":memory:"):
+        return url
+    return parsed.set(
+        database=f"file:{parsed.database}",
+        query={**parsed.query, "mode": "ro", "uri": "true"}
+    ).render_as_string(hide_password=False)
+
 
 # Database configuration
-DATABASE_URL = "sqlite:///./ceylon_handicrafts.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+DATABASE_URL = database_url(CONFIGURED_DATABASE_URL)
+ASYNC_DATABASE_URL = database_url(CONFIGURED_DATABASE_URL, asynchronous=True)
+ASYNC_DATABASE_READ_URL = database_url(
+    CONFIGURED_READ_URL or read_only_url(CONFIGURED_DATABASE_URL), asynchronous=True)
+
+# Journal settings are the writer's business; a read-only connection
+# cannot change them
+READ_ONLY_SKIPPED_PRAGMAS = ("journal_mode", "synchronous")
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def set_sqlite_read_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            if name not in READ_ONLY_SKIPPED_PRAGMAS:
+                cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def engine_options(url: str, asynchronous: bool, kwargs: dict, read_only: bool = False) -> dict:
+    """Connection and pool settings for a backend; explicit kwargs win"""
+    backend = make_url(url).get_backend_name()
+
+    if backend == "sqlite":
+        if not asynchronous:
+            kwargs.setdefault("connect_args", {"check_same_thread": False})
+        if ":memory:" in url:
+            return kwargs
+    elif backend == "postgresql":
+        # Drop connections the server or a proxy closed while idle
+        kwargs.setdefault("pool_pre_ping", True)
+        kwargs.setdefault("pool_recycle", DB_POOL_RECYCLE)
+        # Cap runaway queries server-side; read pools also refuse writes
+        settings = {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}
+        if read_only:
+            settings["default_transaction_read_only"] = "on"
+        if asynchronous:
+            kwargs.setdefault("connect_args", {"server_settings": settings})
+        else:
+            kwargs.setdefault("connect_args", {"options": " ".join(
+                f"-c {name}={value}" for name, value in settings.items())})
+
+    kwargs.setdefault("pool_size", DB_POOL_SIZE)
+    kwargs.setdefault("max_overflow", DB_MAX_OVERFLOW)
+    kwargs.setdefault("pool_timeout", DB_POOL_TIMEOUT)
+    return kwargs
+
+
+def create_db_engine(url: str = DATABASE_URL, **kwargs):
+    """Create an engine with the connection settings for this deployment"""
+    db_engine = create_engine(url, **engine_options(url, False, kwargs))
+    if db_engine.dialect.name == "sqlite":
+        event.listen(db_engine, "connect", set_sqlite_pragmas)
+    return db_engine
+
+
+def create_async_db_engine(url: str = ASYNC_DATABASE_URL, read_only: bool = False, **kwargs):
+    """Async counterpart of create_db_engine for the request handlers"""
+    if read_only:
+        kwargs.setdefault("pool_size", DB_READ_POOL_SIZE)
+        kwargs.setdefault("max_overflow", DB_READ_MAX_OVERFLOW)
+    db_engine = create_async_engine(url, **engine_options(url, True, kwargs, read_only))
+    if db_engine.dialect.name == "sqlite":
+        event.listen(db_engine.sync_engine, "connect",
+                     set_sqlite_read_pragmas if read_only else set_sqlite_pragmas)
+    return db_engine
+
+
+# Sync engine for startup, migrations, scripts and sync services
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the route handlers
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Separate read-only pool for catalog reads
+async_read_engine = create_async_db_engine(ASYNC_DATABASE_READ_URL, read_only=True)
+AsyncReadSessionLocal = async_sessionmaker(
+    async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+
+def pool_stats(db_engine) -> dict:
+    pool = db_engine.pool
+    if not hasattr(pool, "checkedout"):
+        return {"pool": type(pool).__name__}
+    return {
+        "size": pool.size(),
+        "checkedOut": pool.checkedout(),
+        "overflow": max(0, pool.overflow()),
+        "idle": pool.checkedin(),
+    }
+
+
 # Create Base class for models
 Base = declarative_base()
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Pinning min/max to the configured cost flags hashes made with any other
+# cost as needing an update, so they are rehashed on the next login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+
+class RequestSessions:
+    """
+    The database sessions of one HTTP request. Each kind is opened on first
+    use and shared by everything handling the request (the current_user
+    lookup and every dependency), then closed once by DBSessionMiddleware
+    after the response. The sync session is only for def handlers.
+    """
+
+    __slots__ = ("_write", "_read", "_sync", "closed")
+
+    def __init__(self):
+        self._write = None
+        self._read = None
+        self._sync = None
+        self.closed = False
+
+    def write(self) -> AsyncSession:
+        if self._write is None:
+            self._write = AsyncSessionLocal()
+        return self._write
+
+    def read(self) -> AsyncSession:
+        if self._read is None:
+            self._read = AsyncReadSessionLocal()
+        return self._read
+
+    def sync(self):
+        if self._sync is None:
+            self._sync = SessionLocal()
+        return self._sync
+
+    def opened(self) -> int:
+        return sum(db is not None for db in (self._write, self._read, self._sync))
+
+    async def close(self):
+        self.closed = True
+        for db in (self._write, self._read):
+            if db is not None:
+                await db.close()
+        if self._sync is not None:
+            # Returning a sync connection may roll back; keep it off the loop
+            await asyncio.to_thread(self._sync.close)
+        self._write = self._read = self._sync = None
+
+
+def request_sessions(connection: HTTPConnection):
+    """The request's sessions, or None outside DBSessionMiddleware"""
+    return connection.scope.get("state", {}).get("db_sessions")
+
+
+# Database dependency functions
 
-# Database dependency function
 
+async def get_db(connection: HTTPConnection):
+    sessions = request_sessions(connection)
+    if sessions is not None:
+        yield sessions.write()
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_read_db(connection: HTTPConnection):
+    """Session on the read-only pool, for endpoints that never write"""
+    sessions = request_sessions(connection)
+    if sessions is not None:
+        yield sessions.read()
+        return
+    async with AsyncReadSessionLocal() as db:
+        yield db
 
-def get_db():
+
+def get_sync_db(connection: HTTPConnection):
+    sessions = request_sessions(connection)
+    if sessions is not None:
+        yield sessions.sync()
+        return
     db = SessionLocal()
     try:
         yield db
@@ -28,14 +264,30 @@ def get_db():
 
 
 def init_db():
-    # Import models here to avoid circular imports
-    from app.models import User, UserRole
+    # Import here to avoid circular imports
+    from app.migrations import run_migrations
 
-    Base.metadata.create_all(bind=engine)
+    # Create tables and apply pending schema migrations
+    run_migrations(engine)
 
     # Create admin user if not exists
     add_admin_if_not_exists()
 
+    # Load revoked token ids into memory
+    load_revoked_tokens()
+
+
+def load_revoked_tokens():
+    from app.services.auth_service import revoked_tokens
+
+    db = SessionLocal()
+    try:
+        revoked_tokens.load(db)
+    except Exception as e:
+        print(f"Error loading revoked tokens: {e}")
+    finally:
+        db.close()
+
 
 def add_admin_if_not_exists():
     from app.models import User, UserRole
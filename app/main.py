@@ -1,15 +1,21 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 
 # Import from config module
-from app.database import init_db
-from app.middleware.auth_middleware import auth_middleware
+from app.config import ARCHIVE_ENABLED, ARCHIVE_INTERVAL, REVOCATION_SYNC_INTERVAL, WEB_CONCURRENCY
+from app.database import async_engine, async_read_engine, engine, init_db, load_revoked_tokens
+from app.middleware.auth_middleware import AuthMiddleware
+from app.middleware.db_session import DBSessionMiddleware
+from app.middleware.query_stats import QueryStatsMiddleware
+from app.middleware.rate_limit import LoadMonitorMiddleware, rate_limiter
+from app.services.archive import run_archival
 
 # Import routers - these should come after the config import
 from app.routes.web import router as web_router
-from app.routes.ws import router as ws_router
+from app.routes.ws import relay_bids, router as ws_router
 from app.routes.api.admin_api import router as admin_api_router
 from app.routes.api.landing_api import router as landing_api_router
 from app.routes.api.auth_api import router as auth_api_router
@@ -24,6 +30,21 @@ from app.routes.api.checkout_api import router as checkout_api_router
 from app.routes.api.vishva_library import router as vishva_library_router
 from app.routes.api.craftsman_order import router as craftsman_order_router
 from app.routes.api.categories_api import router as categories_api_router
+
+
+async def sync_revoked_tokens():
+    """Pick up logouts handled by other workers and nodes"""
+    while True:
+        await asyncio.sleep(REVOCATION_SYNC_INTERVAL)
+        await asyncio.to_thread(load_revoked_tokens)
+
+
+async def archive_history():
+    """Move settled bids and closed orders out of the hot tables"""
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+        await run_archival(engine)
+
 # Define lifespan context manager
 
 
@@ -35,7 +56,20 @@ async def lifespan(app: FastAPI):
 
     # Initialize database
     init_db()
+
+    # Watch event loop lag for load shedding
+    monitor_task = asyncio.create_task(rate_limiter.monitor.run())
+    revocation_task = asyncio.create_task(sync_revoked_tokens())
+    bid_relay_task = asyncio.create_task(relay_bids())
+    archive_task = asyncio.create_task(archive_history()) if ARCHIVE_ENABLED else None
     yield
+    monitor_task.cancel()
+    revocation_task.cancel()
+    bid_relay_task.cancel()
+    if archive_task:
+        archive_task.cancel()
+    await async_engine.dispose()
+    await async_read_engine.dispose()
 
 # Create FastAPI app
 app = FastAPI(
@@ -49,7 +83,12 @@ app.mount("/static", StaticFiles(directory=Path(__file__).parent /
           "public"), name="static")
 
 # Add middleware
-app.middleware("http")(auth_middleware)
+app.add_middleware(AuthMiddleware)
+# Outside the auth middleware, so its user lookup shares the request's sessions
+app.add_middleware(DBSessionMiddleware)
+app.add_middleware(LoadMonitorMiddleware)
+# Outermost, so the auth middleware's queries are counted too
+app.add_middleware(QueryStatsMiddleware)
 
 # Include routers
 app.include_router(web_router)
@@ -71,4 +110,6 @@ app.include_router(categories_api_router)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    # Auto-reload only makes sense for a single development process
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000,
+                workers=WEB_CONCURRENCY, reload=WEB_CONCURRENCY == 1)
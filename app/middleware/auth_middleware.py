@@ -1,42 +1,214 @@
-from fastapi import Request, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from app.database import get_db
+from typing import Optional
+
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import HTTPConnection
+from urllib.parse import parse_qs
+from starlette.routing import Mount
+from starlette.staticfiles import StaticFiles
+from app.database import SessionLocal, get_db
 from app.services.auth_service import verify_token
+from app.services.principal_cache import UserPrincipal, principal_cache
+
+
+def verify_principal(token: str) -> tuple:
+    """
+    (principal, user id) for a bearer token. The principal is None when the
+    token is invalid, or when it is a legacy token missing the principal
+    cache and the user still has to be looked up by id.
+    """
+    # Verify token and get user_id
+    user_payload = verify_token(token)
+    if not user_payload:
+        return None, None
+
+    user_id = user_payload.get("sub")
+    if not user_id:
+        return None, None
+
+    # Claims-carrying tokens already describe the user
+    principal = UserPrincipal.from_claims(user_payload)
+    if principal is not None:
+        return principal, user_id
+
+    # Serve the user from the principal cache when possible
+    return principal_cache.get(user_id), user_id
+
+
+def cache_user(user) -> UserPrincipal:
+    if user is None:
+        return None
+    principal = UserPrincipal.from_user(user)
+    principal_cache.set(principal)
+    return principal
+
+
+def resolve_principal(token: str, sessions=None):
+    """
+    Verify a bearer token and return the matching user principal, if any.
+    Blocks on a cache miss, so only for def handlers, which run in the
+    threadpool; the lookup uses the request's sync session when given.
+    """
+    principal, user_id = verify_principal(token)
+    if principal is not None or user_id is None:
+        return principal
+
+    # Import here to avoid circular imports
+    from app.models import User
+
+    shared = sessions is not None and not sessions.closed
+    db = sessions.sync() if shared else SessionLocal()
+
+    try:
+        # Get user from database
+        return cache_user(db.query(User).filter(User.id == user_id).first())
+    finally:
+        if not shared:
+            db.close()
+
+
+async def resolve_principal_async(token: str, db: AsyncSession):
+    """resolve_principal for async code, looking the user up in db"""
+    principal, user_id = verify_principal(token)
+    if principal is not None or user_id is None:
+        return principal
+
+    from app.models import User
+
+    return cache_user(await db.scalar(select(User).where(User.id == user_id)))
+
+
+class LazyPrincipal:
+    """
+    Stand-in for request.state.user that only verifies the token and loads
+    the user the first time a handler actually looks at it. Async handlers
+    get it through the current_user dependency; reading it directly
+    resolves it synchronously.
+    """
+
+    __slots__ = ("_token", "_sessions", "_resolved", "_principal")
+
+    def __init__(self, token: str, sessions=None):
+        self._token = token
+        self._sessions = sessions
+        self._resolved = False
+        self._principal = None
+
+    def resolve(self):
+        if not self._resolved:
+            self._principal = resolve_principal(self._token, self._sessions)
+            self._sessions = None
+            self._resolved = True
+        return self._principal
+
+    async def resolve_async(self, db: AsyncSession):
+        if not self._resolved:
+            self._principal = await resolve_principal_async(self._token, db)
+            self._sessions = None
+            self._resolved = True
+        return self._principal
+
+    def subject(self) -> Optional[str]:
+        """The user id a valid token names, without loading the user"""
+        if self._resolved:
+            return self._principal.id if self._principal else None
+        return verify_principal(self._token)[1]
+
+    def __bool__(self):
+        return self.resolve() is not None
+
+    def __getattr__(self, name):
+        principal = self.resolve()
+        if principal is None:
+            raise AttributeError(name)
+        return getattr(principal, name)
+
+    def __repr__(self):
+        if not self._resolved:
+            return "<LazyPrincipal (unresolved)>"
+        return f"<LazyPrincipal {self._principal!r}>"
+
+
+async def current_user(connection: HTTPConnection,
+                       db: AsyncSession = Depends(get_db)) -> Optional[UserPrincipal]:
+    """
+    The request's user, or None. A cache miss is looked up in the
+    request's own write session, so it shares the handler's connection.
+    """
+    user = connection.scope.get("state", {}).get("user")
+    if isinstance(user, LazyPrincipal):
+        return await user.resolve_async(db)
+    return user
+
+
+_static_prefixes = None
+
+
+def get_static_prefixes(app) -> tuple:
+    """Path prefixes of every StaticFiles mount on the app"""
+    global _static_prefixes
+    if _static_prefixes is None:
+        _static_prefixes = tuple(
+            route.path + "/" for route in app.routes
+            if isinstance(route, Mount) and isinstance(route.app, StaticFiles)
+        )
+    return _static_prefixes
+
+
+def get_bearer_token(headers) -> str:
+    """Extract a bearer token from raw ASGI headers"""
+    for name, value in headers:
+        if name == b"authorization":
+            authorization = value.decode("latin-1")
+            if authorization.startswith("Bearer "):
+                return authorization[len("Bearer "):]
+            return None
+    return None
+
 
-security = HTTPBearer(auto_error=False)
+def get_websocket_token(scope) -> str:
+    """
+    Browsers cannot set headers on a WebSocket handshake, so sockets may
+    pass the token as the subprotocol pair ["bearer", <token>] or as a
+    ?token= query parameter.
+    """
+    subprotocols = scope.get("subprotocols") or []
+    if len(subprotocols) >= 2 and subprotocols[0] == "bearer":
+        return subprotocols[1]
 
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if query.get("token"):
+        return query["token"][0]
+    return None
 
-async def auth_middleware(request: Request, call_next):
-    # Extract token from headers if present
-    authorization = request.headers.get("Authorization")
 
-    request.state.user = None
+class AuthMiddleware:
+    """
+    Pure ASGI auth middleware.
+    Covers both http and websocket scopes, stores the principal in
+    scope["state"] and passes the response through untouched.
+    """
 
-    if authorization and authorization.startswith("Bearer "):
-        token = authorization.replace("Bearer ", "")
+    def __init__(self, app):
+        self.app = app
 
-        # Verify token and get user_id
-        user_payload = verify_token(token)
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
 
-        if user_payload:
-            # Import here to avoid circular imports
-            from app.models import User
+        # Static assets never need a user
+        if scope["path"].startswith(get_static_prefixes(scope["app"])):
+            await self.app(scope, receive, send)
+            return
 
-            user_id = user_payload.get("sub")
-            if user_id:
-                # Get DB session
-                db = next(get_db())
+        token = get_bearer_token(scope["headers"])
+        if token is None and scope["type"] == "websocket":
+            token = get_websocket_token(scope)
+        state = scope.setdefault("state", {})
 
-                try:
-                    # Get user from database
-                    user = db.query(User).filter(User.id == user_id).first()
-                    if user:
-                        # Set user in request state
-                        request.state.user = user
-                finally:
-                    db.close()
+        # Resolved on first access by a handler, in the request's sessions
+        state["user"] = LazyPrincipal(token, state.get("db_sessions")) if token else None
 
-    # Continue processing the request
-    response = await call_next(request)
-    return response
+        await self.app(scope, receive, send)
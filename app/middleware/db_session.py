@@ -0,0 +1,47 @@
+"""
+Request-scoped database sessions
+Gives every HTTP request one RequestSessions (app.database) in its state,
+so the auth middleware and all dependencies share the same lazily opened
+sessions, and closes them once the response has been sent.
+"""
+
+from app.database import RequestSessions
+from app.middleware.auth_middleware import get_static_prefixes
+
+
+class SessionStats:
+    def __init__(self):
+        self.requests = 0
+        self.opened = 0
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "sessionsOpened": self.opened,
+            "sessionsPerRequest": self.opened / self.requests if self.requests else 0,
+        }
+
+
+session_stats = SessionStats()
+
+
+class DBSessionMiddleware:
+    """Pure ASGI middleware owning the sessions of each HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Sockets outlive any one unit of work and open their own sessions
+        if scope["type"] != "http" or scope["path"].startswith(get_static_prefixes(scope["app"])):
+            await self.app(scope, receive, send)
+            return
+
+        sessions = RequestSessions()
+        scope.setdefault("state", {})["db_sessions"] = sessions
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session_stats.requests += 1
+            session_stats.opened += sessions.opened()
+            await sessions.close()
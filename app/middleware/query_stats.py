@@ -0,0 +1,178 @@
+"""
+SQL instrumentation
+Counts and times the statements each HTTP request runs, reports them in
+Server-Timing and X-DB-Queries response headers, and warns when one
+statement shape repeats often enough in a request to look like an N+1.
+
+    with query_budget(3, "checkout summary"):
+        ...  # AssertionError if more than 3 statements ran
+
+    assert_query_budget(client.get("/api/cart-page/items"), 2)
+"""
+
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import SQL_N_PLUS_ONE_THRESHOLD, SQL_TIMING_HEADERS
+from app.middleware.auth_middleware import get_static_prefixes
+
+# Bound parameter lists of any length (IN clauses, VALUES rows) are one
+# shape, whichever paramstyle the driver uses
+PARAM = r"(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)"
+PARAM_LIST = re.compile(rf"\(\s*{PARAM}(?:\s*,\s*{PARAM})*\s*\)")
+MAX_SUSPECTS = 500  # distinct request/statement pairs kept for metrics
+
+
+def statement_shape(statement: str) -> str:
+    return PARAM_LIST.sub("(?)", " ".join(statement.split()))
+
+
+class QueryStats:
+    """Statements run on behalf of one request (or one query_budget block)"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        shape = statement_shape(statement)
+        self.shapes[shape] += 1
+        if self.shapes[shape] == SQL_N_PLUS_ONE_THRESHOLD:
+            query_monitor.suspect(self.label, shape)
+
+    def repeated(self) -> list:
+        """(count, shape) for statements run more than once, most first"""
+        return [(n, shape) for shape, n in self.shapes.most_common() if n > 1]
+
+
+class QueryMonitor:
+    """Process-wide totals for the admin metrics endpoint"""
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.seconds = 0.0
+        self.max_queries = 0
+        self.suspects = Counter()  # (label, shape) -> requests flagged
+
+    def suspect(self, label: str, shape: str):
+        print(f"Possible N+1 in {label}: statement ran "
+              f"{SQL_N_PLUS_ONE_THRESHOLD}+ times: {shape[:300]}")
+        key = (label, shape[:300])
+        if key in self.suspects or len(self.suspects) < MAX_SUSPECTS:
+            self.suspects[key] += 1
+
+    def finish(self, stats: QueryStats):
+        self.requests += 1
+        self.queries += stats.count
+        self.seconds += stats.seconds
+        self.max_queries = max(self.max_queries, stats.count)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "queries": self.queries,
+            "queriesPerRequest": self.queries / self.requests if self.requests else 0,
+            "maxQueriesPerRequest": self.max_queries,
+            "dbMsPerRequest": self.seconds * 1000 / self.requests if self.requests else 0,
+            "nPlusOneSuspects": [
+                {"request": label, "statement": shape, "times": n}
+                for (label, shape), n in self.suspects.most_common(50)
+            ]
+        }
+
+
+query_monitor = QueryMonitor()
+current_stats = ContextVar("query_stats", default=None)
+
+
+# Every engine (sync, async and the read pool) shares these hooks; they
+# only do work while a request or query_budget block is being measured
+@event.listens_for(Engine, "before_cursor_execute")
+def start_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and current_stats.get() is not None:
+        context._query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    started = getattr(context, "_query_started", None)
+    if stats is not None and started is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+
+class QueryStatsMiddleware:
+    """Pure ASGI middleware measuring the SQL run by each HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(get_static_prefixes(scope["app"])):
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(f"{scope['method']} {scope['path']}")
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and SQL_TIMING_HEADERS:
+                total_ms = (time.perf_counter() - start) * 1000
+                queries = "1 query" if stats.count == 1 else f"{stats.count} queries"
+                timing = (f'db;dur={stats.seconds * 1000:.1f};desc="{queries}", '
+                          f"app;dur={total_ms:.1f}")
+                message = {**message, "headers": [
+                    *message.get("headers", []),
+                    (b"server-timing", timing.encode()),
+                    (b"x-db-queries", str(stats.count).encode()),
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_stats.reset(token)
+            query_monitor.finish(stats)
+
+
+def budget_error(label: str, count: int, budget: int, repeated: list) -> str:
+    lines = [f"{label} ran {count} queries, budget is {budget}"]
+    lines += [f"  {n}x {shape[:200]}" for n, shape in repeated]
+    return "\n".join(lines)
+
+
+@contextmanager
+def query_budget(max_queries: int, label: str = "block"):
+    """Fail with AssertionError if the block runs more than max_queries"""
+    stats = QueryStats(label)
+    token = current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+    if stats.count > max_queries:
+        raise AssertionError(budget_error(
+            label, stats.count, max_queries, stats.repeated()))
+
+
+def assert_query_budget(response, max_queries: int):
+    """Check an HTTP response's X-DB-Queries header against a budget"""
+    label = f"{response.request.method} {response.request.url.path}"
+    count = response.headers.get("x-db-queries")
+    if count is None:
+        raise AssertionError(f"{label} has no X-DB-Queries header "
+                             "(is SQL_TIMING_HEADERS on?)")
+    if int(count) > max_queries:
+        raise AssertionError(budget_error(label, int(count), max_queries, []))
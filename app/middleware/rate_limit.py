@@ -0,0 +1,258 @@
+"""
+Rate limiting and load shedding
+Per-user and per-IP token buckets for expensive endpoints, plus a load
+monitor that sheds those endpoints first when the process is overloaded.
+"""
+
+import asyncio
+import threading
+import time
+from array import array
+
+from fastapi import HTTPException, Request
+
+from app.middleware.auth_middleware import LazyPrincipal, get_static_prefixes
+from app.config import (
+    RATE_LIMITS,
+    RATE_LIMIT_MAX_KEYS,
+    LOAD_SHED_MAX_IN_FLIGHT,
+    LOAD_SHED_MAX_LOOP_LAG,
+    LOAD_SHED_RETRY_AFTER,
+    TRUST_PROXY_HEADERS,
+)
+from app.services.product_listing import is_signed_cursor
+
+
+class TokenBucketStore:
+    """
+    Token buckets packed into flat arrays. Keys map to slots; when every
+    slot is taken, an idle (fully refilled) bucket is recycled, falling
+    back to the least recently touched one.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._slots = {}  # key -> slot index
+        self._keys = []  # slot index -> key
+        self._tokens = array("d")
+        self._updated = array("d")
+        self._hand = 0
+
+    def _slot(self, key: str, now: float) -> int:
+        slot = self._slots.get(key)
+        if slot is not None:
+            return slot
+
+        if len(self._keys) < self.max_keys:
+            slot = len(self._keys)
+            self._keys.append(key)
+            self._tokens.append(self.burst)
+            self._updated.append(now)
+        else:
+            slot = self._victim(now)
+            del self._slots[self._keys[slot]]
+            self._keys[slot] = key
+            self._tokens[slot] = self.burst
+            self._updated[slot] = now
+
+        self._slots[key] = slot
+        return slot
+
+    def _victim(self, now: float) -> int:
+        # A bucket idle long enough to refill is as good as a new one
+        full_after = self.burst / self.rate
+        oldest = self._hand
+        for _ in range(len(self._keys)):
+            slot = self._hand
+            self._hand = (self._hand + 1) % len(self._keys)
+            if now - self._updated[slot] >= full_after:
+                return slot
+            if self._updated[slot] < self._updated[oldest]:
+                oldest = slot
+        return oldest
+
+    def _refill(self, slot: int, now: float):
+        elapsed = now - self._updated[slot]
+        if elapsed > 0:
+            self._tokens[slot] = min(
+                self.burst, self._tokens[slot] + elapsed * self.rate)
+            self._updated[slot] = now
+
+    def take(self, keys, now: float) -> float:
+        """
+        Take one token from every key's bucket. Returns 0 when allowed,
+        otherwise the seconds until all buckets could allow the request.
+        Nothing is consumed unless every bucket has a token.
+        """
+        slots = [self._slot(key, now) for key in keys]
+        wait = 0.0
+        for slot in slots:
+            self._refill(slot, now)
+            if self._tokens[slot] < 1:
+                wait = max(wait, (1 - self._tokens[slot]) / self.rate)
+        if wait:
+            return wait
+
+        for slot in slots:
+            self._tokens[slot] -= 1
+        return 0.0
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class LoadMonitor:
+    """Tracks in-flight HTTP requests and event loop lag"""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.in_flight = 0
+        self.loop_lag = 0.0  # seconds, smoothed
+        self.max_loop_lag = 0.0
+
+    async def run(self):
+        """Measure how late the loop wakes us up; run as a background task"""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.loop_lag = 0.8 * self.loop_lag + 0.2 * lag
+            self.max_loop_lag = max(self.max_loop_lag, lag)
+
+    def overloaded(self) -> str:
+        """Name of the exceeded threshold, or None"""
+        if self.in_flight > LOAD_SHED_MAX_IN_FLIGHT:
+            return "in_flight"
+        if self.loop_lag > LOAD_SHED_MAX_LOOP_LAG:
+            return "loop_lag"
+        return None
+
+
+class RateLimiter:
+    """Named rate limit rules from RATE_LIMITS with shed/limit counters"""
+
+    def __init__(self, rules: dict = RATE_LIMITS):
+        self._lock = threading.Lock()
+        self.monitor = LoadMonitor()
+        self._stores = {
+            name: TokenBucketStore(rule["rate"], rule["burst"])
+            for name, rule in rules.items()
+        }
+        self._counters = {
+            name: {"allowed": 0, "limited": 0, "shed": 0}
+            for name in rules
+        }
+
+    def check(self, rule: str, keys) -> tuple:
+        """
+        Returns (status_code, retry_after): (None, 0) when allowed, 503 when
+        shedding load, 429 when one of the keys is over its limit.
+        """
+        counters = self._counters[rule]
+        if self.monitor.overloaded():
+            counters["shed"] += 1
+            return 503, LOAD_SHED_RETRY_AFTER
+
+        with self._lock:
+            wait = self._stores[rule].take(keys, time.monotonic())
+        if wait:
+            counters["limited"] += 1
+            return 429, wait
+
+        counters["allowed"] += 1
+        return None, 0
+
+    def stats(self) -> dict:
+        return {
+            "inFlight": self.monitor.in_flight,
+            "loopLagMs": self.monitor.loop_lag * 1000,
+            "maxLoopLagMs": self.monitor.max_loop_lag * 1000,
+            "rules": {
+                name: {**counters, "trackedKeys": len(self._stores[name])}
+                for name, counters in self._counters.items()
+            }
+        }
+
+
+rate_limiter = RateLimiter()
+
+
+def client_ip(connection) -> str:
+    """Client address, from the proxy headers when TRUST_PROXY_HEADERS is set"""
+    if TRUST_PROXY_HEADERS:
+        real_ip = connection.headers.get("x-real-ip")
+        if real_ip:
+            return real_ip
+        forwarded = connection.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return connection.client.host if connection.client else "unknown"
+
+
+def rate_limit_keys(connection) -> list:
+    """Per-IP bucket always, plus a per-user bucket when signed in"""
+    keys = [f"ip:{client_ip(connection)}"]
+    user = getattr(connection.state, "user", None)
+    # The token's subject is enough for a bucket; loading the user here
+    # would block the event loop on a principal cache miss
+    user_id = user.subject() if isinstance(user, LazyPrincipal) else getattr(user, "id", None)
+    if user_id:
+        keys.append(f"user:{user_id}")
+    return keys
+
+
+class RateLimit:
+    """
+    Route dependency applying a named rule from RATE_LIMITS.
+    With only_with_param set, the rule applies only to requests carrying
+    that query parameter (e.g. searches on a listing endpoint). With
+    cursor_rule set, requests carrying a cursor this server signed (later
+    pages of the same listing) are charged to that rule instead.
+    """
+
+    def __init__(self, rule: str, only_with_param: str = None, cursor_rule: str = None):
+        for name in filter(None, (rule, cursor_rule)):
+            if name not in RATE_LIMITS:
+                raise ValueError(f"Unknown rate limit rule: {name}")
+        self.rule = rule
+        self.only_with_param = only_with_param
+        self.cursor_rule = cursor_rule
+
+    async def __call__(self, request: Request):
+        if self.only_with_param and not request.query_params.get(self.only_with_param):
+            return
+
+        rule = self.rule
+        cursor = request.query_params.get("cursor")
+        if self.cursor_rule and cursor and is_signed_cursor(cursor):
+            rule = self.cursor_rule
+        status_code, retry_after = rate_limiter.check(rule, rate_limit_keys(request))
+        if status_code:
+            raise HTTPException(
+                status_code=status_code,
+                detail="Server is busy, please retry shortly" if status_code == 503
+                else "Too many requests, please slow down",
+                headers={"Retry-After": str(max(1, round(retry_after)))}
+            )
+
+
+class LoadMonitorMiddleware:
+    """Pure ASGI middleware counting in-flight HTTP requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(get_static_prefixes(scope["app"])):
+            await self.app(scope, receive, send)
+            return
+
+        monitor = rate_limiter.monitor
+        monitor.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            monitor.in_flight -= 1
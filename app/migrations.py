@@ -0,0 +1,374 @@
+"""
+Schema migrations
+Versioned, in-place upgrades for existing database files. A fresh database
+is built from the models and stamped with the latest version; an existing
+one gets any new tables from the models and then every pending migration,
+each in its own transaction.
+
+    python -m app.migrations          # upgrade and show status
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, bindparam, func, inspect, literal_column,
+    select, text, update
+)
+
+from app.database import Base
+
+# Kept out of Base.metadata so it is managed only here
+migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+# Arbitrary key for the Postgres advisory lock held while migrating
+MIGRATION_LOCK_KEY = 72093114
+
+
+def migration(version: int, description: str):
+    """Register a migration function taking an open connection"""
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+# ------------------- Helpers -------------------
+
+
+def create_index(conn, name: str, table: str, *columns: str):
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+def drop_index(conn, name: str):
+    conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def add_column(conn, table: str, name: str, ddl: str):
+    """Add a column unless an earlier partial run already added it"""
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    if name not in existing:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+# ------------------- Migrations -------------------
+
+
+@migration(1, "Composite indexes for hot query paths")
+def add_hot_path_indexes(conn):
+    # Listings filtered by type, newest first
+    create_index(conn, "ix_products_type_created_at",
+                 "products", "type", "created_at")
+    # Category pages filtered/sorted by price
+    create_index(conn, "ix_products_category_id_base_price",
+                 "products", "category_id", "base_price")
+    # Craftsman product lists and dashboard joins
+    create_index(conn, "ix_products_user_id_created_at",
+                 "products", "user_id", "created_at")
+    # Highest bid per auction
+    create_index(conn, "ix_bids_product_id_bid_price",
+                 "bids", "product_id", "bid_price")
+    # Orders per product by status
+    create_index(conn, "ix_order_items_product_id_status",
+                 "order_items", "product_id", "status")
+    # A buyer's orders by status (checkout summary/payment)
+    create_index(conn, "ix_order_items_user_id_status",
+                 "order_items", "user_id", "status")
+    # Cart lookups and "already in cart" checks
+    create_index(conn, "ix_cart_items_user_id_product_id",
+                 "cart_items", "user_id", "product_id")
+    # Chat history in order
+    create_index(conn, "ix_messages_chat_id_created_at",
+                 "messages", "chat_id", "created_at")
+    # Ratings through order items
+    create_index(conn, "ix_ratings_order_item_id",
+                 "ratings", "order_item_id")
+
+
+@migration(2, "Denormalized bid, order and rating aggregates on products")
+def add_product_aggregates(conn):
+    from app.services.product_stats import repair
+
+    add_column(conn, "products", "highest_bid", "FLOAT")
+    add_column(conn, "products", "highest_bidder_id", "VARCHAR")
+    add_column(conn, "products", "bid_count", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "products", "rating_avg", "FLOAT")
+    add_column(conn, "products", "rating_count", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "products", "order_count", "INTEGER NOT NULL DEFAULT 0")
+    # Backfill from the existing bids, orders and ratings
+    repair(conn)
+
+
+@migration(3, "Time-ordered ids for new bids, messages and order items")
+def time_ordered_ids(conn):
+    # Nothing to change in place: new rows get time-ordered ids from
+    # generate_uuid, and existing rows keep theirs, since clients, URLs and
+    # logs may already hold them. Cursor pages order by (created_at, id);
+    # see migration 9 for their indexes and 10 for older timestamps.
+    pass
+
+
+@migration(4, "History tables for archived bids and orders")
+def add_history_tables(conn):
+    # The tables themselves come from the models; history is read per
+    # product, newest first
+    create_index(conn, "ix_archived_bids_product_id_id",
+                 "archived_bids", "product_id", "id")
+    create_index(conn, "ix_archived_order_items_product_id_id",
+                 "archived_order_items", "product_id", "id")
+
+
+@migration(5, "Materialized product listing")
+def add_product_listing(conn):
+    # One index per listing order, by type and by category and type. The
+    # rows are backfilled by migration 6, once the images are recorded.
+    for order in ("created_at", "base_price", "popularity"):
+        create_index(conn, f"ix_product_listing_type_{order}",
+                     "product_listing", "type", order)
+        create_index(conn, f"ix_product_listing_category_type_{order}",
+                     "product_listing", "category_id", "type", order)
+
+
+@migration(6, "Image metadata on attachments")
+def add_attachment_metadata(conn):
+    from app.services.product_images import sync_images
+    from app.services.product_listing import rebuild_listing
+
+    add_column(conn, "attachments", "type", "VARCHAR NOT NULL DEFAULT 'image'")
+    add_column(conn, "attachments", "path", "VARCHAR")
+    add_column(conn, "attachments", "description", "VARCHAR")
+    add_column(conn, "attachments", "position", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "attachments", "width", "INTEGER")
+    add_column(conn, "attachments", "height", "INTEGER")
+    add_column(conn, "attachments", "bytes", "INTEGER")
+    add_column(conn, "attachments", "is_primary", "BOOLEAN NOT NULL DEFAULT FALSE")
+    add_column(conn, "attachments", "created_at", "TIMESTAMP")
+    create_index(conn, "ix_attachments_product_id_position",
+                 "attachments", "product_id", "position")
+    # Backfill from the image directories, a batch of products at a time
+    products = Table("products", MetaData(), autoload_with=conn)
+    product_ids = conn.execute(select(products.c.id)).scalars().all()
+    for offset in range(0, len(product_ids), 1000):
+        sync_images(conn, product_ids[offset:offset + 1000])
+    # Then the listing rows, images included
+    rebuild_listing(conn)
+
+
+@migration(7, "Product id tiebreak on the listing indexes")
+def add_listing_tiebreak(conn):
+    # Cursor pages seek past (sort key, product id)
+    for order in ("created_at", "base_price", "popularity"):
+        drop_index(conn, f"ix_product_listing_type_{order}")
+        create_index(conn, f"ix_product_listing_type_{order}",
+                     "product_listing", "type", order, "product_id")
+        drop_index(conn, f"ix_product_listing_category_type_{order}")
+        create_index(conn, f"ix_product_listing_category_type_{order}",
+                     "product_listing", "category_id", "type", order, "product_id")
+
+
+
+@migration(8, "Full-text product search")
+def add_product_search(conn):
+    from app.models import ProductListing
+    from app.services.product_listing import rebuild_listing
+
+    if conn.dialect.name == "sqlite":
+        # Recreate product_listing with an integer id for the search index
+        # to point at; creating it also creates product_search and its
+        # triggers
+        conn.execute(text("DROP TABLE IF EXISTS product_search"))
+        conn.execute(text("DROP TABLE IF EXISTS product_listing"))
+        ProductListing.__table__.create(conn)
+        rebuild_listing(conn)
+        return
+
+    # Other databases have no search index, so the rows stay and only the
+    # key changes: an integer id, with product_id kept unique. A table
+    # create_all made during this upgrade already has it.
+    existing = {c["name"] for c in inspect(conn).get_columns("product_listing")}
+    if "id" in existing:
+        return
+    conn.execute(text(
+        "ALTER TABLE product_listing DROP CONSTRAINT product_listing_pkey"))
+    conn.execute(text(
+        "ALTER TABLE product_listing ADD COLUMN id SERIAL PRIMARY KEY"))
+    conn.execute(text(
+        "ALTER TABLE product_listing "
+        "ADD CONSTRAINT product_listing_product_id_key UNIQUE (product_id)"))
+
+
+@migration(9, "Cursor indexes on (created_at, id)")
+def add_created_at_cursor_indexes(conn):
+    # Bid, order and chat history pages seek past (created_at, id) rather
+    # than the id alone, so rows with random ids page correctly too
+    drop_index(conn, "ix_messages_chat_id_id")
+    drop_index(conn, "ix_messages_chat_id_created_at")
+    create_index(conn, "ix_messages_chat_id_created_at_id",
+                 "messages", "chat_id", "created_at", "id")
+    for table in ("bids", "archived_bids", "archived_order_items"):
+        drop_index(conn, f"ix_{table}_product_id_id")
+        create_index(conn, f"ix_{table}_product_id_created_at_id",
+                     table, "product_id", "created_at", "id")
+
+
+@migration(10, "Distinct created_at for rows from the frozen default")
+def spread_frozen_created_at(conn):
+    # Before migrations existed, created_at defaulted to the time the
+    # process started, so every bid, message and order item of one run
+    # shares a timestamp and (created_at, id) pages came back in random id
+    # order. Space each shared timestamp's rows a microsecond apart in the
+    # order they were written: by rowid, and for bids by price, since each
+    # accepted bid beat the one before. Only SQLite databases are that old.
+    if conn.dialect.name != "sqlite":
+        return
+
+    tables = {
+        "bids": ("bid_price",),
+        "archived_bids": ("bid_price",),
+        "messages": (),
+        "order_items": (),
+        "archived_order_items": (),
+    }
+    for name, order in tables.items():
+        table = Table(name, MetaData(), autoload_with=conn)
+        shared = (
+            select(table.c.created_at)
+            .group_by(table.c.created_at)
+            .having(func.count() > 1)
+        )
+        rows = conn.execute(
+            select(table.c.id, table.c.created_at)
+            .where(table.c.created_at.in_(shared))
+            .order_by(table.c.created_at, *(table.c[column] for column in order),
+                      literal_column("rowid"))
+        ).all()
+
+        changes = []
+        previous, offset = None, 0
+        for row_id, created_at in rows:
+            offset = offset + 1 if created_at == previous else 0
+            previous = created_at
+            if offset:
+                changes.append({"row_id": row_id,
+                                "new_created_at": created_at + timedelta(microseconds=offset)})
+        if changes:
+            conn.execute(
+                update(table)
+                .where(table.c.id == bindparam("row_id"))
+                .values(created_at=bindparam("new_created_at")),
+                changes
+            )
+
+# ------------------- Runner -------------------
+
+
+@contextmanager
+def migration_lock(engine):
+    """
+    Let one process at a time migrate, so workers (and nodes) starting
+    together do not race to create the same tables and indexes.
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"),
+                         {"key": MIGRATION_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"),
+                             {"key": MIGRATION_LOCK_KEY})
+        return
+
+    database = engine.url.database
+    if engine.dialect.name != "sqlite" or not database or database == ":memory:":
+        yield
+        return
+
+    # SQLite is single-host, so a lock file beside the database will do
+    try:
+        import fcntl
+    except ImportError:  # Windows development machines
+        yield
+        return
+
+    with open(f"{database}.migrate.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def applied_versions(conn) -> set:
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def record(conn, version: int, description: str):
+    conn.execute(schema_migrations.insert().values(
+        version=version, description=description, applied_at=datetime.now()))
+
+
+def run_migrations(engine):
+    """Bring the database at engine up to the latest schema version"""
+    with migration_lock(engine):
+        apply_migrations(engine)
+
+
+def apply_migrations(engine):
+    # Import models so every table is registered on Base.metadata
+    import app.models  # noqa: F401
+
+    with engine.connect() as conn:
+        fresh = not inspect(conn).has_table("users")
+
+    # Creates tables added since the database was made (all of them if fresh)
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        migration_metadata.create_all(bind=conn)
+        applied = applied_versions(conn)
+
+        if fresh:
+            # create_all already built the latest schema
+            for version, description, _ in MIGRATIONS:
+                if version not in applied:
+                    record(conn, version, description)
+            return
+
+    for version, description, fn in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            record(conn, version, description)
+        print(f"Applied migration {version}: {description}")
+
+
+def migration_status(engine) -> list:
+    with engine.connect() as conn:
+        migration_metadata.create_all(bind=conn)
+        conn.commit()
+        applied = applied_versions(conn)
+    return [
+        (version, description, version in applied)
+        for version, description, _ in MIGRATIONS
+    ]
+
+
+if __name__ == "__main__":
+    from app.database import engine
+
+    run_migrations(engine)
+    for version, description, applied in migration_status(engine):
+        print(f"{version:>4}  {'applied' if applied else 'pending':<8} {description}")
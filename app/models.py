@@ -1,11 +1,15 @@
-from sqlalchemy import Column, String, Float, ForeignKey, DateTime, Boolean, Enum, Integer, Text, JSON
+from sqlalchemy import Column, String, Float, ForeignKey, DateTime, Boolean, Enum, Integer, Text, JSON, Index, DDL, event
 from sqlalchemy.orm import relationship
 import enum
+import os
+import threading
+import time
 import uuid
 from datetime import datetime
 
 # Import Base from database instead of creating a new one
 from app.database import Base
+from app.config import ID_SCHEME
 
 
 class UserRole(enum.Enum):
@@ -29,8 +33,39 @@ class ProductType(enum.Enum):
     AUCTION = "Auction"
 
 
+_uuid7_lock = threading.Lock()
+_uuid7_last = [0, 0]  # millisecond timestamp and counter of the last id
+
+
+def uuid7(timestamp: datetime = None) -> str:
+    """
+    A UUIDv7 string: 48-bit Unix milliseconds, then a 12-bit counter and
+    62 random bits. Ids made by this process are strictly increasing, so
+    they sort in creation order as strings too. Pass timestamp to make an
+    id for a row created in the past.
+    """
+    ms = int((timestamp.timestamp() if timestamp else time.time()) * 1000)
+    with _uuid7_lock:
+        last_ms, counter = _uuid7_last
+        if timestamp is None and ms <= last_ms:
+            # Same millisecond (or the clock stepped back): count up
+            ms, counter = last_ms, counter + 1
+            if counter > 0xFFF:
+                ms, counter = ms + 1, 0
+        elif ms == last_ms:
+            counter = min(counter + 1, 0xFFF)
+        else:
+            # Start low so a busy millisecond has room to count
+            counter = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        _uuid7_last[:] = [ms, counter]
+
+    tail = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    value = (ms << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | tail
+    return str(uuid.UUID(int=value))
+
+
 def generate_uuid():
-    return str(uuid.uuid4())
+    return uuid7() if ID_SCHEME == "uuid7" else str(uuid.uuid4())
 
 
 class User(Base):
@@ -81,6 +116,11 @@ class Category(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        Index("ix_products_type_created_at", "type", "created_at"),
+        Index("ix_products_category_id_base_price", "category_id", "base_price"),
+        Index("ix_products_user_id_created_at", "user_id", "created_at"),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
@@ -93,9 +133,18 @@ class Product(Base):
     length = Column(Float)
     width = Column(Float)
     height = Column(Float)
-    created_at = Column(DateTime, default=datetime.now())
-    updated_at = Column(DateTime, default=datetime.now(),
-                        onupdate=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now,
+                        onupdate=datetime.now)
+
+    # Aggregates kept current by app.services.product_stats in the same
+    # transaction as the bid, order or rating write
+    highest_bid = Column(Float)
+    highest_bidder_id = Column(String)  # copy of bids.user_id, not a relationship
+    bid_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_avg = Column(Float)
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
+    order_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Relationships
     craftsman = relationship("User", back_populates="products")
@@ -103,7 +152,8 @@ class Product(Base):
     bids = relationship("Bid", back_populates="product")
     cart_items = relationship("CartItem", back_populates="product")
     order_items = relationship("OrderItem", back_populates="product")
-    attachments = relationship("Attachment", back_populates="product")
+    attachments = relationship("Attachment", back_populates="product",
+                               order_by="Attachment.position")
 
 
 class Chat(Base):
@@ -112,9 +162,9 @@ class Chat(Base):
     id = Column(String, primary_key=True, default=generate_uuid)
     title = Column(String, nullable=False)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
-    created_at = Column(DateTime, default=datetime.now())
-    updated_at = Column(DateTime, default=datetime.now(),
-                        onupdate=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now,
+                        onupdate=datetime.now)
 
     # Relationships
     user = relationship("User", back_populates="chats")
@@ -123,12 +173,16 @@ class Chat(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Chat history in order; the id breaks created_at ties for cursors
+        Index("ix_messages_chat_id_created_at_id", "chat_id", "created_at", "id"),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
     chat_id = Column(String, ForeignKey("chats.id"), nullable=False)
     is_from_user = Column(Boolean, nullable=False)
     message = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
 
     # Relationships
     chat = relationship("Chat", back_populates="messages")
@@ -136,11 +190,32 @@ class Message(Base):
 
 
 class Attachment(Base):
+    """
+    A file attached to a product or message. Product images are recorded
+    here by app.services.product_images as they are written to disk, so
+    image lists come from the database rather than the directories.
+    """
     __tablename__ = "attachments"
+    __table_args__ = (
+        Index("ix_attachments_product_id_position", "product_id", "position"),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
     product_id = Column(String, ForeignKey("products.id"), nullable=True)
     message_id = Column(String, ForeignKey("messages.id"), nullable=True)
+    type = Column(String, nullable=False, default="image", server_default="image")
+    path = Column(String)  # relative to app/public
+    description = Column(String)
+    position = Column(Integer, nullable=False, default=0, server_default="0")
+    width = Column(Integer)
+    height = Column(Integer)
+    bytes = Column(Integer)
+    is_primary = Column(Boolean, nullable=False, default=False, server_default="0")
+    created_at = Column(DateTime, default=datetime.now)
+
+    @property
+    def url(self):
+        return f"/static/{self.path}" if self.path else None
 
     # Relationships
     product = relationship("Product", back_populates="attachments")
@@ -149,14 +224,17 @@ class Attachment(Base):
 
 class CartItem(Base):
     __tablename__ = "cart_items"
+    __table_args__ = (
+        Index("ix_cart_items_user_id_product_id", "user_id", "product_id"),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     product_id = Column(String, ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, nullable=False)
-    created_at = Column(DateTime, default=datetime.now())
-    updated_at = Column(DateTime, default=datetime.now(),
-                        onupdate=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now,
+                        onupdate=datetime.now)
 
     # Relationships
     user = relationship("User", back_populates="cart_items")
@@ -165,6 +243,10 @@ class CartItem(Base):
 
 class OrderItem(Base):
     __tablename__ = "order_items"
+    __table_args__ = (
+        Index("ix_order_items_product_id_status", "product_id", "status"),
+        Index("ix_order_items_user_id_status", "user_id", "status"),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
@@ -173,9 +255,9 @@ class OrderItem(Base):
     unit_price = Column(Float, nullable=False)
     status = Column(Enum(OrderStatus), nullable=False,
                     default=OrderStatus.INITIATED)
-    created_at = Column(DateTime, default=datetime.now())
-    updated_at = Column(DateTime, default=datetime.now(),
-                        onupdate=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now,
+                        onupdate=datetime.now)
 
     # Relationships
     user = relationship("User", back_populates="orders")
@@ -190,6 +272,9 @@ class OrderItem(Base):
 
 class Rating(Base):
     __tablename__ = "ratings"
+    __table_args__ = (
+        Index("ix_ratings_order_item_id", "order_item_id"),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
     order_item_id = Column(String, ForeignKey(
@@ -209,13 +294,161 @@ class Rating(Base):
 
 class Bid(Base):
     __tablename__ = "bids"
+    __table_args__ = (
+        Index("ix_bids_product_id_bid_price", "product_id", "bid_price"),
+        # Cursor pages of an auction's bid history, by (created_at, id)
+        Index("ix_bids_product_id_created_at_id", "product_id", "created_at", "id"),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
     product_id = Column(String, ForeignKey("products.id"), nullable=False)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     bid_price = Column(Float, nullable=False)
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
 
     # Relationships
     user = relationship("User", back_populates="bids")
     product = relationship("Product", back_populates="bids")
+
+
+class ProductListing(Base):
+    """
+    One row per product with everything a listing card shows, kept current
+    by app.services.product_listing, so a listing page is a range scan of
+    one of these indexes.
+    """
+    __tablename__ = "product_listing"
+    __table_args__ = (
+        # The product id breaks ties, so cursor pages are an exact seek
+        Index("ix_product_listing_type_created_at", "type", "created_at", "product_id"),
+        Index("ix_product_listing_type_base_price", "type", "base_price", "product_id"),
+        Index("ix_product_listing_type_popularity", "type", "popularity", "product_id"),
+        Index("ix_product_listing_category_type_created_at",
+              "category_id", "type", "created_at", "product_id"),
+        Index("ix_product_listing_category_type_base_price",
+              "category_id", "type", "base_price", "product_id"),
+        Index("ix_product_listing_category_type_popularity",
+              "category_id", "type", "popularity", "product_id"),
+    )
+
+    # An integer key so the full-text index (product_search) can point at
+    # rows by a rowid that survives VACUUM
+    id = Column(Integer, primary_key=True)
+    product_id = Column(String, ForeignKey("products.id"), nullable=False, unique=True)
+    user_id = Column(String, nullable=False)
+    category_id = Column(String, nullable=False)
+    type = Column(Enum(ProductType), nullable=False)
+    title = Column(String, nullable=False)
+    description = Column(Text)
+    base_price = Column(Float, nullable=False)
+    weight = Column(Float)
+    length = Column(Float)
+    width = Column(Float)
+    height = Column(Float)
+    created_at = Column(DateTime)
+
+    category_title = Column(String)
+    category_icon = Column(String)
+    images = Column(JSON)  # static URLs of the product's images
+    primary_image = Column(String)
+
+    current_bid = Column(Float)  # auctions only: highest bid, else base price
+    bid_count = Column(Integer, nullable=False, default=0)
+    rating_avg = Column(Float)
+    rating_count = Column(Integer, nullable=False, default=0)
+    order_count = Column(Integer, nullable=False, default=0)
+    popularity = Column(Integer, nullable=False, default=0)
+
+
+# SQLite full-text index over each listing row's title, description and
+# category title, created with the table and kept in step by triggers; see
+# app.services.product_search
+PRODUCT_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+        title, description, category_title,
+        content='product_listing', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_listing_search_insert
+    AFTER INSERT ON product_listing BEGIN
+        INSERT INTO product_search(rowid, title, description, category_title)
+        VALUES (new.id, new.title, new.description, new.category_title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_listing_search_delete
+    AFTER DELETE ON product_listing BEGIN
+        INSERT INTO product_search(product_search, rowid, title, description, category_title)
+        VALUES ('delete', old.id, old.title, old.description, old.category_title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_listing_search_update
+    AFTER UPDATE OF title, description, category_title ON product_listing BEGIN
+        INSERT INTO product_search(product_search, rowid, title, description, category_title)
+        VALUES ('delete', old.id, old.title, old.description, old.category_title);
+        INSERT INTO product_search(rowid, title, description, category_title)
+        VALUES (new.id, new.title, new.description, new.category_title);
+    END
+    """,
+]
+for statement in PRODUCT_SEARCH_DDL:
+    event.listen(ProductListing.__table__, "after_create",
+                 DDL(statement).execute_if(dialect="sqlite"))
+
+
+# History tables: bids of settled auctions and orders closed long ago are
+# moved here by app.services.archive so the hot tables stay small. Same
+# columns as their hot tables, plus when the row was archived.
+
+
+class ArchivedBid(Base):
+    __tablename__ = "archived_bids"
+    __table_args__ = (
+        Index("ix_archived_bids_product_id_created_at_id", "product_id", "created_at", "id"),
+    )
+
+    id = Column(String, primary_key=True)
+    product_id = Column(String, ForeignKey("products.id"), nullable=False)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    bid_price = Column(Float, nullable=False)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False)
+
+    # Relationships
+    user = relationship("User")
+    product = relationship("Product")
+
+
+class ArchivedOrderItem(Base):
+    __tablename__ = "archived_order_items"
+    __table_args__ = (
+        Index("ix_archived_order_items_product_id_created_at_id",
+              "product_id", "created_at", "id"),
+    )
+
+    id = Column(String, primary_key=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    product_id = Column(String, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    unit_price = Column(Float, nullable=False)
+    status = Column(Enum(OrderStatus), nullable=False)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False)
+
+    # Relationships
+    user = relationship("User")
+    product = relationship("Product")
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=True)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, default=datetime.now)
@@ -215,9 +215,8 @@ class BidSection extends LitElement {
     }
 
     try {
-      // Send bid through WebSocket
+      // Send bid through WebSocket (the bidder is the socket's signed-in user)
       this.wsConnection.send({
-        user_id: this.currentUserId,
         bid_price: bidAmount,
       });
 
@@ -1,6 +1,6 @@
 import { LitElement, html } from "https://esm.run/lit";
 import { postJson } from "../../utils/api_utils.js";
-import { saveToken, saveUser } from "../../utils/auth_utils.js";
+import { saveTokens, saveUser } from "../../utils/auth_utils.js";
 
 class AddressForm extends LitElement {
   static get properties() {
@@ -66,7 +66,7 @@ class AddressForm extends LitElement {
       });
 
       // Save auth data
-      saveToken(data.access_token);
+      saveTokens(data);
       saveUser(data.user);
 
       // Redirect based on user role
@@ -25,6 +25,12 @@ class CartItem extends LitElement {
 
   async firstUpdated() {
     if (this.item && this.item.product) {
+      // The cart items come with their product's images
+      const attachments = this.item.product.attachments;
+      if (attachments) {
+        this.productImages = attachments.map((attachment) => attachment.url);
+        return;
+      }
       await this.loadProductImages(this.item.product.id);
     }
   }
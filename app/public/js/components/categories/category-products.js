@@ -1,5 +1,5 @@
 import { LitElement, html } from "https://esm.run/lit";
-import { fetchJson } from "../../utils/api_utils.js";
+import { fetchJson, fetchProductImages } from "../../utils/api_utils.js";
 import "../../components/global/sale-product-card.js";
 import "../../components/global/auction-product-card.js";
 
@@ -104,33 +104,26 @@ class CategoryProducts extends LitElement {
 
       const response = await fetchJson(endpoint);
 
-      // Fetch image paths for each product
+      // Fetch image paths for the whole page in one request
       const products = response.products || [];
-      await Promise.all(
-        products.map(async (product) => {
-          try {
-            const imageData = await fetchJson(
-              `/api/landing/product/${product.id}/images`
-            );
-            product.image_paths = imageData.images;
-            product.currentImageIndex = 0;
-
-            // Format for product card components
-            if (!product.category) {
-              product.category = {
-                title: product.category_title || "Uncategorized",
-                icon: product.category_icon || "fa fa-tag",
-              };
-            }
-          } catch (error) {
-            console.error(
-              `Error fetching images for product ${product.id}:`,
-              error
-            );
-            product.image_paths = [];
-          }
-        })
-      );
+      let images = {};
+      try {
+        images = await fetchProductImages(products.map((product) => product.id));
+      } catch (error) {
+        console.error("Error fetching product images:", error);
+      }
+      products.forEach((product) => {
+        product.image_paths = images[product.id] || [];
+        product.currentImageIndex = 0;
+
+        // Format for product card components
+        if (!product.category) {
+          product.category = {
+            title: product.category_title || "Uncategorized",
+            icon: product.category_icon || "fa fa-tag",
+          };
+        }
+      });
 
       this.products = products;
       this.totalPages = response.totalPages || 1;
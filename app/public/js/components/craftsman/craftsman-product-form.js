@@ -1,5 +1,6 @@
 import { LitElement, html } from "https://esm.run/lit";
 import { fetchJson } from "../../utils/api_utils.js";
+import { getFreshToken } from "../../utils/auth_utils.js";
 
 class CraftsmanProductForm extends LitElement {
   static get properties() {
@@ -233,7 +234,7 @@ class CraftsmanProductForm extends LitElement {
           headers: {
             // Don't set content-type header for multipart/form-data
             // Let the browser set it with the boundary
-            Authorization: `Bearer ${localStorage.getItem("auth_token")}`,
+            Authorization: `Bearer ${await getFreshToken()}`,
           },
         });
       } else {
@@ -243,7 +244,7 @@ class CraftsmanProductForm extends LitElement {
           body: formData,
           headers: {
             // Don't set content-type header for multipart/form-data
-            Authorization: `Bearer ${localStorage.getItem("auth_token")}`,
+            Authorization: `Bearer ${await getFreshToken()}`,
           },
         });
       }
@@ -40,22 +40,11 @@ class FeaturedProductsSection extends LitElement {
 
       const products = await fetchJson(endpoint);
 
-      // Fetch image paths for each product
-      for (let i = 0; i < products.length; i++) {
-        try {
-          const imageData = await fetchJson(
-            `/api/landing/product/${products[i].id}/images`
-          );
-          products[i].image_paths = imageData.images;
-          products[i].currentImageIndex = 0; // Initialize current image index
-        } catch (error) {
-          console.error(
-            `Error fetching images for product ${products[i].id}:`,
-            error
-          );
-          products[i].image_paths = [];
-        }
-      }
+      // Image paths come with the featured products
+      products.forEach((product) => {
+        product.image_paths = product.image_paths || [];
+        product.currentImageIndex = 0; // Initialize current image index
+      });
 
       this.products = products;
       this.loading = false;
@@ -1,5 +1,5 @@
 import { LitElement, html } from "https://esm.run/lit";
-import { fetchJson } from "../../utils/api_utils.js";
+import { fetchJson, fetchProductImages } from "../../utils/api_utils.js";
 import "../../components/global/auction-product-card.js";
 import "../../components/global/sale-product-card.js";
 
@@ -127,25 +127,28 @@ class ProductListing extends LitElement {
         };
       }
 
-      // Fetch image paths for each product
+      // The listing endpoints include image paths; fetch any missing ones
+      // for the whole page in one request
       const products = response.products || response;
-      await Promise.all(
-        products.map(async (product) => {
-          try {
-            const imageData = await fetchJson(
-              `/api/landing/product/${product.id}/images`
-            );
-            product.image_paths = imageData.images;
-            product.currentImageIndex = 0; // Initialize current image index
-          } catch (error) {
-            console.error(
-              `Error fetching images for product ${product.id}:`,
-              error
-            );
+      const missing = products.filter((product) => !product.image_paths);
+      if (missing.length > 0) {
+        try {
+          const images = await fetchProductImages(
+            missing.map((product) => product.id)
+          );
+          missing.forEach((product) => {
+            product.image_paths = images[product.id] || [];
+          });
+        } catch (error) {
+          console.error("Error fetching product images:", error);
+          missing.forEach((product) => {
             product.image_paths = [];
-          }
-        })
-      );
+          });
+        }
+      }
+      products.forEach((product) => {
+        product.currentImageIndex = 0; // Initialize current image index
+      });
 
       this.products = products;
       this.totalPages = response.totalPages || 1;
@@ -229,6 +232,12 @@ class ProductListing extends LitElement {
     event.preventDefault();
     const searchInput = this.querySelector("#search-input");
     this.searchQuery = searchInput.value.trim();
+    // Searches show the best matches first; without one there is no match to rank
+    if (this.searchQuery) {
+      this.sortBy = "relevance";
+    } else if (this.sortBy === "relevance") {
+      this.sortBy = "newest";
+    }
     this.currentPage = 1;
     this.fetchProducts();
   }
@@ -242,6 +251,7 @@ class ProductListing extends LitElement {
   handleClearFilters() {
     this.searchQuery = "";
     this.category = "";
+    if (this.sortBy === "relevance") this.sortBy = "newest";
     this.currentPage = 1;
     this.fetchProducts();
   }
@@ -292,6 +302,16 @@ class ProductListing extends LitElement {
         <div class="sort-filter">
           <label for="sort-select">Sort By:</label>
           <select id="sort-select" @change=${this.handleSortChange}>
+            ${this.searchQuery
+              ? html`
+                  <option
+                    value="relevance"
+                    ?selected=${this.sortBy === "relevance"}
+                  >
+                    Best Match
+                  </option>
+                `
+              : ""}
             <option value="newest" ?selected=${this.sortBy === "newest"}>
               Newest First
             </option>
@@ -1,5 +1,5 @@
 import { LitElement, html } from "https://esm.run/lit";
-import { fetchJson } from "../../utils/api_utils.js";
+import { fetchJson, fetchProductImages } from "../../utils/api_utils.js";
 import "../../components/global/sale-product-card.js";
 
 class RelatedProducts extends LitElement {
@@ -39,45 +39,33 @@ class RelatedProducts extends LitElement {
       );
       console.log("Related products:", relatedProducts);
 
-      // Fetch images for each product and format for sale-product-card
-      const productsWithImages = await Promise.all(
-        relatedProducts.map(async (product) => {
-          try {
-            const imagesResponse = await fetchJson(
-              `/api/product-details/${product.id}/images`
-            );
-
-            // Format for sale-product-card
-            return {
-              ...product,
-              image_paths:
-                imagesResponse.images && imagesResponse.images.length > 0
-                  ? imagesResponse.images
-                  : ["/static/images/placeholder-product.jpg"],
-              currentImageIndex: 0,
-              // Format category in the structure that sale-product-card expects
-              category: {
-                title: product.category_title || "Uncategorized",
-                icon: "fa fa-tag",
-              },
-            };
-          } catch (error) {
-            console.error(
-              `Error fetching images for product ${product.id}:`,
-              error
-            );
-            return {
-              ...product,
-              image_paths: ["/static/images/placeholder-product.jpg"],
-              currentImageIndex: 0,
-              category: {
-                title: product.category_title || "Uncategorized",
-                icon: "fa fa-tag",
-              },
-            };
-          }
-        })
-      );
+      // Fetch images for all the products in one request
+      let images = {};
+      try {
+        images = await fetchProductImages(
+          relatedProducts.map((product) => product.id)
+        );
+      } catch (error) {
+        console.error("Error fetching product images:", error);
+      }
+
+      // Format for sale-product-card
+      const productsWithImages = relatedProducts.map((product) => {
+        const imagePaths = images[product.id] || [];
+        return {
+          ...product,
+          image_paths:
+            imagePaths.length > 0
+              ? imagePaths
+              : ["/static/images/placeholder-product.jpg"],
+          currentImageIndex: 0,
+          // Format category in the structure that sale-product-card expects
+          category: {
+            title: product.category_title || "Uncategorized",
+            icon: "fa fa-tag",
+          },
+        };
+      });
 
       this.products = productsWithImages;
       this.loading = false;
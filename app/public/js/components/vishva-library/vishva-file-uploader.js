@@ -1,5 +1,6 @@
 import { LitElement, html } from "https://esm.run/lit";
 import { postJson } from "../../utils/api_utils.js";
+import { getFreshToken } from "../../utils/auth_utils.js";
 
 class VishvaFileUploader extends LitElement {
   static get properties() {
@@ -105,7 +106,7 @@ class VishvaFileUploader extends LitElement {
       xhr.open("POST", "/api/vishva-library/files", true);
 
       // Add auth token if available
-      const token = localStorage.getItem("auth_token");
+      const token = await getFreshToken();
       if (token) {
         xhr.setRequestHeader("Authorization", `Bearer ${token}`);
       }
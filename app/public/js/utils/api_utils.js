@@ -2,7 +2,7 @@
  * API utility functions for Ceylon Handicrafts
  */
 
-import { getToken } from "./auth_utils.js";
+import { getFreshToken } from "./auth_utils.js";
 
 // Fetch JSON data from API with authentication
 export async function fetchJson(url, options = {}) {
@@ -12,7 +12,7 @@ export async function fetchJson(url, options = {}) {
   };
 
   // Add auth token if available
-  const token = getToken();
+  const token = await getFreshToken();
   if (token) {
     headers["Authorization"] = `Bearer ${token}`;
   }
@@ -36,6 +36,16 @@ export async function fetchJson(url, options = {}) {
   return response.json();
 }
 
+// Fetch the image lists of several products in one request, keyed by id
+export async function fetchProductImages(productIds) {
+  const ids = [...new Set(productIds)];
+  if (ids.length === 0) return {};
+
+  const query = ids.map((id) => encodeURIComponent(id)).join(",");
+  const data = await fetchJson(`/api/landing/products/images?ids=${query}`);
+  return data.images || {};
+}
+
 // Post data to API with authentication
 export async function postJson(url, data = {}, customOptions = {}) {
   // Check if we're using custom options (including body and headers)
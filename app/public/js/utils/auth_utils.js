@@ -12,6 +12,75 @@ export function getToken() {
   return localStorage.getItem("auth_token");
 }
 
+// Store the tokens from a login/refresh response
+export function saveTokens(data) {
+  saveToken(data.access_token);
+  if (data.refresh_token) {
+    localStorage.setItem("refresh_token", data.refresh_token);
+  }
+}
+
+// Retrieve refresh token from localStorage
+export function getRefreshToken() {
+  return localStorage.getItem("refresh_token");
+}
+
+// Read the expiry (ms since epoch) of a JWT, or null if it has none
+function getTokenExpiry(token) {
+  try {
+    const payload = JSON.parse(
+      atob(token.split(".")[1].replace(/-/g, "+").replace(/_/g, "/"))
+    );
+    return payload.exp ? payload.exp * 1000 : null;
+  } catch (e) {
+    return null;
+  }
+}
+
+// Exchange the refresh token for a new access token
+let refreshPromise = null;
+export function refreshAccessToken() {
+  const refreshToken = getRefreshToken();
+  if (!refreshToken) return Promise.resolve(null);
+
+  // Share one refresh between concurrent callers
+  if (!refreshPromise) {
+    refreshPromise = fetch("/api/auth/refresh", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ refresh_token: refreshToken }),
+    })
+      .then(async (response) => {
+        if (!response.ok) {
+          localStorage.removeItem("auth_token");
+          localStorage.removeItem("refresh_token");
+          return null;
+        }
+        const data = await response.json();
+        saveTokens(data);
+        saveUser(data.user);
+        return data.access_token;
+      })
+      .catch(() => null)
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+}
+
+// Get an access token, refreshing it first if it is about to expire
+export async function getFreshToken() {
+  const token = getToken();
+  if (!token) return null;
+
+  const expiry = getTokenExpiry(token);
+  if (expiry && expiry - Date.now() < 30000 && getRefreshToken()) {
+    return (await refreshAccessToken()) || null;
+  }
+  return token;
+}
+
 // Check if user is signed in
 export function isSignedIn() {
   return !!getToken() && !!getUser();
@@ -34,7 +103,7 @@ export async function signIn(email, password) {
     }
 
     const data = await response.json();
-    saveToken(data.access_token);
+    saveTokens(data);
     saveUser(data.user);
     return data;
   } catch (error) {
@@ -45,7 +114,22 @@ export async function signIn(email, password) {
 
 // Sign out user
 export function signOut() {
+  // Revoke the tokens server-side; keepalive lets it finish during navigation
+  const token = getToken();
+  if (token) {
+    fetch("/api/auth/logout", {
+      method: "POST",
+      keepalive: true,
+      headers: {
+        "Content-Type": "application/json",
+        Authorization: `Bearer ${token}`,
+      },
+      body: JSON.stringify({ refresh_token: getRefreshToken() }),
+    }).catch(() => {});
+  }
+
   localStorage.removeItem("auth_token");
+  localStorage.removeItem("refresh_token");
   localStorage.removeItem("user");
   window.location.href = "/";
 }
@@ -3,6 +3,8 @@
  * Primarily used for auction bidding functionality
  */
 
+import { getFreshToken } from "./auth_utils.js";
+
 // Store active connections
 const activeConnections = new Map();
 
@@ -16,6 +18,7 @@ const activeConnections = new Map();
  * @param {function} options.onError - Handler for connection errors
  * @param {boolean} options.reconnect - Whether to automatically reconnect
  * @param {number} options.reconnectDelay - Delay between reconnection attempts (ms)
+ * @param {function} options.protocols - Returns (or resolves to) the subprotocols to request on each (re)connect
  * @returns {object} - Connection controller with send and close methods
  */
 export function createWebSocketConnection(endpoint, options = {}) {
@@ -26,6 +29,7 @@ export function createWebSocketConnection(endpoint, options = {}) {
     onError = () => {},
     reconnect = true,
     reconnectDelay = 3000,
+    protocols = () => undefined,
   } = options;
 
   // Close existing connection to the same endpoint if it exists
@@ -40,52 +44,60 @@ export function createWebSocketConnection(endpoint, options = {}) {
         location.host
       }${endpoint}`;
 
-  // Create WebSocket
-  let ws = new WebSocket(wsUrl);
+  let ws = null;
+  let closed = false;
   let reconnectAttempts = 0;
   let reconnectTimeout;
 
-  // WebSocket event handlers
-  ws.onopen = (event) => {
-    reconnectAttempts = 0;
-    onOpen(event);
-  };
-
-  ws.onmessage = (event) => {
-    // Try to parse JSON, fallback to raw data if parsing fails
-    try {
-      const data = JSON.parse(event.data);
-      onMessage(data, event);
-    } catch (e) {
-      onMessage(event.data, event);
-    }
-  };
-
-  ws.onclose = (event) => {
-    onClose(event);
-
-    // Remove from active connections
-    activeConnections.delete(endpoint);
-
-    // Attempt to reconnect if enabled
-    if (reconnect && !event.wasClean) {
-      const delay = reconnectDelay * Math.min(reconnectAttempts, 5);
-      reconnectTimeout = setTimeout(() => {
-        reconnectAttempts++;
-        createWebSocketConnection(endpoint, options);
-      }, delay);
-    }
-  };
+  // Open (or reopen) the socket; protocols may be async, e.g. to refresh
+  // an expired access token first
+  const open = async () => {
+    const requested = await protocols();
+    if (closed) return;
+    ws = new WebSocket(wsUrl, requested);
+
+    // WebSocket event handlers
+    ws.onopen = (event) => {
+      reconnectAttempts = 0;
+      onOpen(event);
+    };
+
+    ws.onmessage = (event) => {
+      // Try to parse JSON, fallback to raw data if parsing fails
+      try {
+        const data = JSON.parse(event.data);
+        onMessage(data, event);
+      } catch (e) {
+        onMessage(event.data, event);
+      }
+    };
+
+    ws.onclose = (event) => {
+      onClose(event);
+      if (closed) return;
+
+      // Attempt to reconnect if enabled, on this same controller
+      if (reconnect && !event.wasClean) {
+        const delay = reconnectDelay * Math.min(reconnectAttempts, 5);
+        reconnectTimeout = setTimeout(() => {
+          reconnectAttempts++;
+          open();
+        }, delay);
+      } else {
+        activeConnections.delete(endpoint);
+      }
+    };
 
-  ws.onerror = (error) => {
-    onError(error);
+    ws.onerror = (error) => {
+      onError(error);
+    };
   };
 
   // Create connection controller
   const controller = {
     // Send data through WebSocket (automatically stringifies objects)
     send: (data) => {
-      if (ws.readyState === WebSocket.OPEN) {
+      if (ws && ws.readyState === WebSocket.OPEN) {
         if (typeof data === "object") {
           ws.send(JSON.stringify(data));
         } else {
@@ -98,17 +110,20 @@ export function createWebSocketConnection(endpoint, options = {}) {
 
     // Close the connection
     close: () => {
+      closed = true;
       clearTimeout(reconnectTimeout);
-      ws.close();
+      if (ws) ws.close();
       activeConnections.delete(endpoint);
     },
 
     // Get connection state
     getState: () => {
-      return ws.readyState;
+      return ws ? ws.readyState : WebSocket.CONNECTING;
     },
   };
 
+  open();
+
   // Store in active connections
   activeConnections.set(endpoint, controller);
 
@@ -122,7 +137,15 @@ export function createWebSocketConnection(endpoint, options = {}) {
  * @returns {object} - Connection controller
  */
 export function createProductAuctionConnection(productId, options = {}) {
-  return createWebSocketConnection(`/ws/auction/${productId}`, options);
+  return createWebSocketConnection(`/ws/auction/${productId}`, {
+    // Authenticate the socket once at handshake via the "bearer" subprotocol,
+    // refreshing the access token first so reconnects stay signed in
+    protocols: async () => {
+      const token = await getFreshToken();
+      return token ? ["bearer", token] : undefined;
+    },
+    ...options,
+  });
 }
 
 /**
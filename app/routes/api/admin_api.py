@@ -1,19 +1,27 @@
 from fastapi import APIRouter, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
 from datetime import datetime, timedelta
 from fastapi import Depends
-from ...database import get_db
+from ...database import async_engine, async_read_engine, get_db, pool_stats
 from ...models import OrderStatus, User, UserRole, Product, OrderItem
+from ...services.archive import all_orders, archive_stats
+from ...services.listing_counts import listing_counts
+from ...services.principal_cache import principal_cache
+from ...services.password_hasher import password_hasher
+from ...middleware.db_session import session_stats
+from ...middleware.query_stats import query_monitor
+from ...middleware.rate_limit import rate_limiter
 
 router = APIRouter(prefix="/api/admin")
 
 
 @router.get("/profile")
-async def get_admin_profile(db: Session = Depends(get_db)):
+async def get_admin_profile(db: AsyncSession = Depends(get_db)):
     # In a real application, you would use authentication here
     # For now, we'll just return the first admin from the database
-    admin = db.query(User).filter(User.role == UserRole.ADMIN).first()
+    admin = await db.scalar(
+        select(User).where(User.role == UserRole.ADMIN).limit(1))
 
     if not admin:
         return {"name": "Admin User", "email": "admin@ceylonhandicrafts.com", "role": "Admin"}
@@ -27,43 +35,46 @@ async def get_admin_profile(db: Session = Depends(get_db)):
 
 
 @router.get("/insights")
-async def get_admin_insights(db: Session = Depends(get_db)):
+async def get_admin_insights(db: AsyncSession = Depends(get_db)):
+    # Delivered orders include those moved to the history table
+    orders = all_orders()
+
     # Calculate total sales from DELIVERED orders only
-    delivered_sales = db.query(
-        func.sum(OrderItem.unit_price * OrderItem.quantity)
-    ).filter(
-        OrderItem.status == OrderStatus.DELIVERED
-    ).scalar() or 0
+    delivered_sales = await db.scalar(select(
+        func.sum(orders.c.unit_price * orders.c.quantity)
+    ).where(
+        orders.c.status == OrderStatus.DELIVERED
+    )) or 0
 
     # Calculate total pending sales (orders that are not delivered/denied/failed)
-    pending_sales = db.query(
+    pending_sales = await db.scalar(select(
         func.sum(OrderItem.unit_price * OrderItem.quantity)
-    ).filter(
+    ).where(
         OrderItem.status.in_([
             OrderStatus.INITIATED,
             OrderStatus.PAID,
             OrderStatus.ACCEPTED,
             OrderStatus.DEPARTED
         ])
-    ).scalar() or 0
+    )) or 0
 
     # Count total products
-    total_products = db.query(func.count(Product.id)).scalar() or 0
+    total_products = await db.scalar(select(func.count(Product.id))) or 0
 
     # Count craftsmen
-    total_craftsmen = db.query(
+    total_craftsmen = await db.scalar(select(
         func.count(User.id)
-    ).filter(User.role == UserRole.CRAFTSMAN).scalar() or 0
+    ).where(User.role == UserRole.CRAFTSMAN)) or 0
 
     # Count buyers
-    total_buyers = db.query(
+    total_buyers = await db.scalar(select(
         func.count(User.id)
-    ).filter(User.role == UserRole.BUYER).scalar() or 0
+    ).where(User.role == UserRole.BUYER)) or 0
 
     # Count delivered orders
-    delivered_orders_count = db.query(
-        func.count(OrderItem.id)
-    ).filter(OrderItem.status == OrderStatus.DELIVERED).scalar() or 0
+    delivered_orders_count = await db.scalar(select(
+        func.count(orders.c.id)
+    ).where(orders.c.status == OrderStatus.DELIVERED)) or 0
 
     return {
         "totalSales": float(delivered_sales),
@@ -78,7 +89,7 @@ async def get_admin_insights(db: Session = Depends(get_db)):
 @router.get("/sales")
 async def get_sales_data(
     days: int = Query(5, ge=1, le=30),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Calculate start date
     end_date = datetime.now()
@@ -91,18 +102,20 @@ async def get_sales_data(
         date_series.append(current_date.strftime("%Y-%m-%d"))
         current_date += timedelta(days=1)
 
-    # Query sales data grouped by day
-    sales_data = db.query(
+    # Query sales data grouped by day. func.date is DATE() on SQLite, which
+    # returns text, and a date() cast on Postgres, which returns a date;
+    # both are normalized below.
+    sales_data = (await db.execute(select(
         func.date(OrderItem.created_at).label("date"),
         func.sum(OrderItem.unit_price * OrderItem.quantity).label("total")
-    ).filter(
+    ).where(
         OrderItem.created_at >= start_date,
         OrderItem.created_at <= end_date,
         # Only include DELIVERED orders
         OrderItem.status == OrderStatus.DELIVERED
     ).group_by(
         func.date(OrderItem.created_at)
-    ).all()
+    ))).all()
 
     # Convert to dictionary for easy lookup
     sales_dict = {}
@@ -126,3 +139,21 @@ async def get_sales_data(
         })
 
     return result
+
+
+@router.get("/metrics")
+async def get_runtime_metrics():
+    # In-process counters for this worker
+    return {
+        "principalCache": principal_cache.stats(),
+        "listingCounts": listing_counts.stats(),
+        "passwordHashing": password_hasher.stats(),
+        "rateLimiting": rate_limiter.stats(),
+        "sqlQueries": query_monitor.stats(),
+        "requestSessions": session_stats.stats(),
+        "archive": archive_stats.stats(),
+        "databasePools": {
+            "write": pool_stats(async_engine),
+            "read": pool_stats(async_read_engine)
+        }
+    }
@@ -1,36 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy import desc, select, tuple_, union_all
 from typing import List, Optional
 from datetime import datetime, timedelta
 
 from ...database import get_db
-from ...models import Product, ProductType, Bid, OrderItem, OrderStatus, User
+from ...models import ArchivedBid, ArchivedOrderItem, Product, ProductType, Bid, OrderItem, OrderStatus, User
 from ...config import AUCTION_DURATION  # Import the auction duration constant
+from ...services.product_stats import record_orders
+from ...middleware.auth_middleware import current_user
+from ...services.principal_cache import UserPrincipal
 
 router = APIRouter(prefix="/api/auction-product")
 
 
 @router.get("/{product_id}")
-async def get_auction_product(product_id: str, request: Request, db: Session = Depends(get_db)):
+async def get_auction_product(product_id: str, request: Request, db: AsyncSession = Depends(get_db)):
     """
     Get auction product details by ID, including auction-specific information
     """
     # Check if product exists and is an auction type
-    product = db.query(Product).filter(
+    product = await db.scalar(select(Product).options(
+        selectinload(Product.category),
+        selectinload(Product.craftsman),
+        selectinload(Product.attachments)
+    ).where(
         Product.id == product_id,
         Product.type == ProductType.AUCTION
-    ).first()
+    ))
 
     if not product:
         raise HTTPException(
             status_code=404, detail="Auction product not found")
 
-    # Get the highest bid
-    highest_bid = db.query(Bid).filter(
-        Bid.product_id == product_id
-    ).order_by(desc(Bid.bid_price)).first()
-
     # Get the auction end time
     created_at = product.created_at
     auction_end_time = created_at + timedelta(seconds=AUCTION_DURATION)
@@ -54,7 +57,7 @@ async def get_auction_product(product_id: str, request: Request, db: Session = D
         "auction_duration": AUCTION_DURATION,
         "auction_end_time": auction_end_time.isoformat(),
         "auction_ended": auction_ended,
-        "highest_bid": highest_bid.bid_price if highest_bid else None,
+        "highest_bid": product.highest_bid,
         # Include category if needed
         "category": {
             "id": product.category.id,
@@ -82,24 +85,58 @@ async def get_auction_product(product_id: str, request: Request, db: Session = D
 
 
 @router.get("/{product_id}/bids")
-async def get_auction_bids(product_id: str, request: Request, db: Session = Depends(get_db)):
+async def get_auction_bids(
+    product_id: str,
+    request: Request,
+    before: Optional[str] = Query(
+        None, description="Only bids older than this bid id"),
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
     """
-    Get all bids for an auction product, ordered by bid price (highest first)
+    Get the bids for an auction product, newest first. Each accepted bid
+    beats the one before it, so this is also highest first. Pass the last
+    id of a page as before for the next.
     """
     # Check if product exists and is an auction type
-    product = db.query(Product).filter(
+    product = await db.scalar(select(Product).where(
         Product.id == product_id,
         Product.type == ProductType.AUCTION
-    ).first()
+    ))
 
     if not product:
         raise HTTPException(
             status_code=404, detail="Auction product not found")
 
-    # Query all bids for this product, ordered by bid price (highest first)
-    bids = db.query(Bid).filter(
-        Bid.product_id == product_id
-    ).order_by(desc(Bid.bid_price)).all()
+    # Pages seek past the (created_at, id) of the before bid, which may
+    # have been archived since
+    position = None
+    if before:
+        created_at = await db.scalar(select(Bid.created_at).where(Bid.id == before))
+        if created_at is None:
+            created_at = await db.scalar(
+                select(ArchivedBid.created_at).where(ArchivedBid.id == before))
+        if created_at is None:
+            raise HTTPException(status_code=400, detail="Unknown bid id in before")
+        position = (created_at, before)
+
+    def bid_page(model):
+        query = select(model.id, model.user_id, model.bid_price, model.created_at).where(
+            model.product_id == product_id)
+        if position:
+            query = query.where(tuple_(model.created_at, model.id) < position)
+        return query
+
+    # Bids of ended auctions may have moved to the history table
+    query = bid_page(Bid)
+    auction_end_time = product.created_at + timedelta(seconds=AUCTION_DURATION)
+    if datetime.now() > auction_end_time:
+        query = union_all(query, bid_page(ArchivedBid))
+    query = query.order_by(desc("created_at"), desc("id"))
+    if limit:
+        query = query.limit(limit)
+
+    bids = (await db.execute(query)).all()
 
     # Convert bids to dictionary
     bids_list = [
@@ -115,57 +152,54 @@ async def get_auction_bids(product_id: str, request: Request, db: Session = Depe
 
 
 @router.get("/{product_id}/bidder-status")
-async def check_bidder_status(product_id: str, request: Request, db: Session = Depends(get_db)):
+async def check_bidder_status(
+    product_id: str,
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
+):
     """
     Check if the current user is the highest bidder for this auction
     """
-    # Get current user from the request state (added by middleware)
-    user = request.state.user
-
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
 
     # Check if product exists and is an auction type
-    product = db.query(Product).filter(
+    product = await db.scalar(select(Product).where(
         Product.id == product_id,
         Product.type == ProductType.AUCTION
-    ).first()
+    ))
 
     if not product:
         raise HTTPException(
             status_code=404, detail="Auction product not found")
 
-    # Get the highest bid
-    highest_bid = db.query(Bid).filter(
-        Bid.product_id == product_id
-    ).order_by(desc(Bid.bid_price)).first()
-
     # Check if the current user is the highest bidder
-    is_highest_bidder = highest_bid and highest_bid.user_id == user.id
+    is_highest_bidder = product.highest_bidder_id == user.id
 
     return {
         "is_highest_bidder": is_highest_bidder,
-        "highest_bid": highest_bid.bid_price if highest_bid else None
+        "highest_bid": product.highest_bid
     }
 
 
 @router.post("/{product_id}/create-order")
-async def create_order(product_id: str, request: Request, db: Session = Depends(get_db)):
+async def create_order(
+    product_id: str,
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
+):
     """
     Create an order for the winning bid after an auction has ended
     Only the highest bidder can create an order after the auction has ended
     """
-    # Get current user from the request state (added by middleware)
-    user = request.state.user
-
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
 
     # Check if product exists and is an auction type
-    product = db.query(Product).filter(
+    product = await db.scalar(select(Product).where(
         Product.id == product_id,
         Product.type == ProductType.AUCTION
-    ).first()
+    ))
 
     if not product:
         raise HTTPException(
@@ -179,25 +213,26 @@ async def create_order(product_id: str, request: Request, db: Session = Depends(
         raise HTTPException(
             status_code=400, detail="Auction has not ended yet")
 
-    # Get the highest bid
-    highest_bid = db.query(Bid).filter(
-        Bid.product_id == product_id
-    ).order_by(desc(Bid.bid_price)).first()
-
-    if not highest_bid:
+    if not product.bid_count:
         raise HTTPException(
             status_code=400, detail="No bids found for this auction")
 
     # Check if the current user is the highest bidder
-    if highest_bid.user_id != user.id:
+    if product.highest_bidder_id != user.id:
         raise HTTPException(
             status_code=403, detail="Only the highest bidder can create an order")
 
     # Check if an order already exists for this product and user
-    existing_order = db.query(OrderItem).filter(
+    existing_order = await db.scalar(select(OrderItem).where(
         OrderItem.product_id == product_id,
         OrderItem.user_id == user.id
-    ).first()
+    ).limit(1))
+    if not existing_order:
+        # Long-delivered orders live in the history table
+        existing_order = await db.scalar(select(ArchivedOrderItem).where(
+            ArchivedOrderItem.product_id == product_id,
+            ArchivedOrderItem.user_id == user.id
+        ).limit(1))
 
     if existing_order:
         # Return the existing order
@@ -215,14 +250,15 @@ async def create_order(product_id: str, request: Request, db: Session = Depends(
     new_order = OrderItem(
         product_id=product_id,
         user_id=user.id,
-        unit_price=highest_bid.bid_price,
+        unit_price=product.highest_bid,
         quantity=1,
         status=OrderStatus.INITIATED
     )
 
     db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
+    await record_orders(db, [product_id])
+    await db.commit()
+    await db.refresh(new_order)
 
     # Return the new order
     return {
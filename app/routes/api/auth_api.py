@@ -1,8 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db
+from typing import Optional
+from app.database import get_db, get_sync_db
 from app.models import User, UserRole, UserAddress
-from app.services.auth_service import hash_password, verify_password, create_token
+from app.services.auth_service import issue_tokens, verify_token, revoke_token
+from app.services.password_hasher import password_hasher
+from app.services.principal_cache import principal_cache
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter(prefix="/api/auth")
@@ -29,6 +34,14 @@ class UserCreateRequest(BaseModel):
     role: UserRole
 
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+
 class AddressCreateRequest(BaseModel):
     user_id: str
     country: str
@@ -39,20 +52,28 @@ class AddressCreateRequest(BaseModel):
 
 
 @router.post("/login")
-def login(request: LoginRequest, db: Session = Depends(get_db)):
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_db)):
     # Find user by email
-    user = db.query(User).filter(User.email == request.email).first()
-    if not user or not verify_password(request.password, user.password):
+    user = await db.scalar(select(User).where(User.email == request.email))
+    if not user:
+        raise HTTPException(
+            status_code=401, detail="Invalid email or password")
+
+    # bcrypt runs on the dedicated password hashing pool
+    valid, new_hash = await password_hasher.verify_and_update(
+        request.password, user.password)
+    if not valid:
         raise HTTPException(
             status_code=401, detail="Invalid email or password")
 
-    # Create token
-    token = create_token(user.id)
+    # Transparently upgrade hashes made with an old bcrypt cost
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
 
-    # Return token and user info
+    # Return tokens and user info
     return {
-        "access_token": token,
-        "token_type": "bearer",
+        **issue_tokens(user),
         "user": {
             "id": user.id,
             "name": user.name,
@@ -64,14 +85,15 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
 
 
 @router.post("/signup")
-def signup(request: UserCreateRequest, db: Session = Depends(get_db)):
+async def signup(request: UserCreateRequest, db: AsyncSession = Depends(get_db)):
     # Check if email already exists
-    existing_user = db.query(User).filter(User.email == request.email).first()
+    existing_user = await db.scalar(
+        select(User).where(User.email == request.email))
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Create new user
-    hashed_password = hash_password(request.password)
+    hashed_password = await password_hasher.hash(request.password)
     user = User(
         name=request.name,
         email=request.email,
@@ -81,8 +103,10 @@ def signup(request: UserCreateRequest, db: Session = Depends(get_db)):
     )
 
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+
+    # Make sure no stale principal is served for this user
+    principal_cache.invalidate(user.id)
 
     return {
         "id": user.id,
@@ -94,7 +118,7 @@ def signup(request: UserCreateRequest, db: Session = Depends(get_db)):
 
 
 @router.post("/address")
-def create_address(request: AddressCreateRequest, db: Session = Depends(get_db)):
+def create_address(request: AddressCreateRequest, db: Session = Depends(get_sync_db)):
     # Check if user exists
     user = db.query(User).filter(User.id == request.user_id).first()
     if not user:
@@ -124,12 +148,12 @@ def create_address(request: AddressCreateRequest, db: Session = Depends(get_db))
 
     db.commit()
 
-    # Create token for user
-    token = create_token(user.id)
+    # Drop the cached principal so the next request sees the change
+    principal_cache.invalidate(user.id)
 
+    # Create tokens for user
     return {
-        "access_token": token,
-        "token_type": "bearer",
+        **issue_tokens(user),
         "user": {
             "id": user.id,
             "name": user.name,
@@ -140,6 +164,51 @@ def create_address(request: AddressCreateRequest, db: Session = Depends(get_db))
     }
 
 
+@router.post("/refresh")
+def refresh(request: RefreshRequest, db: Session = Depends(get_sync_db)):
+    payload = verify_token(request.refresh_token, token_type="refresh")
+    if not payload:
+        raise HTTPException(
+            status_code=401, detail="Invalid or expired refresh token")
+
+    # Re-read the user so new claims reflect the current record
+    user = db.query(User).filter(User.id == payload["sub"]).first()
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+
+    # Rotate: the presented refresh token can only be used once
+    revoke_token(payload, db)
+
+    return {
+        **issue_tokens(user),
+        "user": {
+            "id": user.id,
+            "name": user.name,
+            "email": user.email,
+            "phone": user.phone,
+            "role": user.role.value
+        }
+    }
+
+
+@router.post("/logout")
+def logout(request: Request, data: LogoutRequest, db: Session = Depends(get_sync_db)):
+    # Revoke the access token used for this request
+    authorization = request.headers.get("Authorization")
+    if authorization and authorization.startswith("Bearer "):
+        payload = verify_token(authorization.replace("Bearer ", ""))
+        if payload:
+            revoke_token(payload, db)
+
+    # Revoke the refresh token so it cannot mint new access tokens
+    if data.refresh_token:
+        payload = verify_token(data.refresh_token, token_type="refresh")
+        if payload:
+            revoke_token(payload, db)
+
+    return {"message": "Logged out successfully"}
+
+
 @router.get("/me")
 def get_current_user(request: Request):
     user = request.state.user
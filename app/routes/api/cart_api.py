@@ -1,32 +1,37 @@
 # app/routes/api/cart_api.py
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session, joinedload
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from typing import List, Optional
 from datetime import datetime
 
 from app.database import get_db
 from app.models import CartItem, OrderItem, Product, OrderStatus
+from app.services.product_stats import record_orders
+from app.middleware.auth_middleware import current_user
+from app.services.principal_cache import UserPrincipal
 
 router = APIRouter(prefix="/api/cart-page")
 
 
 @router.get("/items")
-async def get_cart_items(request: Request, db: Session = Depends(get_db)):
+async def get_cart_items(
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
+):
     """Get all cart items for the current user"""
-    user = request.state.user
-
     # Query cart items with product and craftsman details
-    cart_items = (
-        db.query(CartItem)
-        .filter(CartItem.user_id == user.id)
+    cart_items = (await db.scalars(
+        select(CartItem)
+        .where(CartItem.user_id == user.id)
         .options(
             joinedload(CartItem.product)
             .joinedload(Product.craftsman),
             joinedload(CartItem.product)
-            .joinedload(Product.attachments)
+            .selectinload(Product.attachments)
         )
-        .all()
-    )
+    )).all()
 
     # Convert to dictionaries (with relationship data)
     result = []
@@ -59,17 +64,17 @@ async def get_cart_items(request: Request, db: Session = Depends(get_db)):
 
 
 @router.post("/checkout")
-async def checkout(request: Request, db: Session = Depends(get_db)):
+async def checkout(
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
+):
     """Convert cart items to orders and clear the cart"""
-    user = request.state.user
-
     # Get all cart items for the user
-    cart_items = (
-        db.query(CartItem)
-        .filter(CartItem.user_id == user.id)
+    cart_items = (await db.scalars(
+        select(CartItem)
+        .where(CartItem.user_id == user.id)
         .options(joinedload(CartItem.product))
-        .all()
-    )
+    )).all()
 
     if not cart_items:
         raise HTTPException(status_code=400, detail="Cart is empty")
@@ -89,12 +94,14 @@ async def checkout(request: Request, db: Session = Depends(get_db)):
         db.add(order_item)
         order_items.append(order_item)
 
+    await record_orders(db, [item.product_id for item in cart_items])
+
     # Remove cart items
     for cart_item in cart_items:
-        db.delete(cart_item)
+        await db.delete(cart_item)
 
     # Commit changes
-    db.commit()
+    await db.commit()
 
     return {"message": "Checkout successful", "order_count": len(order_items)}
 
@@ -102,22 +109,19 @@ async def checkout(request: Request, db: Session = Depends(get_db)):
 @router.patch("/items/{item_id}")
 async def update_cart_item(
     item_id: str,
-    request: Request,
     data: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
 ):
     """Update cart item quantity"""
-    user = request.state.user
-
     # Validate data
     if "quantity" not in data or not isinstance(data["quantity"], int) or data["quantity"] < 1:
         raise HTTPException(status_code=400, detail="Invalid quantity")
 
     # Get cart item
-    cart_item = (
-        db.query(CartItem)
-        .filter(CartItem.id == item_id, CartItem.user_id == user.id)
-        .first()
+    cart_item = await db.scalar(
+        select(CartItem)
+        .where(CartItem.id == item_id, CartItem.user_id == user.id)
     )
 
     if not cart_item:
@@ -128,28 +132,29 @@ async def update_cart_item(
     cart_item.updated_at = datetime.now()
 
     # Commit changes
-    db.commit()
+    await db.commit()
 
     return {"message": "Cart item updated", "id": cart_item.id, "quantity": cart_item.quantity}
 
 
 @router.delete("/items/{item_id}")
-async def delete_cart_item(item_id: str, request: Request, db: Session = Depends(get_db)):
+async def delete_cart_item(
+    item_id: str,
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
+):
     """Remove item from cart"""
-    user = request.state.user
-
     # Get cart item
-    cart_item = (
-        db.query(CartItem)
-        .filter(CartItem.id == item_id, CartItem.user_id == user.id)
-        .first()
+    cart_item = await db.scalar(
+        select(CartItem)
+        .where(CartItem.id == item_id, CartItem.user_id == user.id)
     )
 
     if not cart_item:
         raise HTTPException(status_code=404, detail="Cart item not found")
 
     # Delete cart item
-    db.delete(cart_item)
-    db.commit()
+    await db.delete(cart_item)
+    await db.commit()
 
     return {"message": "Cart item removed", "id": item_id}
@@ -1,8 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, File, UploadFile, Form, Path
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, asc, func
-from ...database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy import desc, asc, func, select
+from ...database import get_db, get_read_db
+from ...middleware.rate_limit import RateLimit
 from ...models import Category, Product, ProductType
+from ...services.product_listing import ListingFilters, page_listings, refresh_category_listings
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any, Union
 import math
@@ -58,6 +61,9 @@ class ProductResponse(BaseModel):
     length: Optional[float] = None
     width: Optional[float] = None
     height: Optional[float] = None
+    # HTML with <mark> around the matched words, on full-text searches
+    title_highlight: Optional[str] = None
+    description_snippet: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -65,17 +71,19 @@ class ProductResponse(BaseModel):
 
 class PaginatedProductsResponse(BaseModel):
     products: List[ProductResponse]
-    totalPages: int
+    totalPages: Optional[int] = None
     currentPage: int
-    totalItems: int
+    totalItems: Optional[int] = None
+    totalIsExact: bool = True
+    nextCursor: Optional[str] = None
 
 
 # ------------------- Public Category Endpoints -------------------
 
 @router.get("", response_model=List[CategoryResponse])
-async def get_all_categories(db: Session = Depends(get_db)):
+async def get_all_categories(db: AsyncSession = Depends(get_read_db)):
     """Get all categories for public display"""
-    categories = db.query(Category).all()
+    categories = (await db.scalars(select(Category))).all()
     return categories
 
 
@@ -83,10 +91,10 @@ async def get_all_categories(db: Session = Depends(get_db)):
 async def get_category_details(
     category_id: str = Path(...,
                             description="The ID of the category to retrieve"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get details for a specific category"""
-    category = db.query(Category).filter(Category.id == category_id).first()
+    category = await db.get(Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     return category
@@ -94,6 +102,48 @@ async def get_category_details(
 
 # ------------------- Products by Category Endpoints -------------------
 
+
+async def listing_page(db: AsyncSession, filters: ListingFilters, sort: Optional[str], page: int,
+                       limit: int, cursor: Optional[str], count: str) -> dict:
+    """Count and fetch one page of a listing, one index range scan"""
+    try:
+        listings = await page_listings(db, filters, sort, limit, page, cursor, count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if listings.total is None:
+        total_pages = None
+    else:
+        total_pages = math.ceil(listings.total / limit) if listings.total > 0 else 1
+
+    return {
+        "products": [
+            {
+                "id": listing.product_id,
+                "title": listing.title,
+                "description": listing.description,
+                "base_price": listing.base_price,
+                "type": listing.type.value,
+                "category_id": listing.category_id,
+                "category_title": listing.category_title,
+                "category_icon": listing.category_icon,
+                "created_at": listing.created_at,
+                "weight": listing.weight,
+                "length": listing.length,
+                "width": listing.width,
+                "height": listing.height,
+                "title_highlight": listings.highlights.get(listing.product_id, {}).get("title"),
+                "description_snippet": listings.highlights.get(
+                    listing.product_id, {}).get("description")
+            } for listing in listings.listings
+        ],
+        "totalPages": total_pages,
+        "currentPage": page,
+        "totalItems": listings.total,
+        "totalIsExact": listings.exact,
+        "nextCursor": listings.next_cursor
+    }
+
+
 @router.get("/{category_id}/products", response_model=PaginatedProductsResponse)
 async def get_products_by_category(
     category_id: str = Path(...,
@@ -108,205 +158,77 @@ async def get_products_by_category(
         None, ge=0, description="Minimum price filter"),
     max_price: Optional[float] = Query(
         None, ge=0, description="Maximum price filter"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(
+        None, description="nextCursor of the previous page; replaces page"),
+    count: str = Query(
+        "exact", regex="^(exact|estimate|none)$", description="How to total the matches"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get products for a specific category with pagination, sorting and filters"""
 
     # Check if category exists
-    category = db.query(Category).filter(Category.id == category_id).first()
+    category = await db.get(Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
 
-    # Build the base query
-    query = db.query(Product).filter(Product.category_id == category_id)
+    # Look the enum up by name ("sale" -> SALE); the column stores names.
+    # If invalid product type, just ignore the filter
+    product_type_enum = ProductType.__members__.get(
+        product_type.upper()) if product_type else None
 
-    # Apply product type filter if specified
-    if product_type:
-        try:
-            product_type_enum = ProductType(product_type.upper())
-            query = query.filter(Product.type == product_type_enum)
-        except ValueError:
-            # If invalid product type, just ignore the filter
-            pass
-
-    # Apply price filters if specified
-    if min_price is not None:
-        query = query.filter(Product.base_price >= min_price)
-    if max_price is not None:
-        query = query.filter(Product.base_price <= max_price)
-
-    # Apply sorting
-    if sort == "newest":
-        query = query.order_by(desc(Product.created_at))
-    elif sort == "price_low":
-        query = query.order_by(asc(Product.base_price))
-    elif sort == "price_high":
-        query = query.order_by(desc(Product.base_price))
-    elif sort == "popular":
-        # If you have a popularity metric (e.g., order count), use it here
-        # For now, we'll default to newest
-        query = query.order_by(desc(Product.created_at))
-
-    # Count total items
-    total_items = query.count()
-    total_pages = math.ceil(total_items / limit) if total_items > 0 else 1
-
-    # Apply pagination
-    products = query.offset((page - 1) * limit).limit(limit).all()
-
-    # Add category information to each product
-    for product in products:
-        product.category_title = category.title
-        product.category_icon = category.icon
-
-    return {
-        "products": products,
-        "totalPages": total_pages,
-        "currentPage": page,
-        "totalItems": total_items
-    }
+    filters = ListingFilters(product_type_enum, category_id, None, min_price, max_price)
+    return await listing_page(db, filters, sort, page, limit, cursor, count)
 
 
-@router.get("/products/sale", response_model=PaginatedProductsResponse)
+@router.get("/products/sale", response_model=PaginatedProductsResponse,
+            dependencies=[Depends(RateLimit(
+                "product_search", only_with_param="search", cursor_rule="product_search_page"))])
 async def get_sale_products_across_categories(
     page: int = Query(1, ge=1),
     limit: int = Query(12, ge=1, le=100),
-    sort: str = Query(
-        "newest", regex="^(newest|price_low|price_high|popular)$"),
+    sort: Optional[str] = Query(
+        None, regex="^(relevance|newest|price_low|price_high|popular)$"),
     category_id: Optional[str] = Query(None),
     search: Optional[str] = Query(None),
     min_price: Optional[float] = Query(None, ge=0),
     max_price: Optional[float] = Query(None, ge=0),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None),
+    count: str = Query("exact", regex="^(exact|estimate|none)$"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get sale products across all categories with pagination, sorting and filters"""
+    filters = ListingFilters(ProductType.SALE, category_id, search, min_price, max_price)
+    return await listing_page(db, filters, sort, page, limit, cursor, count)
 
-    # Build the base query for sale products
-    query = db.query(Product).filter(Product.type == ProductType.SALE)
-
-    # Apply category filter if specified
-    if category_id:
-        query = query.filter(Product.category_id == category_id)
-
-    # Apply search filter if specified
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            func.lower(Product.title).like(func.lower(search_term)) |
-            func.lower(Product.description).like(func.lower(search_term))
-        )
 
-    # Apply price filters if specified
-    if min_price is not None:
-        query = query.filter(Product.base_price >= min_price)
-    if max_price is not None:
-        query = query.filter(Product.base_price <= max_price)
-
-    # Apply sorting
-    if sort == "newest":
-        query = query.order_by(desc(Product.created_at))
-    elif sort == "price_low":
-        query = query.order_by(asc(Product.base_price))
-    elif sort == "price_high":
-        query = query.order_by(desc(Product.base_price))
-    elif sort == "popular":
-        # Default to newest for now
-        query = query.order_by(desc(Product.created_at))
-
-    # Count total items
-    total_items = query.count()
-    total_pages = math.ceil(total_items / limit) if total_items > 0 else 1
-
-    # Apply pagination
-    products = query.offset((page - 1) * limit).limit(limit).all()
-
-    # Add category information to each product
-    for product in products:
-        if product.category:
-            product.category_title = product.category.title
-            product.category_icon = product.category.icon
-
-    return {
-        "products": products,
-        "totalPages": total_pages,
-        "currentPage": page,
-        "totalItems": total_items
-    }
-
-
-@router.get("/products/auction", response_model=PaginatedProductsResponse)
+@router.get("/products/auction", response_model=PaginatedProductsResponse,
+            dependencies=[Depends(RateLimit(
+                "product_search", only_with_param="search", cursor_rule="product_search_page"))])
 async def get_auction_products_across_categories(
     page: int = Query(1, ge=1),
     limit: int = Query(12, ge=1, le=100),
-    sort: str = Query(
-        "newest", regex="^(newest|price_low|price_high|popular)$"),
+    sort: Optional[str] = Query(
+        None, regex="^(relevance|newest|price_low|price_high|popular)$"),
     category_id: Optional[str] = Query(None),
     search: Optional[str] = Query(None),
     min_price: Optional[float] = Query(None, ge=0),
     max_price: Optional[float] = Query(None, ge=0),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None),
+    count: str = Query("exact", regex="^(exact|estimate|none)$"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get auction products across all categories with pagination, sorting and filters"""
-
-    # Build the base query for auction products
-    query = db.query(Product).filter(Product.type == ProductType.AUCTION)
-
-    # Apply category filter if specified
-    if category_id:
-        query = query.filter(Product.category_id == category_id)
-
-    # Apply search filter if specified
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            func.lower(Product.title).like(func.lower(search_term)) |
-            func.lower(Product.description).like(func.lower(search_term))
-        )
-
-    # Apply price filters if specified
-    if min_price is not None:
-        query = query.filter(Product.base_price >= min_price)
-    if max_price is not None:
-        query = query.filter(Product.base_price <= max_price)
-
-    # Apply sorting
-    if sort == "newest":
-        query = query.order_by(desc(Product.created_at))
-    elif sort == "price_low":
-        query = query.order_by(asc(Product.base_price))
-    elif sort == "price_high":
-        query = query.order_by(desc(Product.base_price))
-    elif sort == "popular":
-        # Default to newest for now
-        query = query.order_by(desc(Product.created_at))
-
-    # Count total items
-    total_items = query.count()
-    total_pages = math.ceil(total_items / limit) if total_items > 0 else 1
-
-    # Apply pagination
-    products = query.offset((page - 1) * limit).limit(limit).all()
-
-    # Add category information to each product
-    for product in products:
-        if product.category:
-            product.category_title = product.category.title
-            product.category_icon = product.category.icon
-
-    return {
-        "products": products,
-        "totalPages": total_pages,
-        "currentPage": page,
-        "totalItems": total_items
-    }
+    filters = ListingFilters(ProductType.AUCTION, category_id, search, min_price, max_price)
+    return await listing_page(db, filters, sort, page, limit, cursor, count)
 
 
 # ------------------- Admin Category Endpoints -------------------
+# These read the primary so admins see their own changes immediately
 
 @router.get("/admin", response_model=List[CategoryResponse])
-async def admin_get_categories(db: Session = Depends(get_db)):
+async def admin_get_categories(db: AsyncSession = Depends(get_db)):
     """Admin endpoint to get all categories"""
-    categories = db.query(Category).all()
+    categories = (await db.scalars(select(Category))).all()
     return categories
 
 
@@ -314,10 +236,10 @@ async def admin_get_categories(db: Session = Depends(get_db)):
 async def admin_get_category(
     category_id: str = Path(...,
                             description="The ID of the category to retrieve"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Admin endpoint to get details for a specific category"""
-    category = db.query(Category).filter(Category.id == category_id).first()
+    category = await db.get(Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     return category
@@ -326,13 +248,13 @@ async def admin_get_category(
 @router.post("/admin", response_model=CategoryResponse)
 async def create_category(
     category: CategoryCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Admin endpoint to create a new category"""
     db_category = Category(**category.dict())
     db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
+    await db.commit()
+    await db.refresh(db_category)
     return db_category
 
 
@@ -341,10 +263,10 @@ async def update_category(
     category_id: str = Path(...,
                             description="The ID of the category to update"),
     category_update: CategoryUpdate = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Admin endpoint to update a category"""
-    db_category = db.query(Category).filter(Category.id == category_id).first()
+    db_category = await db.get(Category, category_id)
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
 
@@ -352,8 +274,10 @@ async def update_category(
     for key, value in update_data.items():
         setattr(db_category, key, value)
 
-    db.commit()
-    db.refresh(db_category)
+    # Listing rows carry the category title and icon
+    await refresh_category_listings(db, category_id)
+    await db.commit()
+    await db.refresh(db_category)
     return db_category
 
 
@@ -361,16 +285,16 @@ async def update_category(
 async def delete_category(
     category_id: str = Path(...,
                             description="The ID of the category to delete"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Admin endpoint to delete a category"""
-    db_category = db.query(Category).filter(Category.id == category_id).first()
+    db_category = await db.get(Category, category_id)
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
 
     # Check if the category has products
-    product_count = db.query(Product).filter(
-        Product.category_id == category_id).count()
+    product_count = await db.scalar(select(func.count(Product.id)).where(
+        Product.category_id == category_id))
     if product_count > 0:
         raise HTTPException(
             status_code=400,
@@ -393,8 +317,8 @@ async def delete_category(
             print(f"Error deleting image file: {str(e)}")
 
     # Delete the category from the database
-    db.delete(db_category)
-    db.commit()
+    await db.delete(db_category)
+    await db.commit()
 
     return {"message": "Category deleted successfully"}
 
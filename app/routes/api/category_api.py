@@ -1,8 +1,10 @@
 # app/routes/api/category_api.py
 from fastapi import APIRouter, Depends, HTTPException, Query, Body, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ...database import get_db
 from ...models import Category
+from ...services.product_listing import refresh_category_listings
 from pydantic import BaseModel
 from typing import Optional, List
 import os
@@ -40,25 +42,25 @@ class CategoryResponse(CategoryBase):
 
 
 @router.get("", response_model=List[CategoryResponse])
-async def get_categories(db: Session = Depends(get_db)):
-    categories = db.query(Category).all()
+async def get_categories(db: AsyncSession = Depends(get_db)):
+    categories = (await db.scalars(select(Category))).all()
     return categories
 
 
 @router.get("/{category_id}", response_model=CategoryResponse)
-async def get_category(category_id: str, db: Session = Depends(get_db)):
-    category = db.query(Category).filter(Category.id == category_id).first()
+async def get_category(category_id: str, db: AsyncSession = Depends(get_db)):
+    category = await db.get(Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     return category
 
 
 @router.post("", response_model=CategoryResponse)
-async def create_category(category: CategoryCreate, db: Session = Depends(get_db)):
+async def create_category(category: CategoryCreate, db: AsyncSession = Depends(get_db)):
     db_category = Category(**category.dict())
     db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
+    await db.commit()
+    await db.refresh(db_category)
     return db_category
 
 
@@ -66,9 +68,9 @@ async def create_category(category: CategoryCreate, db: Session = Depends(get_db
 async def update_category(
     category_id: str,
     category_update: CategoryUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    db_category = db.query(Category).filter(Category.id == category_id).first()
+    db_category = await db.get(Category, category_id)
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
 
@@ -76,14 +78,16 @@ async def update_category(
     for key, value in update_data.items():
         setattr(db_category, key, value)
 
-    db.commit()
-    db.refresh(db_category)
+    # Listing rows carry the category title and icon
+    await refresh_category_listings(db, category_id)
+    await db.commit()
+    await db.refresh(db_category)
     return db_category
 
 
 @router.delete("/{category_id}")
-async def delete_category(category_id: str, db: Session = Depends(get_db)):
-    db_category = db.query(Category).filter(Category.id == category_id).first()
+async def delete_category(category_id: str, db: AsyncSession = Depends(get_db)):
+    db_category = await db.get(Category, category_id)
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
 
@@ -103,8 +107,8 @@ async def delete_category(category_id: str, db: Session = Depends(get_db)):
             print(f"Error deleting image file: {str(e)}")
 
     # Delete the category from the database
-    db.delete(db_category)
-    db.commit()
+    await db.delete(db_category)
+    await db.commit()
 
     return {"message": "Category deleted successfully"}
 
@@ -1,30 +1,34 @@
 # app/routes/api/checkout_api.py
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session, joinedload
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 
 from app.database import get_db
 from app.models import OrderItem, Product, OrderStatus
+from app.middleware.auth_middleware import current_user
+from app.services.principal_cache import UserPrincipal
 
 router = APIRouter(prefix="/api/checkout-page")
 
 
 @router.get("/summary")
-async def get_checkout_summary(request: Request, db: Session = Depends(get_db)):
+async def get_checkout_summary(
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
+):
     """Get order summary for checkout page"""
-    user = request.state.user
-
     # Get the user's orders with INITIATED status
-    orders = (
-        db.query(OrderItem)
-        .filter(OrderItem.user_id == user.id, OrderItem.status == OrderStatus.INITIATED)
+    orders = (await db.scalars(
+        select(OrderItem)
+        .where(OrderItem.user_id == user.id, OrderItem.status == OrderStatus.INITIATED)
         .options(
             joinedload(OrderItem.product)
             .joinedload(Product.craftsman)
         )
-        .all()
-    )
+    )).all()
 
     # Convert to dictionaries (with relationship data)
     result = {"orders": []}
@@ -56,19 +60,16 @@ async def get_checkout_summary(request: Request, db: Session = Depends(get_db)):
 
 @router.post("/process-payment")
 async def process_payment(
-    request: Request,
     payment_data: Dict[str, Any],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
 ):
     """Process payment and update order status"""
-    user = request.state.user
-
     # Get the user's orders with INITIATED status
-    orders = (
-        db.query(OrderItem)
-        .filter(OrderItem.user_id == user.id, OrderItem.status == OrderStatus.INITIATED)
-        .all()
-    )
+    orders = (await db.scalars(
+        select(OrderItem)
+        .where(OrderItem.user_id == user.id, OrderItem.status == OrderStatus.INITIATED)
+    )).all()
 
     if not orders:
         raise HTTPException(status_code=400, detail="No orders to process")
@@ -82,6 +83,6 @@ async def process_payment(
         order.updated_at = datetime.now()
 
     # Commit changes
-    db.commit()
+    await db.commit()
 
     return {"message": "Payment processed successfully", "order_count": len(orders)}
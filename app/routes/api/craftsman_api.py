@@ -1,43 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Query
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from ...database import get_db
 from ...models import OrderItem, Product, User, UserRole, OrderStatus
+from ...services.archive import all_orders
+from ...middleware.auth_middleware import current_user
+from ...services.principal_cache import UserPrincipal
 from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/api/craftsman")
 
+# Orders that count as pending sales
+PENDING_STATUSES = (
+    OrderStatus.INITIATED,
+    OrderStatus.PAID,
+    OrderStatus.ACCEPTED,
+    OrderStatus.DEPARTED
+)
+
 
 @router.get("/dashboard")
 async def get_craftsman_dashboard(
-    request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
 ):
     # Ensure user is authenticated and is a craftsman
-    if not request.state.user:
+    if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    if request.state.user.role.value != "Craftsman":
+    if user.role.value != "Craftsman":
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    craftsman_id = request.state.user.id
+    craftsman_id = user.id
+
+    # Delivered orders include those moved to the history table
+    orders = all_orders()
 
     # Get total completed sales
-    total_completed_sales = db.query(
-        func.sum(OrderItem.unit_price * OrderItem.quantity)
+    total_completed_sales = await db.scalar(select(
+        func.sum(orders.c.unit_price * orders.c.quantity)
     ).join(
-        Product, OrderItem.product_id == Product.id
-    ).filter(
+        Product, orders.c.product_id == Product.id
+    ).where(
         Product.user_id == craftsman_id,
-        OrderItem.status == OrderStatus.DELIVERED
-    ).scalar() or 0
+        orders.c.status == OrderStatus.DELIVERED
+    )) or 0
 
     # Get total pending sales
-    total_pending_sales = db.query(
+    total_pending_sales = await db.scalar(select(
         func.sum(OrderItem.unit_price * OrderItem.quantity)
     ).join(
         Product, OrderItem.product_id == Product.id
-    ).filter(
+    ).where(
         Product.user_id == craftsman_id,
         OrderItem.status.in_([
             OrderStatus.INITIATED,
@@ -45,29 +61,29 @@ async def get_craftsman_dashboard(
             OrderStatus.ACCEPTED,
             OrderStatus.DEPARTED
         ])
-    ).scalar() or 0
+    )) or 0
 
     # Get total products
-    total_products = db.query(func.count(Product.id)).filter(
+    total_products = await db.scalar(select(func.count(Product.id)).where(
         Product.user_id == craftsman_id
-    ).scalar() or 0
+    )) or 0
 
     # Get delivered orders count
-    delivered_orders_count = db.query(
-        func.count(OrderItem.id)
+    delivered_orders_count = await db.scalar(select(
+        func.count(orders.c.id)
     ).join(
-        Product, OrderItem.product_id == Product.id
-    ).filter(
+        Product, orders.c.product_id == Product.id
+    ).where(
         Product.user_id == craftsman_id,
-        OrderItem.status == OrderStatus.DELIVERED
-    ).scalar() or 0
+        orders.c.status == OrderStatus.DELIVERED
+    )) or 0
 
     # Get pending orders count
-    pending_orders_count = db.query(
+    pending_orders_count = await db.scalar(select(
         func.count(OrderItem.id)
     ).join(
         Product, OrderItem.product_id == Product.id
-    ).filter(
+    ).where(
         Product.user_id == craftsman_id,
         OrderItem.status.in_([
             OrderStatus.INITIATED,
@@ -75,7 +91,7 @@ async def get_craftsman_dashboard(
             OrderStatus.ACCEPTED,
             OrderStatus.DEPARTED
         ])
-    ).scalar() or 0
+    )) or 0
 
     return {
         "totalCompletedSales": float(total_completed_sales),
@@ -88,17 +104,17 @@ async def get_craftsman_dashboard(
 
 @router.get("/weekly-sales")
 async def get_craftsman_weekly_sales(
-    request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
 ):
     # Ensure user is authenticated and is a craftsman
-    if not request.state.user:
+    if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    if request.state.user.role.value != "Craftsman":
+    if user.role.value != "Craftsman":
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    craftsman_id = request.state.user.id
+    craftsman_id = user.id
 
     # Get dates for last 7 days
     end_date = datetime.now()
@@ -111,48 +127,33 @@ async def get_craftsman_weekly_sales(
         dates.append(current_date.strftime("%Y-%m-%d"))
         current_date += timedelta(days=1)
 
-    # Get completed sales for each day
-    completed_sales = []
-    for date_str in dates:
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        next_day = date_obj + timedelta(days=1)
-
-        daily_sales = db.query(
-            func.sum(OrderItem.unit_price * OrderItem.quantity)
-        ).join(
-            Product, OrderItem.product_id == Product.id
-        ).filter(
-            Product.user_id == craftsman_id,
-            OrderItem.created_at >= date_obj,
-            OrderItem.created_at < next_day,
-            OrderItem.status == OrderStatus.DELIVERED
-        ).scalar() or 0
-
-        completed_sales.append(float(daily_sales))
-
-    # Get pending sales for each day
-    pending_sales = []
-    for date_str in dates:
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        next_day = date_obj + timedelta(days=1)
-
-        daily_pending = db.query(
-            func.sum(OrderItem.unit_price * OrderItem.quantity)
-        ).join(
-            Product, OrderItem.product_id == Product.id
-        ).filter(
-            Product.user_id == craftsman_id,
-            OrderItem.created_at >= date_obj,
-            OrderItem.created_at < next_day,
-            OrderItem.status.in_([
-                OrderStatus.INITIATED,
-                OrderStatus.PAID,
-                OrderStatus.ACCEPTED,
-                OrderStatus.DEPARTED
-            ])
-        ).scalar() or 0
-
-        pending_sales.append(float(daily_pending))
+    # One grouped query for the whole week. func.date is DATE() on SQLite,
+    # which returns text, and a date() cast on Postgres, which returns a
+    # date; both are normalized below.
+    day = func.date(OrderItem.created_at)
+    rows = (await db.execute(select(
+        day.label("day"),
+        OrderItem.status,
+        func.sum(OrderItem.unit_price * OrderItem.quantity).label("total")
+    ).join(
+        Product, OrderItem.product_id == Product.id
+    ).where(
+        Product.user_id == craftsman_id,
+        OrderItem.created_at >= datetime.strptime(dates[0], "%Y-%m-%d"),
+        OrderItem.created_at < datetime.strptime(dates[-1], "%Y-%m-%d") + timedelta(days=1),
+        OrderItem.status.in_([OrderStatus.DELIVERED, *PENDING_STATUSES])
+    ).group_by(day, OrderItem.status))).all()
+
+    completed = dict.fromkeys(dates, 0.0)
+    pending = dict.fromkeys(dates, 0.0)
+    for row in rows:
+        date_key = row.day if isinstance(row.day, str) else row.day.strftime("%Y-%m-%d")
+        totals = completed if row.status == OrderStatus.DELIVERED else pending
+        if date_key in totals:
+            totals[date_key] += float(row.total or 0)
+
+    completed_sales = [completed[date] for date in dates]
+    pending_sales = [pending[date] for date in dates]
 
     # Format day labels
     day_labels = [(datetime.strptime(date, "%Y-%m-%d")).strftime("%a")
@@ -167,29 +168,30 @@ async def get_craftsman_weekly_sales(
 
 @router.get("/orders-by-status")
 async def get_craftsman_orders_by_status(
-    request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
 ):
     # Ensure user is authenticated and is a craftsman
-    if not request.state.user:
+    if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    if request.state.user.role.value != "Craftsman":
+    if user.role.value != "Craftsman":
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    craftsman_id = request.state.user.id
+    craftsman_id = user.id
 
-    # Query to count orders by status
-    status_counts = db.query(
-        OrderItem.status,
-        func.count(OrderItem.id).label('count')
+    # Query to count orders by status, archived ones included
+    orders = all_orders()
+    status_counts = (await db.execute(select(
+        orders.c.status,
+        func.count(orders.c.id).label('count')
     ).join(
-        Product, OrderItem.product_id == Product.id
-    ).filter(
+        Product, orders.c.product_id == Product.id
+    ).where(
         Product.user_id == craftsman_id
     ).group_by(
-        OrderItem.status
-    ).all()
+        orders.c.status
+    ))).all()
 
     # Convert to dictionary
     result = {}
@@ -212,27 +214,30 @@ async def get_craftsman_orders_by_status(
 
 @router.get("/recent-orders")
 async def get_craftsman_recent_orders(
-    request: Request,
     limit: int = Query(5, ge=1, le=20),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
 ):
     # Ensure user is authenticated and is a craftsman
-    if not request.state.user:
+    if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    if request.state.user.role.value != "Craftsman":
+    if user.role.value != "Craftsman":
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    craftsman_id = request.state.user.id
+    craftsman_id = user.id
 
     # Get recent orders
-    recent_orders = db.query(OrderItem).join(
+    recent_orders = (await db.scalars(select(OrderItem).options(
+        joinedload(OrderItem.product),
+        joinedload(OrderItem.user)
+    ).join(
         Product, OrderItem.product_id == Product.id
-    ).filter(
+    ).where(
         Product.user_id == craftsman_id
     ).order_by(
         OrderItem.created_at.desc()
-    ).limit(limit).all()
+    ).limit(limit))).all()
 
     # Format for response
     orders_data = []
@@ -1,18 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Query
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
 from typing import List, Optional
 from enum import Enum
 
 from ...database import get_db
-from ...models import OrderItem, OrderStatus, UserRole, User, Product
+from ...models import ArchivedOrderItem, OrderItem, OrderStatus, UserRole, User, Product
+from ...middleware.auth_middleware import current_user
+from ...services.principal_cache import UserPrincipal
 
 router = APIRouter(prefix="/api/craftsman")
 
-# Helper function to verify craftsman role
+# Orders in these states can be in the history table
+ARCHIVED_STATUSES = (OrderStatus.DELIVERED, OrderStatus.DENIED)
 
 
-def verify_craftsman(request):
-    user = request.state.user
+def order_load_options(model):
+    """Relationships serialized with each order (hot or archived)"""
+    return (
+        joinedload(model.product).joinedload(Product.category),
+        joinedload(model.product).selectinload(Product.attachments),
+        joinedload(model.user).joinedload(User.address)
+    )
+
+
+# Dependency verifying the craftsman role
+
+
+async def verify_craftsman(user: Optional[UserPrincipal] = Depends(current_user)) -> UserPrincipal:
     if not user or user.role != UserRole.CRAFTSMAN:
         raise HTTPException(
             status_code=403,
@@ -25,34 +41,25 @@ def verify_craftsman(request):
 
 @router.get("/orders")
 async def get_craftsman_orders(
-    request: Request,
     status: Optional[str] = None,
-    db: Session = Depends(get_db)
+    before: Optional[str] = Query(
+        None, description="Only orders older than this order id"),
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    user: UserPrincipal = Depends(verify_craftsman)
 ):
-    # Verify the user is a craftsman
-    user = verify_craftsman(request)
-
-    # Create base query with joins for all needed relationships
-    query = (
-        db.query(OrderItem)
-        .join(Product, OrderItem.product_id == Product.id)
-        .options(
-            joinedload(OrderItem.product).joinedload(Product.category),
-            joinedload(OrderItem.product).joinedload(Product.attachments),
-            joinedload(OrderItem.user).joinedload(User.address)
-        )
-        # Only orders for this craftsman's products
-        .filter(Product.user_id == user.id)
-    )
-
+    """
+    Orders for the craftsman's products, newest first. Pass the last id of
+    a page as before for the next.
+    """
     # Apply status filter if provided
+    order_status = None
     if status:
         try:
             # Get the enum by name (uppercase) instead of by value
             # This handles the difference between enum names (PAID) and values ("Paid")
             if hasattr(OrderStatus, status):
                 order_status = getattr(OrderStatus, status)
-                query = query.filter(OrderItem.status == order_status)
             else:
                 raise ValueError(f"Status {status} not found")
         except ValueError:
@@ -62,8 +69,46 @@ async def get_craftsman_orders(
                 detail=f"Invalid status. Valid statuses are: {valid_statuses}"
             )
 
+    # Pages seek past the (created_at, id) of the before order, which may
+    # have been archived since
+    position = None
+    if before:
+        created_at = await db.scalar(select(OrderItem.created_at).where(OrderItem.id == before))
+        if created_at is None:
+            created_at = await db.scalar(
+                select(ArchivedOrderItem.created_at).where(ArchivedOrderItem.id == before))
+        if created_at is None:
+            raise HTTPException(status_code=400, detail="Unknown order id in before")
+        position = (created_at, before)
+
+    def order_page(model):
+        # Create base query with joins for all needed relationships
+        query = (
+            select(model)
+            .join(Product, model.product_id == Product.id)
+            .options(*order_load_options(model))
+            # Only orders for this craftsman's products
+            .where(Product.user_id == user.id)
+        )
+        if order_status:
+            query = query.where(model.status == order_status)
+        if position:
+            query = query.where(tuple_(model.created_at, model.id) < position)
+        query = query.order_by(model.created_at.desc(), model.id.desc())
+        if limit:
+            query = query.limit(limit)
+        return query
+
     # Execute query
-    orders = query.all()
+    orders = (await db.scalars(order_page(OrderItem))).all()
+
+    # Closed orders may have moved to the history table; merge the two
+    # pages by (created_at, id)
+    if order_status is None or order_status in ARCHIVED_STATUSES:
+        archived = (await db.scalars(order_page(ArchivedOrderItem))).all()
+        if archived:
+            orders = sorted([*orders, *archived], key=lambda order: (order.created_at, order.id),
+                            reverse=True)[:limit]
 
     # Convert to dict for JSON response
     result = []
@@ -79,7 +124,7 @@ async def get_craftsman_orders(
                 "title": order.product.category.title
             } if order.product and order.product.category else None,
             "attachments": [
-                {"id": att.id, "url": att.url, "type": att.type.value}
+                {"id": att.id, "url": att.url, "type": att.type}
                 for att in order.product.attachments
             ] if order.product and order.product.attachments else []
         } if order.product else None
@@ -121,13 +166,10 @@ async def get_craftsman_orders(
 @router.patch("/orders/{order_id}")
 async def update_order_status(
     order_id: str,
-    request: Request,
     status_update: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: UserPrincipal = Depends(verify_craftsman)
 ):
-    # Verify the user is a craftsman
-    user = verify_craftsman(request)
-
     # Validate the status update data
     if "status" not in status_update:
         raise HTTPException(
@@ -151,16 +193,11 @@ async def update_order_status(
         )
 
     # Find the order
-    order = (
-        db.query(OrderItem)
+    order = await db.scalar(
+        select(OrderItem)
         .join(Product, OrderItem.product_id == Product.id)
-        .options(
-            joinedload(OrderItem.product).joinedload(Product.category),
-            joinedload(OrderItem.product).joinedload(Product.attachments),
-            joinedload(OrderItem.user).joinedload(User.address)
-        )
-        .filter(OrderItem.id == order_id, Product.user_id == user.id)
-        .first()
+        .options(*order_load_options(OrderItem))
+        .where(OrderItem.id == order_id, Product.user_id == user.id)
     )
 
     if not order:
@@ -189,8 +226,7 @@ async def update_order_status(
 
     # Update the order status
     order.status = new_status
-    db.commit()
-    db.refresh(order)
+    await db.commit()
 
     # Return updated order data
     # Safe access to product and category
@@ -204,7 +240,7 @@ async def update_order_status(
             "title": order.product.category.title
         } if order.product and order.product.category else None,
         "attachments": [
-            {"id": att.id, "url": att.url, "type": att.type.value}
+            {"id": att.id, "url": att.url, "type": att.type}
             for att in order.product.attachments
         ] if order.product and order.product.attachments else []
     } if order.product else None
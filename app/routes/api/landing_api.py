@@ -1,14 +1,17 @@
 # app/routes/api/landing_api.py
 from typing import List, Optional
-from fastapi import APIRouter, Depends, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, ConfigDict
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
-import os
-from pathlib import Path
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import func, select
 
-from ...database import get_db
-from ...models import Bid, CartItem, Product, ProductType, Rating, Category
+from ...config import PRODUCT_IMAGES_BATCH_MAX
+from ...database import get_db, get_read_db
+from ...models import CartItem, Product, ProductType, Rating, Category
+from ...services.product_images import images_by_product
+from ...middleware.auth_middleware import current_user
+from ...services.principal_cache import UserPrincipal
 
 
 class CategoryResponse(BaseModel):
@@ -38,21 +41,27 @@ router = APIRouter(prefix="/api/landing")
 
 
 @router.get("/categories", response_model=List[CategoryResponse])
-async def get_categories(db: Session = Depends(get_db)):
+async def get_categories(db: AsyncSession = Depends(get_read_db)):
     """Get all categories for display on the landing page"""
-    categories = db.query(Category).all()
+    categories = (await db.scalars(select(Category))).all()
     return categories
 
 
 @router.get("/cart/count")
-async def get_cart_count(request: Request, db: Session = Depends(get_db)):
+async def get_cart_count(
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
+):
     """Get the number of items in the user's cart"""
-    if not request.state.user:
+    if not user:
         return {"count": 0}
 
-    cart_count = db.query(func.sum(CartItem.quantity)).filter(
-        CartItem.user_id == request.state.user.id
-    ).scalar() or 0
+    # Read from the primary, not the read pool: the badge must include the
+    # item that was just added
+
+    cart_count = await db.scalar(select(func.sum(CartItem.quantity)).where(
+        CartItem.user_id == user.id
+    )) or 0
 
     return {"count": cart_count}
 
@@ -60,18 +69,23 @@ async def get_cart_count(request: Request, db: Session = Depends(get_db)):
 @router.get("/featured/sale", response_model=List[ProductResponse])
 async def get_featured_sale_products(
     limit: int = Query(8, description="Number of products to return"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get featured products for sale (non-auction).
     Returns products sorted by rating and recency.
     """
     # Query for featured sale products - sort by recency
-    featured_products = db.query(Product).filter(
+    featured_products = (await db.scalars(select(Product).options(
+        joinedload(Product.category)
+    ).where(
         Product.type == ProductType.SALE
     ).order_by(
         Product.created_at.desc()  # Most recent first
-    ).limit(limit).all()
+    ).limit(limit))).all()
+
+    # Every product's images in one query
+    images = await images_by_product(db, [product.id for product in featured_products])
 
     # Prepare response data with image paths and categories
     result = []
@@ -81,14 +95,14 @@ async def get_featured_sale_products(
         category_data = CategoryResponse.from_orm(
             category) if category else None
 
-        # Create product data with image paths - these will be populated by frontend
+        # Create product data with image paths
         product_data = ProductResponse(
             id=product.id,
             title=product.title,
             base_price=product.base_price,
             type=product.type.value,
             category_id=product.category_id,
-            image_paths=[],  # Empty list - will be fetched by frontend
+            image_paths=images.get(product.id, []),
             category=category_data
         )
         result.append(product_data)
@@ -99,41 +113,41 @@ async def get_featured_sale_products(
 @router.get("/featured/auction", response_model=List[ProductResponse])
 async def get_featured_auction_products(
     limit: int = Query(8, description="Number of products to return"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get featured auction products.
     Returns products with active bidding and sorted by popularity.
     """
     # Get auction products
-    featured_auctions = db.query(Product).filter(
+    featured_auctions = (await db.scalars(select(Product).options(
+        joinedload(Product.category)
+    ).where(
         Product.type == ProductType.AUCTION
     ).order_by(
         Product.created_at.desc()  # Most recent auctions first
-    ).limit(limit).all()
+    ).limit(limit))).all()
+
+    # Every product's images in one query
+    images = await images_by_product(db, [product.id for product in featured_auctions])
 
     # Prepare response data with bid information and categories
     result = []
     for product in featured_auctions:
-        # Get the highest bid for each auction product
-        highest_bid = db.query(Bid).filter(
-            Bid.product_id == product.id
-        ).order_by(desc(Bid.bid_price)).first()
-
         # Get product category
         category = product.category
         category_data = CategoryResponse.from_orm(
             category) if category else None
 
-        # Create product data with current bid - image paths will be populated by frontend
+        # Create product data with current bid and image paths
         product_data = ProductResponse(
             id=product.id,
             title=product.title,
             base_price=product.base_price,
             type=product.type.value,
             category_id=product.category_id,
-            image_paths=[],  # Empty list - will be fetched by frontend
-            current_bid=highest_bid.bid_price if highest_bid else product.base_price,
+            image_paths=images.get(product.id, []),
+            current_bid=product.highest_bid or product.base_price,
             category=category_data
         )
         result.append(product_data)
@@ -141,28 +155,30 @@ async def get_featured_auction_products(
     return result
 
 
+@router.get("/products/images")
+async def get_products_images(
+    ids: str = Query(..., description="Comma-separated product ids"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Image paths of several products in one response, keyed by product id.
+    Lets a page of cards load all its images with a single request.
+    """
+    product_ids = list(dict.fromkeys(
+        product_id.strip() for product_id in ids.split(",") if product_id.strip()))
+    if len(product_ids) > PRODUCT_IMAGES_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {PRODUCT_IMAGES_BATCH_MAX} product ids per request")
+
+    images = await images_by_product(db, product_ids)
+    return {"images": {product_id: images.get(product_id, []) for product_id in product_ids}}
+
+
 @router.get("/product/{product_id}/images")
-async def get_product_images(product_id: str):
+async def get_product_images(product_id: str, db: AsyncSession = Depends(get_read_db)):
     """
-    Scan the product's image directory and return a list of image file paths.
+    Return the product's image paths, primary first, from its attachments.
     """
-    # Define the product images directory
-    images_dir = Path("app/public/images/products") / product_id
-
-    # Check if directory exists
-    if not os.path.exists(images_dir):
-        # Try an alternative path
-        images_dir = Path("public/images/products") / product_id
-        if not os.path.exists(images_dir):
-            return {"images": []}
-
-    # Get all image files in the directory
-    image_files = []
-    if os.path.exists(images_dir):
-        for file in os.listdir(images_dir):
-            if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-                # Return the path as it would be accessed via the static route
-                image_files.append(
-                    f"/static/images/products/{product_id}/{file}")
-
-    return {"images": image_files}
+    images = await images_by_product(db, [product_id])
+    return {"images": images.get(product_id, [])}
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form, Query
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, asc, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import desc, asc, func, select
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, ConfigDict
 import os
@@ -9,10 +10,19 @@ import shutil
 import uuid
 import json
 import math
+import zipfile
 from datetime import datetime
 
-from ...database import get_db
-from ...models import Product, Category, ProductType, Bid
+from ...database import get_db, get_read_db
+from ...middleware.auth_middleware import current_user
+from ...middleware.rate_limit import RateLimit
+from ...models import Product, Category, ProductType
+from ...services.principal_cache import UserPrincipal
+from ...services.product_images import images_by_product, remove_product_images, sync_product_images
+from ...services.product_import import check_images_zip, import_products, read_rows
+from ...services.product_listing import (
+    ListingFilters, page_listings, refresh_listings, remove_listings
+)
 
 # Response schemas for listing endpoints
 
@@ -34,6 +44,9 @@ class ProductResponse(BaseModel):
     image_paths: Optional[List[str]] = None
     current_bid: Optional[float] = None
     category: Optional[CategoryResponse] = None
+    # HTML with <mark> around the matched words, on full-text searches
+    title_highlight: Optional[str] = None
+    description_snippet: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -41,8 +54,10 @@ class ProductResponse(BaseModel):
 class ProductListResponse(BaseModel):
     products: List[ProductResponse]
     currentPage: int
-    totalPages: int
-    totalProducts: int
+    totalPages: Optional[int] = None
+    totalProducts: Optional[int] = None
+    totalIsExact: bool = True
+    nextCursor: Optional[str] = None
 
 
 class FilterOptionsResponse(BaseModel):
@@ -55,189 +70,132 @@ router = APIRouter(prefix="/api/products")
 # Get sale products with pagination, filtering and sorting
 
 
-@router.get("/sale", response_model=ProductListResponse)
+@router.get("/sale", response_model=ProductListResponse,
+            dependencies=[Depends(RateLimit(
+                "product_search", only_with_param="search", cursor_rule="product_search_page"))])
 async def get_sale_products(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     page: int = Query(1, ge=1),
     limit: int = Query(12, ge=1, le=100),
     category: Optional[str] = None,
     search: Optional[str] = None,
-    sort: str = "newest",
+    sort: Optional[str] = None,
     min_price: Optional[float] = None,
-    max_price: Optional[float] = None
+    max_price: Optional[float] = None,
+    cursor: Optional[str] = None,
+    count: str = Query("exact", regex="^(exact|estimate|none)$")
 ):
     """
     Get products for sale with pagination, filtering and sorting.
+    Pass the previous response's nextCursor as cursor to page by index
+    seek instead of page number, and count=estimate or count=none to cap
+    or skip the total. Searches sort by relevance unless told otherwise.
     """
-    query = db.query(Product).filter(Product.type == ProductType.SALE)
-
-    # Apply filters
-    if category:
-        query = query.filter(Product.category_id == category)
-
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(Product.title.ilike(search_term) |
-                             Product.description.ilike(search_term))
-
-    if min_price is not None:
-        query = query.filter(Product.base_price >= min_price)
-
-    if max_price is not None:
-        query = query.filter(Product.base_price <= max_price)
-
-    # Apply sorting
-    if sort == "newest":
-        query = query.order_by(desc(Product.created_at))
-    elif sort == "price_low":
-        query = query.order_by(asc(Product.base_price))
-    elif sort == "price_high":
-        query = query.order_by(desc(Product.base_price))
-    elif sort == "popular":
-        # Default to newest for now
-        query = query.order_by(desc(Product.created_at))
-
-    # Count total products
-    total_products = query.count()
-    total_pages = math.ceil(total_products / limit)
-
-    # Pagination
-    offset = (page - 1) * limit
-    products = query.offset(offset).limit(limit).all()
+    filters = ListingFilters(ProductType.SALE, category, search, min_price, max_price)
+
+    # Pagination: one range scan of a product_listing index
+    try:
+        listing_page = await page_listings(db, filters, sort, limit, page, cursor, count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     # Prepare response
     result = []
-    for product in products:
-        # Get product category
-        category = product.category
-        category_data = CategoryResponse.from_orm(
-            category) if category else None
-
-        # Get images from directory
-        image_dir = f"/static/images/products/{product.id}"
-        server_dir = f"app/public/images/products/{product.id}"
-
-        images = []
-        if os.path.exists(server_dir):
-            for file in os.listdir(server_dir):
-                if os.path.isfile(os.path.join(server_dir, file)):
-                    images.append(f"{image_dir}/{file}")
-
+    for listing in listing_page.listings:
+        highlight = listing_page.highlights.get(listing.product_id, {})
         # Create product data
         product_data = ProductResponse(
-            id=product.id,
-            title=product.title,
-            base_price=product.base_price,
-            type=product.type.value,
-            category_id=product.category_id,
-            image_paths=images,
-            category=category_data
+            id=listing.product_id,
+            title=listing.title,
+            base_price=listing.base_price,
+            type=listing.type.value,
+            category_id=listing.category_id,
+            image_paths=listing.images or [],
+            category=CategoryResponse(
+                id=listing.category_id,
+                title=listing.category_title,
+                icon=listing.category_icon
+            ) if listing.category_title is not None else None,
+            title_highlight=highlight.get("title"),
+            description_snippet=highlight.get("description")
         )
         result.append(product_data)
 
     return {
         "products": result,
         "currentPage": page,
-        "totalPages": max(1, total_pages),
-        "totalProducts": total_products
+        "totalPages": max(1, math.ceil(listing_page.total / limit))
+        if listing_page.total is not None else None,
+        "totalProducts": listing_page.total,
+        "totalIsExact": listing_page.exact,
+        "nextCursor": listing_page.next_cursor
     }
 
 # Get auction products with pagination, filtering and sorting
 
 
-@router.get("/auction", response_model=ProductListResponse)
+@router.get("/auction", response_model=ProductListResponse,
+            dependencies=[Depends(RateLimit(
+                "product_search", only_with_param="search", cursor_rule="product_search_page"))])
 async def get_auction_products(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     page: int = Query(1, ge=1),
     limit: int = Query(12, ge=1, le=100),
     category: Optional[str] = None,
     search: Optional[str] = None,
-    sort: str = "newest",
+    sort: Optional[str] = None,
     min_price: Optional[float] = None,
-    max_price: Optional[float] = None
+    max_price: Optional[float] = None,
+    cursor: Optional[str] = None,
+    count: str = Query("exact", regex="^(exact|estimate|none)$")
 ):
     """
     Get auction products with pagination, filtering and sorting.
+    Pass the previous response's nextCursor as cursor to page by index
+    seek instead of page number, and count=estimate or count=none to cap
+    or skip the total. Searches sort by relevance unless told otherwise.
     """
-    query = db.query(Product).filter(Product.type == ProductType.AUCTION)
-
-    # Apply filters
-    if category:
-        query = query.filter(Product.category_id == category)
-
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(Product.title.ilike(search_term) |
-                             Product.description.ilike(search_term))
-
-    if min_price is not None:
-        query = query.filter(Product.base_price >= min_price)
-
-    if max_price is not None:
-        query = query.filter(Product.base_price <= max_price)
-
-    # Apply sorting
-    if sort == "newest":
-        query = query.order_by(desc(Product.created_at))
-    elif sort == "price_low":
-        query = query.order_by(asc(Product.base_price))
-    elif sort == "price_high":
-        query = query.order_by(desc(Product.base_price))
-    elif sort == "popular":
-        # Default to newest for now
-        query = query.order_by(desc(Product.created_at))
-
-    # Count total products
-    total_products = query.count()
-    total_pages = math.ceil(total_products / limit)
-
-    # Pagination
-    offset = (page - 1) * limit
-    products = query.offset(offset).limit(limit).all()
+    filters = ListingFilters(ProductType.AUCTION, category, search, min_price, max_price)
+
+    # Pagination: one range scan of a product_listing index
+    try:
+        listing_page = await page_listings(db, filters, sort, limit, page, cursor, count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     # Prepare response
     result = []
-    for product in products:
-        # Get highest bid
-        highest_bid = db.query(Bid).filter(
-            Bid.product_id == product.id
-        ).order_by(desc(Bid.bid_price)).first()
-
-        # Get product category
-        category = product.category
-        category_data = CategoryResponse.from_orm(
-            category) if category else None
-
-        # Get images from directory
-        image_dir = f"/static/images/products/{product.id}"
-        server_dir = f"app/public/images/products/{product.id}"
-
-        images = []
-        if os.path.exists(server_dir):
-            for file in os.listdir(server_dir):
-                if os.path.isfile(os.path.join(server_dir, file)):
-                    images.append(f"{image_dir}/{file}")
-
+    for listing in listing_page.listings:
+        highlight = listing_page.highlights.get(listing.product_id, {})
         # Create product data
         product_data = ProductResponse(
-            id=product.id,
-            title=product.title,
-            base_price=product.base_price,
-            type=product.type.value,
-            category_id=product.category_id,
-            image_paths=images,
-            current_bid=highest_bid.bid_price if highest_bid else product.base_price,
-            category=category_data
+            id=listing.product_id,
+            title=listing.title,
+            base_price=listing.base_price,
+            type=listing.type.value,
+            category_id=listing.category_id,
+            image_paths=listing.images or [],
+            current_bid=listing.current_bid,
+            category=CategoryResponse(
+                id=listing.category_id,
+                title=listing.category_title,
+                icon=listing.category_icon
+            ) if listing.category_title is not None else None,
+            title_highlight=highlight.get("title"),
+            description_snippet=highlight.get("description")
         )
         result.append(product_data)
 
     return {
         "products": result,
         "currentPage": page,
-        "totalPages": max(1, total_pages),
-        "totalProducts": total_products
+        "totalPages": max(1, math.ceil(listing_page.total / limit))
+        if listing_page.total is not None else None,
+        "totalProducts": listing_page.total,
+        "totalIsExact": listing_page.exact,
+        "nextCursor": listing_page.next_cursor
     }
 
 # Get filter options
@@ -246,14 +204,14 @@ async def get_auction_products(
 @router.get("/filters", response_model=FilterOptionsResponse)
 async def get_filter_options(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     type: Optional[str] = None
 ):
     """
     Get available filter options for products.
     """
     # Get categories
-    categories = db.query(Category).all()
+    categories = (await db.scalars(select(Category))).all()
     category_data = []
 
     for category in categories:
@@ -281,52 +239,38 @@ async def get_filter_options(
 
 @router.get("/craftsman")
 async def get_craftsman_products(
-    request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
 ):
     # Check if user is authenticated and is a craftsman
-    if not request.state.user:
+    if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    if request.state.user.role.value != "Craftsman":
+    if user.role.value != "Craftsman":
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    products = db.query(Product).filter(
-        Product.user_id == request.state.user.id
-    ).order_by(desc(Product.created_at)).all()
+    # Owner views read the primary so edits show up immediately
+    products = (await db.scalars(select(Product).options(
+        joinedload(Product.category)
+    ).where(
+        Product.user_id == user.id
+    ).order_by(desc(Product.created_at)))).all()
+
+    # Every product's images in one query
+    images = await images_by_product(db, [product.id for product in products])
 
     # Convert products to dict for JSON response
     result = []
     for product in products:
-        # Get the highest bid for auction products
-        highest_bid = None
-        if product.type == ProductType.AUCTION:
-            highest_bid_obj = db.query(Bid).filter(
-                Bid.product_id == product.id
-            ).order_by(desc(Bid.bid_price)).first()
-
-            if highest_bid_obj:
-                highest_bid = highest_bid_obj.bid_price
-
-        # Get images from directory
-        image_dir = f"/static/images/products/{product.id}"
-        server_dir = f"app/public/images/products/{product.id}"
-
-        images = []
-        if os.path.exists(server_dir):
-            for file in os.listdir(server_dir):
-                if os.path.isfile(os.path.join(server_dir, file)):
-                    images.append(f"{image_dir}/{file}")
-
         result.append({
             "id": product.id,
             "title": product.title,
             "type": product.type.value,
             "category": product.category.title if product.category else None,
             "base_price": product.base_price,
-            "highest_bid": highest_bid,
+            "highest_bid": product.highest_bid,
             "created_at": product.created_at.isoformat(),
-            "images": images
+            "images": images.get(product.id, [])
         })
 
     return result
@@ -337,42 +281,24 @@ async def get_craftsman_products(
 @router.get("/{product_id}")
 async def get_product(
     product_id: str,
-    request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
 ):
     # Check if user is authenticated
-    if not request.state.user:
+    if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
 
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
     # If craftsman, check if product belongs to the current user
-    if request.state.user.role.value == "Craftsman" and product.user_id != request.state.user.id:
+    if user.role.value == "Craftsman" and product.user_id != user.id:
         raise HTTPException(
             status_code=403, detail="Not authorized to access this product")
 
-    # Get the highest bid for auction products
-    highest_bid = None
-    if product.type == ProductType.AUCTION:
-        highest_bid_obj = db.query(Bid).filter(
-            Bid.product_id == product.id
-        ).order_by(desc(Bid.bid_price)).first()
-
-        if highest_bid_obj:
-            highest_bid = highest_bid_obj.bid_price
-
-    # Get images from directory
-    image_dir = f"/static/images/products/{product.id}"
-    server_dir = f"app/public/images/products/{product.id}"
-
-    images = []
-    if os.path.exists(server_dir):
-        for file in os.listdir(server_dir):
-            if os.path.isfile(os.path.join(server_dir, file)):
-                images.append(f"{image_dir}/{file}")
+    images = (await images_by_product(db, [product.id])).get(product.id, [])
 
     result = {
         "id": product.id,
@@ -386,7 +312,7 @@ async def get_product(
         "width": product.width,
         "height": product.height,
         "created_at": product.created_at.isoformat(),
-        "highest_bid": highest_bid,
+        "highest_bid": product.highest_bid,
         "images": images
     }
 
@@ -397,7 +323,6 @@ async def get_product(
 
 @router.post("/")
 async def create_product(
-    request: Request,
     title: str = Form(...),
     description: str = Form(None),
     type: str = Form(...),
@@ -408,13 +333,14 @@ async def create_product(
     width: Optional[float] = Form(None),
     height: Optional[float] = Form(None),
     files: List[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
 ):
     # Check if user is authenticated and is a craftsman
-    if not request.state.user:
+    if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    if request.state.user.role.value != "Craftsman":
+    if user.role.value != "Craftsman":
         raise HTTPException(status_code=403, detail="Not authorized")
 
     # Validate product type
@@ -427,13 +353,13 @@ async def create_product(
         raise HTTPException(status_code=400, detail="Invalid product type")
 
     # Check if category exists
-    category = db.query(Category).filter(Category.id == category_id).first()
+    category = await db.get(Category, category_id)
     if not category:
         raise HTTPException(status_code=400, detail="Invalid category")
 
     # Create product
     new_product = Product(
-        user_id=request.state.user.id,
+        user_id=user.id,
         category_id=category_id,
         type=product_type,
         title=title,
@@ -446,8 +372,7 @@ async def create_product(
     )
 
     db.add(new_product)
-    db.commit()
-    db.refresh(new_product)
+    await db.flush()
 
     # Create product images directory
     product_images_dir = f"app/public/images/products/{new_product.id}"
@@ -465,15 +390,63 @@ async def create_product(
                 with open(file_path, "wb") as buffer:
                     shutil.copyfileobj(file.file, buffer)
 
+    # Record the images and list the product in the same transaction
+    await sync_product_images(db, [new_product.id])
+    await refresh_listings(db, [new_product.id])
+    await db.commit()
+
     return {"id": new_product.id, "message": "Product created successfully"}
 
+# Bulk import products
+
+
+@router.post("/import", dependencies=[Depends(RateLimit("product_import"))])
+async def bulk_import_products(
+    file: UploadFile = File(...),
+    images: Optional[UploadFile] = File(None),
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
+):
+    """
+    Import a catalog from a CSV or JSONL file, with an optional zip of the
+    images it names. Valid rows are saved even when others fail; the
+    response lists the failed rows with their errors.
+    """
+    # Check if user is authenticated and is a craftsman
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    if user.role.value != "Craftsman":
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    filename = file.filename or ""
+    if not filename.lower().endswith((".csv", ".jsonl", ".ndjson")):
+        raise HTTPException(
+            status_code=400, detail="Upload a .csv or .jsonl file")
+
+    if images and images.filename:
+        if not zipfile.is_zipfile(images.file):
+            raise HTTPException(
+                status_code=400, detail="Images must be a zip file")
+        try:
+            with zipfile.ZipFile(images.file) as archive:
+                check_images_zip(archive)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return await import_products(
+        db,
+        user.id,
+        read_rows(file.file, filename),
+        images.file if images and images.filename else None
+    )
+
 # Update product
 
 
 @router.put("/{product_id}")
 async def update_product(
     product_id: str,
-    request: Request,
     title: str = Form(...),
     description: str = Form(None),
     type: str = Form(...),
@@ -485,22 +458,23 @@ async def update_product(
     height: Optional[float] = Form(None),
     files: List[UploadFile] = File(None),
     removed_images: str = Form("[]"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
 ):
     # Check if user is authenticated and is a craftsman
-    if not request.state.user:
+    if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    if request.state.user.role.value != "Craftsman":
+    if user.role.value != "Craftsman":
         raise HTTPException(status_code=403, detail="Not authorized")
 
     # Get product
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
     # Check if product belongs to the current user
-    if product.user_id != request.state.user.id:
+    if product.user_id != user.id:
         raise HTTPException(
             status_code=403, detail="Not authorized to update this product")
 
@@ -514,7 +488,7 @@ async def update_product(
         raise HTTPException(status_code=400, detail="Invalid product type")
 
     # Check if category exists
-    category = db.query(Category).filter(Category.id == category_id).first()
+    category = await db.get(Category, category_id)
     if not category:
         raise HTTPException(status_code=400, detail="Invalid category")
 
@@ -534,13 +508,17 @@ async def update_product(
     try:
         removed_images_list = json.loads(removed_images)
         if removed_images_list:
+            # Only this product's own images can be removed
+            current_images = (await images_by_product(db, [product.id])).get(product.id, [])
             for image_path in removed_images_list:
+                if image_path not in current_images:
+                    continue
                 # Remove file from disk
                 try:
                     # Convert from URL path to file path
                     file_path = os.path.join(
                         "app/public",
-                        image_path.replace("/static", "")
+                        image_path.removeprefix("/static/")
                     )
                     if os.path.exists(file_path):
                         os.remove(file_path)
@@ -565,7 +543,9 @@ async def update_product(
                 with open(file_path, "wb") as buffer:
                     shutil.copyfileobj(file.file, buffer)
 
-    db.commit()
+    await sync_product_images(db, [product.id])
+    await refresh_listings(db, [product.id])
+    await db.commit()
 
     return {"message": "Product updated successfully"}
 
@@ -575,23 +555,23 @@ async def update_product(
 @router.delete("/{product_id}")
 async def delete_product(
     product_id: str,
-    request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
 ):
     # Check if user is authenticated and is a craftsman
-    if not request.state.user:
+    if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    if request.state.user.role.value != "Craftsman":
+    if user.role.value != "Craftsman":
         raise HTTPException(status_code=403, detail="Not authorized")
 
     # Get product
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
     # Check if product belongs to the current user
-    if product.user_id != request.state.user.id:
+    if product.user_id != user.id:
         raise HTTPException(
             status_code=403, detail="Not authorized to delete this product")
 
@@ -604,8 +584,10 @@ async def delete_product(
         print(f"Error removing product directory: {e}")
 
     # Delete product
-    db.delete(product)
-    db.commit()
+    await remove_listings(db, [product_id])
+    await remove_product_images(db, product_id)
+    await db.delete(product)
+    await db.commit()
 
     return {"message": "Product deleted successfully"}
 
@@ -615,11 +597,11 @@ async def delete_product(
 @router.get("/categories/all")
 async def get_categories(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
         # Get all categories
-        categories = db.query(Category).all()
+        categories = (await db.scalars(select(Category))).all()
 
         # Use "title" field instead of "name" to match your Category model
         result = [{"id": cat.id, "name": cat.title} for cat in categories]
@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from typing import List, Optional
-from pathlib import Path
-import os
-from ...database import get_db
-from ...models import Product, ProductType, Rating, OrderItem, Category, User, CartItem, OrderStatus
+from ...database import get_db, get_read_db
+from ...models import Product, ProductType, Rating, OrderItem, Category, User, CartItem, OrderStatus, generate_uuid
+from ...services.product_images import images_by_product
+from ...services.product_stats import record_orders
+from ...middleware.auth_middleware import current_user
+from ...services.principal_cache import UserPrincipal
 from datetime import datetime
-import uuid
 
 # Create models for request bodies
 
@@ -29,18 +32,17 @@ router = APIRouter()
 
 
 @router.get("/api/product-details/{product_id}")
-async def get_product(product_id: str, db: Session = Depends(get_db)):
+async def get_product(product_id: str, db: AsyncSession = Depends(get_read_db)):
     """Get product details by ID"""
     # Get product
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
     # Get category separately (direct query)
     category_title = "Uncategorized"
     if product.category_id:
-        category = db.query(Category).filter(
-            Category.id == product.category_id).first()
+        category = await db.get(Category, product.category_id)
         if category:
             category_title = category.title
 
@@ -65,25 +67,10 @@ async def get_product(product_id: str, db: Session = Depends(get_db)):
 
 
 @router.get("/api/product-details/{product_id}/images")
-async def get_product_images(product_id: str):
-    """Get all images for a product"""
-    # Define image directory
-    images_dir = Path("app/public/images/products") / product_id
-
-    # Check if directory exists
-    if not os.path.exists(images_dir):
-        # Try alternative path
-        images_dir = Path("public/images/products") / product_id
-        if not os.path.exists(images_dir):
-            return {"images": []}
-
-    # Get all image files
-    image_files = []
-    for file in os.listdir(images_dir):
-        if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-            image_files.append(f"/static/images/products/{product_id}/{file}")
-
-    return {"images": image_files}
+async def get_product_images(product_id: str, db: AsyncSession = Depends(get_read_db)):
+    """Get all images for a product, primary first"""
+    images = await images_by_product(db, [product_id])
+    return {"images": images.get(product_id, [])}
 
 # Get related products
 
@@ -92,22 +79,22 @@ async def get_product_images(product_id: str):
 async def get_related_products(
     product_id: str,
     limit: int = Query(4, description="Number of products to return"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get products related to the given product"""
     # Get current product to find category_id
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
     # Get products from same category
-    query = db.query(Product).filter(
+    query = select(Product).options(joinedload(Product.category)).where(
         Product.category_id == product.category_id,
         Product.id != product_id,  # Exclude current product
         Product.type == ProductType.SALE  # Only sale products
     ).order_by(Product.created_at.desc())
 
-    related_products = query.limit(limit).all()
+    related_products = list((await db.scalars(query.limit(limit))).all())
 
     # If not enough products, get some featured products
     if len(related_products) < limit:
@@ -116,23 +103,20 @@ async def get_related_products(
         existing_ids = [p.id for p in related_products] + [product_id]
 
         # Get more products
-        more_products = db.query(Product).filter(
+        more_products = (await db.scalars(select(Product).options(
+            joinedload(Product.category)
+        ).where(
             Product.id.notin_(existing_ids),
             Product.type == ProductType.SALE
-        ).order_by(Product.created_at.desc()).limit(more_needed).all()
+        ).order_by(Product.created_at.desc()).limit(more_needed))).all()
 
         related_products.extend(more_products)
 
     # Format response
     result = []
     for p in related_products:
-        # Get category title
-        category_title = "Uncategorized"
-        if p.category_id:
-            category = db.query(Category).filter(
-                Category.id == p.category_id).first()
-            if category:
-                category_title = category.title
+        # Category loaded with the product
+        category_title = p.category.title if p.category else "Uncategorized"
 
         result.append({
             "id": p.id,
@@ -147,20 +131,20 @@ async def get_related_products(
 
 
 @router.get("/api/product-details/{product_id}/ratings")
-async def get_product_ratings(product_id: str, db: Session = Depends(get_db)):
+async def get_product_ratings(product_id: str, db: AsyncSession = Depends(get_read_db)):
     """Get ratings for a product"""
     # Check if product exists
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
     # Get ratings through order items
-    ratings = (
-        db.query(Rating)
+    ratings = (await db.scalars(
+        select(Rating)
         .join(OrderItem, OrderItem.id == Rating.order_item_id)
-        .filter(OrderItem.product_id == product_id)
-        .all()
-    )
+        .options(joinedload(Rating.order_item).joinedload(OrderItem.user))
+        .where(OrderItem.product_id == product_id)
+    )).all()
 
     # Format ratings
     result = []
@@ -190,25 +174,27 @@ async def get_product_ratings(product_id: str, db: Session = Depends(get_db)):
 
 
 @router.post("/api/cart/add")
-async def add_to_cart(cart_item: CartItemRequest, request: Request, db: Session = Depends(get_db)):
+async def add_to_cart(
+    cart_item: CartItemRequest,
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
+):
     """Add a product to the user's cart"""
-    # Get authenticated user from request state
-    user = request.state.user
+    # Require an authenticated user
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
 
     try:
         # Check if product exists
-        product = db.query(Product).filter(
-            Product.id == cart_item.product_id).first()
+        product = await db.get(Product, cart_item.product_id)
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
 
         # Check if item already in cart
-        existing_item = db.query(CartItem).filter(
+        existing_item = await db.scalar(select(CartItem).where(
             CartItem.user_id == user.id,
             CartItem.product_id == cart_item.product_id
-        ).first()
+        ).limit(1))
 
         if existing_item:
             # Update quantity
@@ -223,32 +209,34 @@ async def add_to_cart(cart_item: CartItemRequest, request: Request, db: Session
             )
             db.add(new_cart_item)
 
-        db.commit()
+        await db.commit()
         return {"success": True, "message": "Product added to cart"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 # Create an order with "Buy Now"
 
 
 @router.post("/api/orders/buy-now")
-async def create_order(order: OrderRequest, request: Request, db: Session = Depends(get_db)):
+async def create_order(
+    order: OrderRequest,
+    db: AsyncSession = Depends(get_db),
+    user: Optional[UserPrincipal] = Depends(current_user)
+):
     """Create a new order directly from product page"""
-    # Get authenticated user from request state
-    user = request.state.user
+    # Require an authenticated user
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
 
     try:
         # Check if product exists
-        product = db.query(Product).filter(
-            Product.id == order.product_id).first()
+        product = await db.get(Product, order.product_id)
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
 
         # Create new order item
-        order_id = str(uuid.uuid4())  # Generate unique order ID
+        order_id = generate_uuid()  # Generate unique order ID
 
         order_item = OrderItem(
             id=order_id,
@@ -260,7 +248,8 @@ async def create_order(order: OrderRequest, request: Request, db: Session = Depe
         )
 
         db.add(order_item)
-        db.commit()
+        await record_orders(db, [order.product_id])
+        await db.commit()
 
         # Return order info
         return {
@@ -270,5 +259,5 @@ async def create_order(order: OrderRequest, request: Request, db: Session = Depe
             "redirect_url": f"/checkout"
         }
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -2,16 +2,22 @@
 API routes for the Vishva AI Assistant
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
-from ...database import get_db
+from ...database import get_sync_db
+from ...middleware.rate_limit import RateLimit
 from ...services.vishva_service import VishvaService
 from ...models import Chat, Message
 
 router = APIRouter(prefix="/api/vishva")
 
+# These handlers are plain functions on the sync session: VishvaService and
+# its LLM calls block, so FastAPI runs them in its threadpool instead of
+# on the event loop
+
 # Pydantic models for request/response
 
 
@@ -37,9 +43,9 @@ class ChatResponse(BaseModel):
 
 
 @router.get("/chats")
-async def get_chats(
+def get_chats(
     user_id: str,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_sync_db)
 ):
     """
     Get all chat sessions for a user
@@ -47,22 +53,29 @@ async def get_chats(
     vishva_service = VishvaService(db)
     chats = vishva_service.get_user_chats(user_id)
 
+    # Last message of every chat in one query, by (created_at, id)
+    ranked = db.query(
+        Message.id,
+        func.row_number().over(
+            partition_by=Message.chat_id,
+            order_by=(Message.created_at.desc(), Message.id.desc())
+        ).label("position")
+    ).filter(Message.chat_id.in_([chat.id for chat in chats])).subquery()
+    last_messages = {
+        message.chat_id: message.message
+        for message in db.query(Message).join(ranked, Message.id == ranked.c.id)
+        .filter(ranked.c.position == 1)
+    } if chats else {}
+
     # Format response
     result = []
     for chat in chats:
-        # Get the last message if there are any
-        last_message = None
-        if chat.messages:
-            last_message = db.query(Message).filter(
-                Message.chat_id == chat.id
-            ).order_by(Message.created_at.desc()).first()
-
         result.append({
             "id": chat.id,
             "title": chat.title,
             "created_at": chat.created_at.isoformat(),
             "updated_at": chat.updated_at.isoformat(),
-            "last_message": last_message.message if last_message else None
+            "last_message": last_messages.get(chat.id)
         })
 
     return result
@@ -71,9 +84,9 @@ async def get_chats(
 
 
 @router.post("/chats")
-async def create_chat(
+def create_chat(
     data: dict,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_sync_db)
 ):
     """
     Create a new chat session
@@ -98,12 +111,16 @@ async def create_chat(
 
 
 @router.get("/chats/{chat_id}/messages")
-async def get_chat_messages(
+def get_chat_messages(
     chat_id: str,
-    db: Session = Depends(get_db)
+    before: Optional[str] = Query(
+        None, description="Only messages older than this message id"),
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    db: Session = Depends(get_sync_db)
 ):
     """
-    Get all messages for a specific chat
+    Get the messages of a chat, oldest first. With limit, only the latest
+    ones; pass the first id of a page as before to load earlier messages.
     """
     vishva_service = VishvaService(db)
     chat = vishva_service.get_chat(chat_id)
@@ -111,7 +128,7 @@ async def get_chat_messages(
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
 
-    messages = vishva_service.get_chat_messages(chat_id)
+    messages = vishva_service.get_chat_messages(chat_id, before, limit)
 
     # Format response
     result = []
@@ -128,11 +145,11 @@ async def get_chat_messages(
 # Send a message to Vishva
 
 
-@router.post("/chats/{chat_id}/messages")
-async def send_message(
+@router.post("/chats/{chat_id}/messages", dependencies=[Depends(RateLimit("vishva_message"))])
+def send_message(
     chat_id: str,
     message: MessageCreate,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_sync_db)
 ):
     """
     Send a message to Vishva and get a response
@@ -172,9 +189,9 @@ async def send_message(
 
 
 @router.get("/chats/{chat_id}")
-async def get_chat(
+def get_chat(
     chat_id: str,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_sync_db)
 ):
     """
     Get details for a specific chat
@@ -186,11 +203,9 @@ async def get_chat(
         raise HTTPException(status_code=404, detail="Chat not found")
 
     # Get the last message if there are any
-    last_message = None
-    if chat.messages:
-        last_message = db.query(Message).filter(
-            Message.chat_id == chat.id
-        ).order_by(Message.created_at.desc()).first()
+    last_message = db.query(Message).filter(
+        Message.chat_id == chat.id
+    ).order_by(Message.created_at.desc(), Message.id.desc()).first()
 
     return {
         "id": chat.id,
@@ -204,10 +219,10 @@ async def get_chat(
 
 
 @router.patch("/chats/{chat_id}")
-async def update_chat_title(
+def update_chat_title(
     chat_id: str,
     title: str,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_sync_db)
 ):
     """
     Update the title of a chat
@@ -232,9 +247,9 @@ async def update_chat_title(
 
 
 @router.delete("/chats/{chat_id}")
-async def delete_chat(
+def delete_chat(
     chat_id: str,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_sync_db)
 ):
     """
     Delete a chat and all its messages
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, status, Request
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
 from fastapi.responses import FileResponse
 from typing import List, Optional
 from pydantic import BaseModel
@@ -8,6 +8,8 @@ from datetime import datetime
 from pathlib import Path
 
 from ...models import UserRole
+from ...middleware.auth_middleware import current_user
+from ...services.principal_cache import UserPrincipal
 
 # Define schemas directly in the API file
 
@@ -54,20 +56,18 @@ def get_library_files():
 
 
 @router.get("/files", response_model=List[LibraryFileResponse])
-async def list_files(request: Request):
+async def list_files(user: Optional[UserPrincipal] = Depends(current_user)):
     """
     List all PDF files in the Vishva library.
     Only admin users can access this endpoint.
     """
-    # Check if user exists in request state
-    if not hasattr(request.state, 'user') or request.state.user is None:
+    # Check the user is authenticated
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentication required"
         )
 
-    user = request.state.user
-
     # Check if user is admin
     if user.role != UserRole.ADMIN:
         raise HTTPException(
@@ -80,22 +80,20 @@ async def list_files(request: Request):
 
 @router.post("/files", response_model=LibraryFileResponse, status_code=status.HTTP_201_CREATED)
 async def upload_file(
-    request: Request,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    user: Optional[UserPrincipal] = Depends(current_user)
 ):
     """
     Upload a new PDF file to the Vishva library.
     Only admin users can access this endpoint.
     """
-    # Check if user exists in request state
-    if not hasattr(request.state, 'user') or request.state.user is None:
+    # Check the user is authenticated
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentication required"
         )
 
-    user = request.state.user
-
     # Check if user is admin
     if user.role != UserRole.ADMIN:
         raise HTTPException(
@@ -157,20 +155,21 @@ async def upload_file(
 
 
 @router.get("/files/{file_id}/download")
-async def download_file(file_id: str, request: Request):
+async def download_file(
+    file_id: str,
+    user: Optional[UserPrincipal] = Depends(current_user)
+):
     """
     Download a specific PDF file from the Vishva library by ID.
     Only admin users can access this endpoint.
     """
-    # Check if user exists in request state
-    if not hasattr(request.state, 'user') or request.state.user is None:
+    # Check the user is authenticated
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentication required"
         )
 
-    user = request.state.user
-
     # Check if user is admin
     if user.role != UserRole.ADMIN:
         raise HTTPException(
@@ -194,20 +193,21 @@ async def download_file(file_id: str, request: Request):
 
 
 @router.delete("/files/{file_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_file(file_id: str, request: Request):
+async def delete_file(
+    file_id: str,
+    user: Optional[UserPrincipal] = Depends(current_user)
+):
     """
     Delete a specific PDF file from the Vishva library by ID.
     Only admin users can access this endpoint.
     """
-    # Check if user exists in request state
-    if not hasattr(request.state, 'user') or request.state.user is None:
+    # Check the user is authenticated
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentication required"
         )
 
-    user = request.state.user
-
     # Check if user is admin
     if user.role != UserRole.ADMIN:
         raise HTTPException(
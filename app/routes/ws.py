@@ -1,28 +1,96 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+import asyncio
 import json
 from datetime import datetime, timedelta
 
-from ..database import get_db
-from ..models import Bid, Product, ProductType, User
-from ..config import AUCTION_DURATION
+from ..database import AsyncReadSessionLocal, AsyncSessionLocal
+from ..models import Product, ProductType
+from ..config import AUCTION_DURATION, BID_RELAY_INTERVAL
+from ..middleware.auth_middleware import LazyPrincipal
+from ..middleware.rate_limit import rate_limiter, rate_limit_keys
+from ..services.product_stats import place_bid
 
 router = APIRouter()
 
-# Store connected clients by product ID
+# Store connected clients by product ID. Each worker process has its own;
+# relay_bids forwards bids placed through the others.
 connected_clients = {}
 
+# Bid count each worker last broadcast per product, so relayed bids are
+# sent once and local ones are not sent again
+broadcast_bid_counts = {}
+
+
+def bid_message(product, auction_end_time: datetime) -> dict:
+    """Bid state of an auction as sent to its sockets"""
+    return {
+        "product_id": product.id,
+        "highest_bid": product.highest_bid,
+        "highest_bidder_id": product.highest_bidder_id,
+        "base_price": product.base_price,
+        "bid_count": product.bid_count,
+        "auction_end_time": auction_end_time.isoformat(),
+        "auction_ended": datetime.now() > auction_end_time
+    }
+
+
+async def broadcast(product_id: str, message: dict):
+    """Send a message to every socket of this worker watching the product"""
+    for client in list(connected_clients.get(product_id, [])):
+        try:
+            await client.send_text(json.dumps(message))
+        except Exception:
+            pass  # Client might be disconnected
 
-@router.websocket("/ws/auction/{product_id}")
-async def auction_websocket(websocket: WebSocket, product_id: str, db: Session = Depends(get_db)):
-    await websocket.accept()
 
-    # Check if product exists and is an auction
-    product = db.query(Product).filter(
-        Product.id == product_id,
-        Product.type == ProductType.AUCTION
-    ).first()
+async def relay_bids():
+    """
+    Forward bids placed through other workers and nodes to this worker's
+    sockets, by polling the bid count of the auctions they watch
+    """
+    while True:
+        await asyncio.sleep(BID_RELAY_INTERVAL)
+        if not connected_clients:
+            continue
+        try:
+            async with AsyncReadSessionLocal() as db:
+                products = (await db.scalars(select(Product).where(
+                    Product.id.in_(list(connected_clients))))).all()
+        except Exception as e:
+            print(f"Bid relay failed: {e}")
+            continue
+        for product in products:
+            if product.bid_count > broadcast_bid_counts.get(product.id, 0):
+                broadcast_bid_counts[product.id] = product.bid_count
+                auction_end_time = product.created_at + timedelta(seconds=AUCTION_DURATION)
+                await broadcast(product.id, bid_message(product, auction_end_time))
+
+
+@router.websocket("/ws/auction/{product_id}")
+async def auction_websocket(websocket: WebSocket, product_id: str):
+    # Echo the "bearer" subprotocol when the token was passed that way,
+    # otherwise browsers abort the handshake
+    subprotocol = "bearer" if "bearer" in websocket.scope.get(
+        "subprotocols", []) else None
+    await websocket.accept(subprotocol=subprotocol)
+
+    # Sessions are opened per operation rather than held for the life of
+    # the socket, so idle watchers do not pin pooled connections
+    async with AsyncSessionLocal() as db:
+        # Identity is bound to the connection once, at handshake. Anonymous
+        # sockets can watch the auction but not bid.
+        bidder = websocket.state.user
+        if isinstance(bidder, LazyPrincipal):
+            bidder = await bidder.resolve_async(db)
+        bidder_id = bidder.id if bidder else None
+
+        # Check if product exists and is an auction
+        product = await db.scalar(select(Product).where(
+            Product.id == product_id,
+            Product.type == ProductType.AUCTION
+        ))
 
     if not product:
         await websocket.send_text(json.dumps({"error": "Product not found or not an auction"}))
@@ -42,27 +110,12 @@ async def auction_websocket(websocket: WebSocket, product_id: str, db: Session =
     if product_id not in connected_clients:
         connected_clients[product_id] = []
     connected_clients[product_id].append(websocket)
+    broadcast_bid_counts[product_id] = max(
+        broadcast_bid_counts.get(product_id, 0), product.bid_count)
 
     try:
-        # Send initial bid information
-        highest_bid = db.query(Bid).filter(
-            Bid.product_id == product_id
-        ).order_by(desc(Bid.bid_price)).first()
-
-        # Get the number of bids
-        bid_count = db.query(Bid).filter(Bid.product_id == product_id).count()
-
-        bid_info = {
-            "product_id": product_id,
-            "highest_bid": highest_bid.bid_price if highest_bid else None,
-            "highest_bidder_id": highest_bid.user_id if highest_bid else None,
-            "base_price": product.base_price,
-            "bid_count": bid_count,
-            "auction_end_time": auction_end_time.isoformat(),
-            "auction_ended": auction_ended
-        }
-
-        await websocket.send_text(json.dumps(bid_info))
+        # Send initial bid information (kept on the product row)
+        await websocket.send_text(json.dumps(bid_message(product, auction_end_time)))
 
         # Process incoming bids
         while True:
@@ -70,10 +123,28 @@ async def auction_websocket(websocket: WebSocket, product_id: str, db: Session =
             try:
                 bid_data = json.loads(data)
 
+                # Only authenticated sockets may bid
+                if not bidder_id:
+                    await websocket.send_text(json.dumps({
+                        "error": "Authentication required to place a bid"
+                    }))
+                    continue
+
+                # Throttle bids per bidder and per client IP
+                status_code, retry_after = rate_limiter.check(
+                    "auction_bid", rate_limit_keys(websocket))
+                if status_code:
+                    await websocket.send_text(json.dumps({
+                        "error": "Too many bids, please slow down" if status_code == 429
+                        else "Server is busy, please retry shortly",
+                        "retry_after": round(retry_after, 1)
+                    }))
+                    continue
+
                 # Ensure required fields are present
-                if "user_id" not in bid_data or "bid_price" not in bid_data:
+                if not isinstance(bid_data, dict) or "bid_price" not in bid_data:
                     await websocket.send_text(json.dumps({
-                        "error": "Missing required fields: user_id and bid_price"
+                        "error": "Missing required field: bid_price"
                     }))
                     continue
 
@@ -86,56 +157,38 @@ async def auction_websocket(websocket: WebSocket, product_id: str, db: Session =
                     }))
                     continue
 
-                # Verify user exists
-                user = db.query(User).filter(
-                    User.id == bid_data["user_id"]).first()
-                if not user:
-                    await websocket.send_text(json.dumps({
-                        "error": "Invalid user ID"
-                    }))
-                    continue
-
-                # Check if bid price is greater than highest bid
-                highest_bid = db.query(Bid).filter(
-                    Bid.product_id == product_id
-                ).order_by(desc(Bid.bid_price)).first()
-
-                min_bid = highest_bid.bid_price if highest_bid else product.base_price
-
-                if bid_data["bid_price"] <= min_bid:
+                try:
+                    bid_price = float(bid_data["bid_price"])
+                except (TypeError, ValueError):
                     await websocket.send_text(json.dumps({
-                        "error": f"Bid must be higher than current highest bid: {min_bid}"
+                        "error": "bid_price must be a number"
                     }))
                     continue
 
-                # Create new bid
-                new_bid = Bid(
-                    product_id=product_id,
-                    user_id=bid_data["user_id"],
-                    bid_price=bid_data["bid_price"]
-                )
-
-                db.add(new_bid)
-                db.commit()
-
-                # Get updated bid count
-                bid_count = db.query(Bid).filter(
-                    Bid.product_id == product_id).count()
-
-                # Notify all connected clients about the new bid
-                if product_id in connected_clients:
-                    bid_info = {
-                        "product_id": product_id,
-                        "highest_bid": new_bid.bid_price,
-                        "highest_bidder_id": new_bid.user_id,
-                        "base_price": product.base_price,
-                        "bid_count": bid_count,
-                        "auction_end_time": auction_end_time.isoformat(),
-                        "auction_ended": current_time > auction_end_time
-                    }
-
-                    for client in connected_clients[product_id]:
-                        await client.send_text(json.dumps(bid_info))
+                async with AsyncSessionLocal() as db:
+                    # Accepted only if it still beats the highest bid when
+                    # written, so concurrent bidders cannot both win
+                    bid_count = await place_bid(db, product_id, bidder_id, bid_price)
+                    if bid_count is None:
+                        await db.rollback()
+                        current = await db.scalar(select(Product).where(
+                            Product.id == product_id))
+                        min_bid = current.highest_bid or current.base_price
+                        await websocket.send_text(json.dumps({
+                            "error": f"Bid must be higher than current highest bid: {min_bid}"
+                        }))
+                        continue
+
+                    await db.commit()
+
+                # Notify this worker's clients about the new bid; the others
+                # pick it up in relay_bids
+                product.highest_bid = bid_price
+                product.highest_bidder_id = bidder_id
+                product.bid_count = bid_count
+                if bid_count > broadcast_bid_counts.get(product_id, 0):
+                    broadcast_bid_counts[product_id] = bid_count
+                    await broadcast(product_id, bid_message(product, auction_end_time))
 
             except json.JSONDecodeError:
                 await websocket.send_text(json.dumps({"error": "Invalid JSON format"}))
@@ -148,24 +201,22 @@ async def auction_websocket(websocket: WebSocket, product_id: str, db: Session =
             connected_clients[product_id].remove(websocket)
             if not connected_clients[product_id]:
                 del connected_clients[product_id]
+                broadcast_bid_counts.pop(product_id, None)
 
 # Helper function to send notification to all clients when auction ends
 
 
-async def notify_auction_ended(product_id: str, db: Session):
+async def notify_auction_ended(product_id: str, db: AsyncSession):
     if product_id not in connected_clients:
         return
 
-    # Get the highest bid
-    highest_bid = db.query(Bid).filter(
-        Bid.product_id == product_id
-    ).order_by(desc(Bid.bid_price)).first()
+    product = await db.get(Product, product_id)
 
     notification = {
         "product_id": product_id,
         "auction_ended": True,
-        "highest_bid": highest_bid.bid_price if highest_bid else None,
-        "highest_bidder_id": highest_bid.user_id if highest_bid else None
+        "highest_bid": product.highest_bid if product else None,
+        "highest_bidder_id": product.highest_bidder_id if product else None
     }
 
     # Notify all connected clients
@@ -0,0 +1,171 @@
+"""
+History archival
+Moves rows nothing edits any more out of the hot bids and order_items
+tables into archived_bids and archived_order_items: the bids of settled
+auctions, and delivered or denied orders untouched for ARCHIVE_AFTER_DAYS.
+Each batch is copied and deleted in one transaction, so a row is always in
+exactly one of the two tables, and an auction's bids move together.
+
+Rated orders stay where they are: ratings reference order_items.
+
+    python -m scripts.archive_history
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, delete, exists, insert, literal, or_, select, text, union_all
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.config import (
+    ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_PAUSE, ARCHIVE_BATCH_SIZE, AUCTION_DURATION
+)
+from app.models import (
+    ArchivedBid, ArchivedOrderItem, Bid, OrderItem, OrderStatus, Product, ProductType, Rating
+)
+
+# Orders in these states never change again
+CLOSED_STATUSES = (OrderStatus.DELIVERED, OrderStatus.DENIED)
+
+# Arbitrary key for the Postgres advisory lock held by the archiving worker
+ARCHIVE_LOCK_KEY = 72093115
+
+BID_COLUMNS = ("id", "product_id", "user_id", "bid_price", "created_at")
+ORDER_COLUMNS = ("id", "user_id", "product_id", "quantity", "unit_price",
+                 "status", "created_at", "updated_at")
+
+
+class ArchiveStats:
+    def __init__(self):
+        self.runs = 0
+        self.bids = 0
+        self.orders = 0
+        self.last_run = None
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "bidsArchived": self.bids,
+            "ordersArchived": self.orders,
+            "lastRun": self.last_run.isoformat() if self.last_run else None,
+        }
+
+
+archive_stats = ArchiveStats()
+
+
+def all_orders():
+    """Hot and archived order items as one subquery, for all-time totals"""
+    return union_all(
+        select(*[OrderItem.__table__.c[name] for name in ORDER_COLUMNS]),
+        select(*[ArchivedOrderItem.__table__.c[name] for name in ORDER_COLUMNS])
+    ).subquery("all_orders")
+
+
+def settled_auctions(now: datetime):
+    """Ended auctions with bids still in the hot table and nothing left to do"""
+    ended = now - timedelta(seconds=AUCTION_DURATION)
+    abandoned = ended - timedelta(days=ARCHIVE_AFTER_DAYS)
+    return select(Product.id, Product.bid_count).where(
+        Product.type == ProductType.AUCTION,
+        Product.created_at < ended,
+        exists().where(Bid.product_id == Product.id),
+        # The winner has ordered, or never did and the cutoff has passed
+        or_(
+            exists().where(OrderItem.product_id == Product.id),
+            exists().where(ArchivedOrderItem.product_id == Product.id),
+            Product.created_at < abandoned
+        )
+    )
+
+
+def closed_orders(now: datetime):
+    cutoff = now - timedelta(days=ARCHIVE_AFTER_DAYS)
+    return select(OrderItem.id).where(
+        OrderItem.status.in_(CLOSED_STATUSES),
+        OrderItem.updated_at < cutoff,
+        ~exists().where(Rating.order_item_id == OrderItem.id)
+    )
+
+
+def copy_rows(conn, source, target, columns, condition, now: datetime) -> int:
+    """Copy the matching rows into the archive table, then delete them"""
+    conn.execute(insert(target).from_select(
+        [*columns, "archived_at"],
+        select(*[source.__table__.c[name] for name in columns],
+               literal(now, DateTime)).where(condition)
+    ))
+    return conn.execute(delete(source).where(condition)).rowcount
+
+
+def lock(conn) -> bool:
+    """Let one worker archive at a time; SQLite serializes writers itself"""
+    if conn.dialect.name != "postgresql":
+        return True
+    return conn.execute(text("SELECT pg_try_advisory_xact_lock(:key)"),
+                        {"key": ARCHIVE_LOCK_KEY}).scalar()
+
+
+def archive_bids(engine, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Move the bids of settled auctions, up to about batch_size; returns bids moved"""
+    now = datetime.now()
+    with engine.begin() as conn:
+        if not lock(conn):
+            return 0
+        product_ids, total = [], 0
+        for product_id, bid_count in conn.execute(settled_auctions(now).limit(batch_size)):
+            if product_ids and total + bid_count > batch_size:
+                break
+            product_ids.append(product_id)
+            total += bid_count
+        if not product_ids:
+            return 0
+        return copy_rows(conn, Bid, ArchivedBid, BID_COLUMNS,
+                         Bid.product_id.in_(product_ids), now)
+
+
+def archive_orders(engine, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Move up to batch_size closed orders; returns orders moved"""
+    now = datetime.now()
+    with engine.begin() as conn:
+        if not lock(conn):
+            return 0
+        ids = conn.execute(closed_orders(now).limit(batch_size)).scalars().all()
+        if not ids:
+            return 0
+        return copy_rows(conn, OrderItem, ArchivedOrderItem, ORDER_COLUMNS,
+                         OrderItem.id.in_(ids), now)
+
+
+def archive(engine, pause: float = ARCHIVE_BATCH_PAUSE) -> dict:
+    """Archive everything eligible, pausing between batches"""
+    moved = {"bids": 0, "orders": 0}
+    for kind, archive_batch in (("bids", archive_bids), ("orders", archive_orders)):
+        while count := archive_batch(engine):
+            moved[kind] += count
+            time.sleep(pause)
+    return moved
+
+
+async def run_archival(engine):
+    """
+    One archival pass for the background task. Batches run on a worker
+    thread and the pause is an asyncio sleep, so cancelling at shutdown
+    waits for at most one batch.
+    """
+    moved = {"bids": 0, "orders": 0}
+    try:
+        for kind, archive_batch in (("bids", archive_bids), ("orders", archive_orders)):
+            while count := await asyncio.to_thread(archive_batch, engine):
+                moved[kind] += count
+                await asyncio.sleep(ARCHIVE_BATCH_PAUSE)
+    except SQLAlchemyError as e:
+        # Another worker got there first on SQLite, or the database is busy
+        print(f"History archival stopped early: {e}")
+    finally:
+        archive_stats.runs += 1
+        archive_stats.bids += moved["bids"]
+        archive_stats.orders += moved["orders"]
+        archive_stats.last_run = datetime.now()
+    return moved
@@ -1,5 +1,8 @@
 import jwt
-from datetime import datetime
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
 from app.database import pwd_context
 
@@ -8,6 +11,12 @@ from app.database import pwd_context
 JWT_SECRET = "ceylon_handicrafts_secret_key"
 ALGORITHM = "HS256"
 
+# "claims" issues short-lived access tokens carrying the user's role, name
+# and email plus a refresh token; "legacy" issues the old sub-only tokens
+TOKEN_MODE = "claims"
+ACCESS_TOKEN_TTL = timedelta(minutes=15)
+REFRESH_TOKEN_TTL = timedelta(days=30)
+
 
 def hash_password(password: str) -> str:
     """Hash a password for storing."""
@@ -29,10 +38,127 @@ def create_token(user_id: str) -> str:
     return jwt.encode(payload, JWT_SECRET, algorithm=ALGORITHM)
 
 
-def verify_token(token: str):
+def create_access_token(user) -> str:
+    """Create a short-lived access token carrying the user's identity claims."""
+    now = datetime.utcnow()
+    payload = {
+        "sub": user.id,
+        "typ": "access",
+        "jti": str(uuid.uuid4()),
+        "role": user.role.value,
+        "name": user.name,
+        "email": user.email,
+        "phone": user.phone,
+        "iat": now,
+        "exp": now + ACCESS_TOKEN_TTL
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=ALGORITHM)
+
+
+def create_refresh_token(user_id: str) -> str:
+    """Create a long-lived refresh token used only to obtain new access tokens."""
+    now = datetime.utcnow()
+    payload = {
+        "sub": user_id,
+        "typ": "refresh",
+        "jti": str(uuid.uuid4()),
+        "iat": now,
+        "exp": now + REFRESH_TOKEN_TTL
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=ALGORITHM)
+
+
+def issue_tokens(user) -> dict:
+    """Build the token part of a login response for the configured token mode."""
+    if TOKEN_MODE != "claims":
+        return {"access_token": create_token(user.id), "token_type": "bearer"}
+
+    return {
+        "access_token": create_access_token(user),
+        "refresh_token": create_refresh_token(user.id),
+        "token_type": "bearer",
+        "expires_in": int(ACCESS_TOKEN_TTL.total_seconds())
+    }
+
+
+class TokenRevocationList:
+    """In-memory set of revoked token ids, mirrored to the revoked_tokens table"""
+
+    def __init__(self):
+        self._revoked = {}  # jti -> expiry (unix seconds)
+        self._lock = threading.Lock()
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def add(self, jti: str, expires_at: float):
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+    def prune(self):
+        """Forget revocations for tokens that have expired anyway"""
+        now = time.time()
+        with self._lock:
+            for jti in [j for j, exp in self._revoked.items() if exp <= now]:
+                del self._revoked[jti]
+
+    def load(self, db):
+        """Load unexpired revocations from the database and purge the rest"""
+        from app.models import RevokedToken
+
+        now = datetime.utcnow()
+        db.query(RevokedToken).filter(
+            RevokedToken.expires_at <= now).delete()
+        db.commit()
+
+        rows = db.query(RevokedToken.jti, RevokedToken.expires_at).all()
+        with self._lock:
+            self._revoked = {
+                row.jti: row.expires_at.replace(tzinfo=timezone.utc).timestamp()
+                for row in rows
+            }
+
+    def __len__(self):
+        return len(self._revoked)
+
+
+revoked_tokens = TokenRevocationList()
+
+
+def revoke_token(payload: dict, db):
+    """Revoke a decoded token until it expires."""
+    from app.models import RevokedToken
+
+    jti = payload.get("jti")
+    if not jti or "exp" not in payload:
+        # Legacy tokens carry no id or expiry and cannot be revoked
+        return False
+
+    expires_at = datetime.utcfromtimestamp(payload["exp"])
+    revoked_tokens.prune()
+    if jti not in revoked_tokens:
+        db.merge(RevokedToken(
+            jti=jti,
+            user_id=payload.get("sub"),
+            expires_at=expires_at
+        ))
+        db.commit()
+        revoked_tokens.add(jti, payload["exp"])
+    return True
+
+
+def verify_token(token: str, token_type: str = "access"):
     """Verify a JWT token and return the payload if valid."""
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
-        return payload
     except jwt.PyJWTError:
         return None
+
+    # Tokens without a type predate refresh tokens and act as access tokens
+    if payload.get("typ", "access") != token_type:
+        return None
+
+    if payload.get("jti") in revoked_tokens:
+        return None
+
+    return payload
@@ -0,0 +1,108 @@
+"""
+Listing counts
+Caches the total behind each filtered listing (type, category, search and
+price range; the sort does not change it) so paging through a listing
+counts it once rather than on every page. A session that refreshed or
+removed listing rows clears the cache when it commits; other workers'
+changes show up within LISTING_COUNT_CACHE_TTL.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..config import LISTING_COUNT_CACHE_MAX_SIZE, LISTING_COUNT_CACHE_TTL
+
+
+class ListingCountCache:
+    """
+    Thread-safe LRU cache of (count, exact) by ListingFilters with a
+    per-entry TTL. Each invalidation starts a new generation, and a count
+    taken in an older one is not stored, so a count that raced a commit
+    never outlives it.
+    """
+
+    def __init__(self, ttl: float = LISTING_COUNT_CACHE_TTL,
+                 max_size: int = LISTING_COUNT_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # filters -> (expires_at, count, exact)
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, filters, exact: bool = True) -> Optional[tuple]:
+        """(count, exact) for the filters, or None; exact skips capped counts"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(filters)
+            if entry is None or entry[0] <= now or (exact and not entry[2]):
+                if entry is not None and entry[0] <= now:
+                    del self._entries[filters]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(filters)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def set(self, filters, count: int, exact: bool, generation: int):
+        """Store a count taken during generation, unless it has since ended"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            current = self._entries.get(filters)
+            if current is not None and current[2] and not exact:
+                return  # keep the exact count
+            self._entries[filters] = (time.monotonic() + self.ttl, count, exact)
+            self._entries.move_to_end(filters)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Forget every count after listings change"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+# Shared cache used by the listing endpoints
+listing_counts = ListingCountCache()
+
+
+def mark_listings_changed(session: Session):
+    """Clear the counts once this session's transaction commits"""
+    session.info["listings_changed"] = True
+
+
+# Counts are cleared after the commit, not before it: a request counting
+# in between would otherwise cache the old total
+@event.listens_for(Session, "after_commit")
+def invalidate_after_commit(session):
+    if session.info.pop("listings_changed", False):
+        listing_counts.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_rolled_back_changes(session):
+    session.info.pop("listings_changed", None)
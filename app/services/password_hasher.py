@@ -0,0 +1,109 @@
+"""
+Password hasher
+Runs bcrypt hashing and verification on a small dedicated thread pool so
+login/signup bursts cannot exhaust the threadpool shared by sync handlers.
+Work beyond the queue limit is rejected straight away with a 503.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from ..config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_LIMIT, PASSWORD_HASH_RETRY_AFTER
+from ..database import pwd_context
+
+
+class PasswordHasher:
+    """Bounded executor for bcrypt work with admission control"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS,
+                 queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT,
+                 retry_after: int = PASSWORD_HASH_RETRY_AFTER):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._pending = 0  # running + queued jobs
+        self._latencies = deque(maxlen=1000)  # seconds, most recent jobs
+        self.completed = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._pending - self.workers)
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self.workers + self.queue_limit:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many sign-in requests, please try again shortly",
+                    headers={"Retry-After": str(self.retry_after)}
+                )
+            self._pending += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def _release(self, started: float, future):
+        with self._lock:
+            self._pending -= 1
+            if not future.cancelled():
+                self.completed += 1
+                self._latencies.append(time.perf_counter() - started)
+
+    async def _run(self, fn, *args):
+        self._admit()
+        started = time.perf_counter()
+        future = self._executor.submit(fn, *args)
+        # Release the slot when the job ends, not when the caller stops
+        # waiting: a cancelled request (client gone) leaves its hash running
+        future.add_done_callback(lambda done: self._release(started, done))
+        return await asyncio.wrap_future(future)
+
+    async def hash(self, password: str) -> str:
+        """Hash a password for storing"""
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        """
+        Verify a password; returns (valid, new_hash) where new_hash is set
+        when the stored hash uses outdated settings and should be replaced.
+        """
+        return await self._run(pwd_context.verify_and_update, password, hashed_password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            pending = self._pending
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        return {
+            "workers": self.workers,
+            "queueLimit": self.queue_limit,
+            "inFlight": pending,
+            "queueDepth": max(0, pending - self.workers),
+            "maxQueueDepth": self.max_queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "latencyMs": {
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": latencies[-1] * 1000 if latencies else 0.0
+            }
+        }
+
+
+# Shared hasher for the auth endpoints
+password_hasher = PasswordHasher()
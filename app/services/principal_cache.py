@@ -0,0 +1,119 @@
+"""
+Principal cache
+Keeps read-only snapshots of authenticated users in process memory so the
+auth middleware does not have to query the users table on every request.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from ..config import PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_MAX_SIZE
+from ..models import User, UserRole
+
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """Detached, read-only snapshot of the fields handlers read from a user"""
+    id: str
+    name: str
+    email: str
+    phone: str
+    role: UserRole
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserPrincipal":
+        return cls(
+            id=user.id,
+            name=user.name,
+            email=user.email,
+            phone=user.phone,
+            role=user.role
+        )
+
+    @classmethod
+    def from_claims(cls, payload: dict) -> Optional["UserPrincipal"]:
+        """Build a principal from a claims-carrying access token, if it is one"""
+        if "role" not in payload:
+            return None
+        try:
+            role = UserRole(payload["role"])
+        except ValueError:
+            return None
+        return cls(
+            id=payload["sub"],
+            name=payload.get("name", ""),
+            email=payload.get("email", ""),
+            phone=payload.get("phone", ""),
+            role=role
+        )
+
+
+class PrincipalCache:
+    """Thread-safe LRU cache of user principals with a per-entry TTL"""
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_size: int = PRINCIPAL_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # user_id -> (expires_at, principal)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str) -> Optional[UserPrincipal]:
+        """Return the cached principal for a user, or None if absent or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, principal = entry
+            if expires_at <= now:
+                del self._entries[user_id]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return principal
+
+    def set(self, principal: UserPrincipal):
+        """Store a principal, evicting the least recently used entries if full"""
+        with self._lock:
+            self._entries[principal.id] = (
+                time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        """Drop a user's cached principal after their record changes"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+# Shared cache used by the auth middleware
+principal_cache = PrincipalCache()
@@ -0,0 +1,178 @@
+"""
+Product images
+Keeps the product rows of the attachments table in step with the image
+directories. Uploads, imports and the dataset generator write files to
+disk and then call sync_images in their transaction, which records each
+file's position, size and primary flag; every image list is then read
+from the table, one query for a whole page of products.
+
+    python -m scripts.rebuild_product_listing --images
+"""
+
+import os
+import struct
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Attachment, generate_uuid
+
+PUBLIC_DIR = "app/public"
+IMAGES_DIR = "app/public/images/products"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+
+# JPEG start-of-frame markers, the segments that carry the image size
+JPEG_FRAMES = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+               0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def image_size(file) -> tuple:
+    """(width, height) from a PNG, GIF, WebP or JPEG header, else (None, None)"""
+    head = file.read(30)
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+        return struct.unpack(">II", head[16:24])
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return struct.unpack("<HH", head[6:10])
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP" and len(head) == 30:
+        chunk = head[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", head[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(head[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return (int.from_bytes(head[24:27], "little") + 1,
+                    int.from_bytes(head[27:30], "little") + 1)
+    if head[:2] == b"\xff\xd8":
+        # Walk the segments up to the first frame header
+        file.seek(2)
+        while (marker := file.read(2)) and len(marker) == 2 and marker[0] == 0xFF:
+            segment = file.read(7)
+            if len(segment) < 7:
+                break
+            if marker[1] in JPEG_FRAMES:
+                _, _, height, width = struct.unpack(">HBHH", segment)
+                return width, height
+            file.seek(struct.unpack(">H", segment[:2])[0] - 7, os.SEEK_CUR)
+    return None, None
+
+
+def scan_images(product_id: str) -> list:
+    """The image files in the product's directory, oldest first"""
+    server_dir = os.path.join(IMAGES_DIR, product_id)
+    try:
+        entries = [entry for entry in os.scandir(server_dir)
+                   if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)]
+    except FileNotFoundError:
+        return []
+    entries.sort(key=lambda entry: (entry.stat().st_mtime, entry.name))
+    return entries
+
+
+def image_values(product_id: str, entry) -> dict:
+    """Attachment column values for an image file"""
+    try:
+        with open(entry.path, "rb") as file:
+            width, height = image_size(file)
+    except (OSError, struct.error):
+        width, height = None, None
+    return {
+        "id": generate_uuid(),
+        "product_id": product_id,
+        "type": "image",
+        "path": os.path.relpath(entry.path, PUBLIC_DIR).replace(os.sep, "/"),
+        "width": width,
+        "height": height,
+        "bytes": entry.stat().st_size,
+    }
+
+
+def sync_images(conn, product_ids) -> int:
+    """
+    Bring the products' attachment rows in line with their image
+    directories. Rows of deleted files go, kept rows keep their order and
+    new files follow them, oldest first; the first image is the primary
+    one. Returns the number of images the products now have.
+    """
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return 0
+    existing = {}
+    for row in conn.execute(
+            select(Attachment.id, Attachment.product_id, Attachment.path,
+                   Attachment.position, Attachment.is_primary)
+            .where(Attachment.product_id.in_(product_ids), Attachment.type == "image")
+            .order_by(Attachment.product_id, Attachment.position)):
+        existing.setdefault(row.product_id, []).append(row)
+
+    removed, moved, added = [], [], []
+    for product_id in product_ids:
+        files = {}
+        for entry in scan_images(product_id):
+            files[os.path.relpath(entry.path, PUBLIC_DIR).replace(os.sep, "/")] = entry
+        position = 0
+        for row in existing.get(product_id, []):
+            if files.pop(row.path, None) is None:
+                removed.append(row.id)
+                continue
+            if (row.position, row.is_primary) != (position, position == 0):
+                moved.append({"attachment_id": row.id, "new_position": position,
+                              "new_primary": position == 0})
+            position += 1
+        for entry in files.values():
+            added.append({**image_values(product_id, entry),
+                          "position": position, "is_primary": position == 0})
+            position += 1
+
+    if removed:
+        conn.execute(delete(Attachment).where(Attachment.id.in_(removed)))
+    if moved:
+        conn.execute(
+            update(Attachment.__table__)
+            .where(Attachment.__table__.c.id == bindparam("attachment_id"))
+            .values(position=bindparam("new_position"), is_primary=bindparam("new_primary")),
+            moved
+        )
+    if added:
+        conn.execute(insert(Attachment), added)
+    return sum(len(rows) for rows in existing.values()) - len(removed) + len(added)
+
+
+def images_query(product_ids):
+    return select(Attachment.product_id, Attachment.path).where(
+        Attachment.product_id.in_(list(product_ids)),
+        Attachment.type == "image"
+    ).order_by(Attachment.product_id, Attachment.position)
+
+
+def group_images(rows) -> dict:
+    """Static image URLs by product id, primary first"""
+    images = {}
+    for product_id, path in rows:
+        images.setdefault(product_id, []).append(f"/static/{path}")
+    return images
+
+
+def load_images(conn, product_ids) -> dict:
+    """Image URLs of these products in one query"""
+    return group_images(conn.execute(images_query(product_ids))) if product_ids else {}
+
+
+async def images_by_product(db: AsyncSession, product_ids) -> dict:
+    """load_images for an async session"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    return group_images(await db.execute(images_query(product_ids)))
+
+
+async def sync_product_images(db: AsyncSession, product_ids):
+    """sync_images inside an async session's transaction"""
+    await db.flush()
+    await db.run_sync(lambda session: sync_images(session.connection(), product_ids))
+
+
+async def remove_product_images(db: AsyncSession, product_id: str):
+    """Drop a product's attachment rows ahead of deleting the product"""
+    await db.execute(delete(Attachment).where(Attachment.product_id == product_id))
@@ -0,0 +1,253 @@
+"""
+Bulk product import
+Streams a CSV or JSONL catalog, validates each row against categories
+loaded once up front, and inserts the valid rows in batched executemany
+transactions. Images come from an optional zip, named per row.
+
+CSV columns (JSONL objects use the same keys):
+    title, description, type (Sale/Auction), category (id or title),
+    base_price, weight, length, width, height,
+    images (file names in the zip, separated by ";"; a list in JSONL)
+"""
+
+import asyncio
+import codecs
+import csv
+import json
+import math
+import os
+import time
+import uuid
+import zipfile
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import (
+    PRODUCT_IMPORT_BATCH_SIZE,
+    PRODUCT_IMPORT_MAX_ROWS,
+    PRODUCT_IMPORT_ZIP_MAX_BYTES,
+    PRODUCT_IMPORT_ZIP_MAX_ENTRIES,
+)
+from app.models import Category, Product, ProductType, generate_uuid
+from app.services.product_images import sync_product_images
+from app.services.product_listing import refresh_listings
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+DIMENSIONS = ("weight", "length", "width", "height")
+
+
+def read_rows(file, filename: str):
+    """Yield (row number, dict) from an uploaded CSV or JSONL file"""
+    text = codecs.getreader("utf-8-sig")(file)
+    if filename.lower().endswith(".csv"):
+        # Row 1 is the header
+        for line_number, row in enumerate(csv.DictReader(text), start=2):
+            yield line_number, row
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def number(row: dict, field: str, required: bool = False):
+    value = row.get(field)
+    if value is None or str(value).strip() == "":
+        if required:
+            raise ValueError(f"{field} is required")
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        value = None
+    if value is None or not math.isfinite(value):
+        raise ValueError(f"{field} must be a number")
+    if value < 0:
+        raise ValueError(f"{field} must not be negative")
+    return value
+
+
+def text(row: dict, field: str) -> str:
+    value = row.get(field)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be text")
+    return value.strip()
+
+
+def image_names(row: dict) -> list:
+    names = row.get("images") or []
+    if isinstance(names, str):
+        return [name.strip() for name in names.split(";") if name.strip()]
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise ValueError("images must be a list of file names")
+    return names
+
+
+def parse_row(row, categories: dict, images: dict) -> tuple:
+    """Product column values and image names for a row, or ValueError"""
+    if row is None:
+        raise ValueError("not a JSON object")
+
+    title = text(row, "title")
+    if not title:
+        raise ValueError("title is required")
+
+    product_type = ProductType.__members__.get(
+        str(row.get("type") or "").strip().upper())
+    if not product_type:
+        raise ValueError("type must be Sale or Auction")
+
+    category = str(row.get("category") or row.get("category_id") or "").strip()
+    category_id = categories.get(category) or categories.get(category.lower())
+    if not category_id:
+        raise ValueError(f"unknown category: {category or '(blank)'}")
+
+    base_price = number(row, "base_price", required=True)
+    if not base_price:
+        raise ValueError("base_price must be greater than 0")
+
+    names = image_names(row)
+    for name in names:
+        if name not in images:
+            raise ValueError(f"image not in the zip: {name}")
+
+    values = {
+        "title": title,
+        "description": text(row, "description") or None,
+        "type": product_type,
+        "category_id": category_id,
+        "base_price": base_price,
+        **{field: number(row, field) for field in DIMENSIONS},
+    }
+    return values, names
+
+
+def check_images_zip(archive: zipfile.ZipFile):
+    """
+    Raise ValueError if the zip is over the entry or uncompressed size
+    limits. Reads are capped at each member's declared size, so checking the
+    central directory before extracting bounds what an import writes.
+    """
+    members = archive.infolist()
+    if len(members) > PRODUCT_IMPORT_ZIP_MAX_ENTRIES:
+        raise ValueError(
+            f"Images zip has more than {PRODUCT_IMPORT_ZIP_MAX_ENTRIES} files")
+    if sum(info.file_size for info in members) > PRODUCT_IMPORT_ZIP_MAX_BYTES:
+        raise ValueError(
+            f"Images zip is over {PRODUCT_IMPORT_ZIP_MAX_BYTES // (1024 * 1024)} MB uncompressed")
+
+
+def open_images(file) -> tuple:
+    """The zip and its image members by file name (folders ignored)"""
+    archive = zipfile.ZipFile(file)
+    check_images_zip(archive)
+    images = {}
+    for info in archive.infolist():
+        name = os.path.basename(info.filename)
+        if not info.is_dir() and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+            images[name] = info
+    return archive, images
+
+
+def save_images(archive, images: dict, product_images: list):
+    """Extract each product's images into its images directory"""
+    for product_id, names in product_images:
+        product_images_dir = f"app/public/images/products/{product_id}"
+        os.makedirs(product_images_dir, exist_ok=True)
+        for name in names:
+            filename = f"{uuid.uuid4()}{os.path.splitext(name)[1].lower()}"
+            with archive.open(images[name]) as source, \
+                    open(f"{product_images_dir}/{filename}", "wb") as target:
+                while chunk := source.read(1024 * 1024):
+                    target.write(chunk)
+
+
+async def load_categories(db: AsyncSession) -> dict:
+    """Category ids keyed by id and by lower-cased title"""
+    categories = {}
+    for category_id, title in await db.execute(select(Category.id, Category.title)):
+        categories[category_id] = category_id
+        categories.setdefault(title.strip().lower(), category_id)
+    return categories
+
+
+async def import_products(db: AsyncSession, user_id: str, rows, images_file=None) -> dict:
+    """
+    Insert the valid rows as products of user_id, PRODUCT_IMPORT_BATCH_SIZE
+    per transaction. Returns counts, per-row errors and throughput.
+    """
+    start = time.perf_counter()
+    categories = await load_categories(db)
+    archive, images = open_images(images_file) if images_file else (None, {})
+
+    imported = 0
+    errors = []
+    batch = []  # (row number, values, image names)
+
+    async def flush():
+        nonlocal imported
+        try:
+            await db.execute(insert(Product), [values for _, values, _ in batch])
+            await refresh_listings(db, [values["id"] for _, values, _ in batch])
+            await db.commit()
+        except SQLAlchemyError as e:
+            await db.rollback()
+            print(f"Product import batch failed: {e}")
+            errors.extend({"row": row_number, "error": "could not be saved"}
+                          for row_number, _, _ in batch)
+        else:
+            imported += len(batch)
+            product_images = [(values["id"], names)
+                              for _, values, names in batch if names]
+            if product_images:
+                await asyncio.to_thread(save_images, archive, images, product_images)
+                # Record the new images and pick them up in the listing rows
+                product_ids = [product_id for product_id, _ in product_images]
+                await sync_product_images(db, product_ids)
+                await refresh_listings(db, product_ids)
+                await db.commit()
+        batch.clear()
+
+    rows_read = 0
+    truncated = False
+    for row_number, row in rows:
+        if rows_read == PRODUCT_IMPORT_MAX_ROWS:
+            truncated = True
+            break
+        rows_read += 1
+        try:
+            values, names = parse_row(row, categories, images)
+        except ValueError as e:
+            errors.append({"row": row_number, "error": str(e)})
+            continue
+
+        values.update(id=generate_uuid(), user_id=user_id)
+        batch.append((row_number, values, names))
+        if len(batch) >= PRODUCT_IMPORT_BATCH_SIZE:
+            await flush()
+
+    if batch:
+        await flush()
+    if archive:
+        archive.close()
+
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows_read,
+        "imported": imported,
+        "failed": len(errors),
+        "errors": errors,
+        # Rows past PRODUCT_IMPORT_MAX_ROWS were not read
+        "truncated": truncated,
+        "seconds": round(seconds, 3),
+        "rowsPerSecond": round(rows_read / seconds) if seconds else None,
+    }
@@ -0,0 +1,388 @@
+"""
+Product listing
+Maintains product_listing, the denormalized copy of each product with its
+category, images and aggregates that every listing endpoint reads. Product,
+category and image changes refresh the affected rows (images are copied
+from the attachments table, so sync those first); bids, orders and ratings
+bump them through app.services.product_stats. Everything runs in the
+caller's transaction.
+
+    python -m scripts.rebuild_product_listing
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import CURSOR_SECRET, LISTING_COUNT_ESTIMATE_CAP
+from app.models import Category, Product, ProductListing, ProductType
+from app.services.listing_counts import listing_counts, mark_listings_changed
+from app.services.product_images import load_images
+from app.services.product_search import (
+    full_text_search, has_full_text, highlighted, match_expression, search_rank,
+    substring_search
+)
+
+# Popularity is linear in the counts so bids, orders and ratings can bump
+# it with a single UPDATE
+ORDER_WEIGHT = 5
+RATING_WEIGHT = 2
+BID_WEIGHT = 1
+
+
+def popularity(order_count, bid_count, rating_count):
+    """Works on numbers and on columns alike"""
+    return order_count * ORDER_WEIGHT + bid_count * BID_WEIGHT + rating_count * RATING_WEIGHT
+
+
+def listing_row(product, images: list) -> dict:
+    """A listing row from a listing_source() row and its image URLs"""
+    return {
+        "product_id": product.id,
+        "user_id": product.user_id,
+        "category_id": product.category_id,
+        "type": product.type,
+        "title": product.title,
+        "description": product.description,
+        "base_price": product.base_price,
+        "weight": product.weight,
+        "length": product.length,
+        "width": product.width,
+        "height": product.height,
+        "created_at": product.created_at,
+        "category_title": product.category_title,
+        "category_icon": product.category_icon,
+        "images": images,
+        "primary_image": images[0] if images else None,
+        "current_bid": (product.highest_bid or product.base_price)
+        if product.type == ProductType.AUCTION else None,
+        "bid_count": product.bid_count or 0,
+        "rating_avg": product.rating_avg,
+        "rating_count": product.rating_count or 0,
+        "order_count": product.order_count or 0,
+        "popularity": popularity(product.order_count or 0, product.bid_count or 0,
+                                 product.rating_count or 0),
+    }
+
+
+def listing_source():
+    return select(
+        Product.__table__,
+        Category.title.label("category_title"),
+        Category.icon.label("category_icon")
+    ).outerjoin(Category, Category.id == Product.category_id)
+
+
+# Listing sorts: the sort column and whether it runs high to low. Each is
+# served by a (type | category_id, type) index ending in the product id,
+# which breaks ties so a cursor names an exact position. Ranked searches
+# also sort by relevance, their BM25 score.
+LISTING_SORTS = {
+    "newest": (ProductListing.created_at, True),
+    "price_low": (ProductListing.base_price, False),
+    "price_high": (ProductListing.base_price, True),
+    "popular": (ProductListing.popularity, True),
+}
+
+
+def listing_sort(sort: Optional[str], ranked: bool = False) -> str:
+    """
+    The sort to use: relevance for ranked searches and newest otherwise
+    when none is given, or when the one given is unknown or needs a
+    ranked search.
+    """
+    if sort in LISTING_SORTS or (sort == "relevance" and ranked):
+        return sort
+    return "relevance" if ranked else "newest"
+
+
+def sort_key(sort: str) -> tuple:
+    """(expression, descending) a resolved sort orders by"""
+    if sort == "relevance":
+        return search_rank(), False
+    return LISTING_SORTS[sort]
+
+
+def listing_query(product_type: ProductType = None, category_id: str = None,
+                  search: str = None, min_price: float = None, max_price: float = None,
+                  sort: str = None, full_text: bool = False):
+    """
+    Filtered and sorted select of listing rows, ready to count or page.
+    With full_text (see has_full_text), a search runs on the FTS5 index
+    and adds search_rank, title_highlight and description_snippet columns
+    to each row.
+    """
+    query = select(ProductListing)
+    if product_type:
+        query = query.where(ProductListing.type == product_type)
+    if category_id:
+        query = query.where(ProductListing.category_id == category_id)
+    ranked = False
+    if search:
+        searched = full_text_search(query, search) if full_text else None
+        ranked = searched is not None
+        query = searched if ranked else substring_search(query, search)
+    if min_price is not None:
+        query = query.where(ProductListing.base_price >= min_price)
+    if max_price is not None:
+        query = query.where(ProductListing.base_price <= max_price)
+
+    key, descending = sort_key(listing_sort(sort, ranked))
+    if descending:
+        return query.order_by(key.desc(), ProductListing.product_id.desc())
+    return query.order_by(key.asc(), ProductListing.product_id.asc())
+
+
+def b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def sign_cursor(payload: bytes) -> bytes:
+    return hmac.new(CURSOR_SECRET.encode(), payload, hashlib.sha256).digest()[:16]
+
+
+def encode_cursor(sort: str, key, product_id: str, filters: "ListingFilters") -> str:
+    """
+    Signed token for the position just after (sort key, product id) in
+    the listing narrowed to filters
+    """
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    payload = json.dumps([sort, key, product_id, filters.signature()],
+                         separators=(",", ":")).encode()
+    return f"{b64encode(payload)}.{b64encode(sign_cursor(payload))}"
+
+
+def read_cursor(cursor: str) -> list:
+    """The payload of a token this server signed, or ValueError"""
+    try:
+        payload, signature = (b64decode(part) for part in cursor.split("."))
+        if hmac.compare_digest(sign_cursor(payload), signature):
+            return json.loads(payload)
+    except (ValueError, binascii.Error):
+        pass
+    raise ValueError("Invalid cursor")
+
+
+def is_signed_cursor(cursor: str) -> bool:
+    try:
+        read_cursor(cursor)
+    except ValueError:
+        return False
+    return True
+
+
+def decode_cursor(sort: str, cursor: str, filters: "ListingFilters") -> tuple:
+    """(sort key, product id) from a token, or ValueError"""
+    payload = read_cursor(cursor)
+    if not isinstance(payload, list) or len(payload) != 4:
+        raise ValueError("Invalid cursor")
+    cursor_sort, key, product_id, signature = payload
+    if cursor_sort != sort:
+        raise ValueError("Cursor is for a different sort order")
+    if signature != filters.signature():
+        raise ValueError("Cursor is for a different listing")
+
+    # The key must be of the sort column's type: a timestamp for newest,
+    # a number for prices, popularity and relevance
+    if not isinstance(product_id, str):
+        raise ValueError("Invalid cursor")
+    if sort == "newest":
+        try:
+            key = datetime.fromisoformat(key)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+    elif isinstance(key, bool) or not isinstance(key, (int, float)):
+        raise ValueError("Invalid cursor")
+    return key, product_id
+
+
+def after_cursor(query, sort: str, cursor: str, filters: "ListingFilters"):
+    """Narrow a listing_query to the rows after the cursor, an index seek"""
+    key, descending = sort_key(sort)
+    cursor_key, product_id = decode_cursor(sort, cursor, filters)
+    position = tuple_(key, ProductListing.product_id)
+    if descending:
+        return query.where(position < (cursor_key, product_id))
+    return query.where(position > (cursor_key, product_id))
+
+
+@dataclass(frozen=True)
+class ListingFilters:
+    """
+    What a listing is narrowed to; the sort and the page are separate.
+    Blank values count as unset and the search has its whitespace
+    collapsed, so filters matching the same rows compare equal.
+    """
+    product_type: Optional[ProductType] = None
+    category_id: Optional[str] = None
+    search: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+
+    def __post_init__(self):
+        object.__setattr__(self, "category_id", self.category_id or None)
+        object.__setattr__(self, "search", " ".join((self.search or "").split()) or None)
+
+    def signature(self) -> str:
+        """Short digest of the filters, binding cursors to their listing"""
+        return hashlib.sha256(repr(self).encode()).hexdigest()[:16]
+
+    def ranked(self, full_text: bool) -> bool:
+        """Whether the search runs on the full-text index, with relevance"""
+        return bool(full_text and self.search and match_expression(self.search))
+
+    def query(self, sort: str = None, full_text: bool = False):
+        return listing_query(self.product_type, self.category_id, self.search,
+                             self.min_price, self.max_price, sort, full_text)
+
+
+@dataclass
+class ListingPage:
+    listings: list
+    total: Optional[int]  # None with count=none
+    exact: bool  # whether total is the exact count
+    next_cursor: Optional[str]  # None on the last page
+    highlights: dict  # product id -> highlighted title and description, when ranked
+
+
+async def count_listings(db: AsyncSession, filters: ListingFilters, query,
+                         mode: str = "exact") -> tuple:
+    """
+    (total, exact) for a listing, from the cache when it can be:
+    exact counts every matching row, estimate stops counting at
+    LISTING_COUNT_ESTIMATE_CAP rows (exact if fewer match), none skips it.
+    """
+    if mode == "none":
+        return None, False
+    cached = listing_counts.get(filters, exact=mode == "exact")
+    if cached:
+        return cached
+
+    generation = listing_counts.generation
+    matching = query.order_by(None)
+    exact = mode == "exact"
+    if not exact:
+        matching = matching.limit(LISTING_COUNT_ESTIMATE_CAP + 1)
+    total = await db.scalar(select(func.count()).select_from(matching.subquery()))
+    if not exact:
+        exact = total <= LISTING_COUNT_ESTIMATE_CAP
+        total = min(total, LISTING_COUNT_ESTIMATE_CAP)
+    listing_counts.set(filters, total, exact, generation)
+    return total, exact
+
+
+async def page_listings(db: AsyncSession, filters: ListingFilters, sort: Optional[str],
+                        limit: int, page: int = 1, cursor: str = None,
+                        count: str = "exact") -> ListingPage:
+    """
+    One page of a listing: the rows after the cursor when one is given,
+    else page number page. See count_listings for the count modes.
+    """
+    # The read session may be on another database than the writer
+    full_text = has_full_text(db)
+    ranked = filters.ranked(full_text)
+    sort = listing_sort(sort, ranked)
+    query = filters.query(sort, full_text)
+    # A bad cursor fails before the count runs
+    paged = after_cursor(query, sort, cursor, filters) if cursor else \
+        query.offset((page - 1) * limit)
+    total, exact = await count_listings(db, filters, query, count)
+
+    # One row past the page says whether there is a next one
+    rows = (await db.execute(paged.limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        key = last.search_rank if sort == "relevance" else getattr(
+            last[0], LISTING_SORTS[sort][0].key)
+        next_cursor = encode_cursor(sort, key, last[0].product_id, filters)
+    rows = rows[:limit]
+
+    highlights = {}
+    if ranked:
+        highlights = {row[0].product_id: {
+            "title": highlighted(row.title_highlight),
+            "description": highlighted(row.description_snippet),
+        } for row in rows}
+    return ListingPage([row[0] for row in rows], total, exact, next_cursor, highlights)
+
+
+def refresh_listing(conn, product_ids) -> int:
+    """
+    Rewrite the listing rows of these products from the products table and
+    their image directories; products that no longer exist lose their row.
+    """
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return 0
+    images = load_images(conn, product_ids)
+    rows = [listing_row(product, images.get(product.id, [])) for product in conn.execute(
+        listing_source().where(Product.id.in_(product_ids)))]
+    conn.execute(delete(ProductListing).where(ProductListing.product_id.in_(product_ids)))
+    if rows:
+        conn.execute(insert(ProductListing), rows)
+    return len(rows)
+
+
+def rebuild_listing(conn, batch_size: int = 2000) -> int:
+    """Rebuild the whole table, batch_size products at a time"""
+    conn.execute(delete(ProductListing))
+    total = 0
+    last_id = ""
+    while True:
+        batch = conn.execute(
+            listing_source().where(Product.id > last_id).order_by(Product.id).limit(batch_size)
+        ).all()
+        if not batch:
+            return total
+        images = load_images(conn, [product.id for product in batch])
+        conn.execute(insert(ProductListing), [
+            listing_row(product, images.get(product.id, [])) for product in batch])
+        total += len(batch)
+        last_id = batch[-1].id
+
+
+def refresh_category(conn, category_id: str):
+    """Copy a category's title and icon onto its products' rows"""
+    conn.execute(
+        update(ProductListing)
+        .where(ProductListing.category_id == category_id)
+        .values(
+            category_title=select(Category.title).where(Category.id == category_id).scalar_subquery(),
+            category_icon=select(Category.icon).where(Category.id == category_id).scalar_subquery()
+        )
+    )
+
+
+async def refresh_listings(db: AsyncSession, product_ids):
+    """refresh_listing inside an async session's transaction"""
+    # Flush first so the rows read back include pending product changes
+    await db.flush()
+    await db.run_sync(lambda session: refresh_listing(session.connection(), product_ids))
+    mark_listings_changed(db.sync_session)
+
+
+async def remove_listings(db: AsyncSession, product_ids):
+    """Drop listing rows ahead of deleting their products"""
+    await db.execute(delete(ProductListing).where(ProductListing.product_id.in_(list(product_ids))))
+    mark_listings_changed(db.sync_session)
+
+
+async def refresh_category_listings(db: AsyncSession, category_id: str):
+    """refresh_category inside an async session's transaction"""
+    await db.flush()
+    await db.run_sync(lambda session: refresh_category(session.connection(), category_id))
+    mark_listings_changed(db.sync_session)
@@ -0,0 +1,78 @@
+"""
+Product search
+Full-text search for the listing endpoints. On SQLite, product_search is
+an FTS5 index of each product_listing row's title, description and
+category title, kept current by triggers on product_listing (see
+app.models), so every listing write updates it in the same transaction.
+Every word of a search must match the start of a word in the product;
+results rank by BM25 with title matches weighted highest and come with
+highlighted titles and description snippets. Other databases fall back
+to a case-insensitive substring match without ranking.
+"""
+
+import html
+import re
+from typing import Optional
+
+from sqlalchemy import column, func, literal_column, table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import ProductListing
+
+search_table = table("product_search", column("rowid"))
+SEARCH_TABLE = literal_column("product_search")
+
+# BM25 weights of the title, description and category title columns
+SEARCH_WEIGHTS = (10.0, 1.0, 4.0)
+
+# Highlight markers, swapped for <mark> tags once the text is escaped
+MARK_START, MARK_END = "\x02", "\x03"
+SNIPPET_WORDS = 16
+
+
+def has_full_text(db: AsyncSession) -> bool:
+    """Whether the database this session reads from has the FTS5 index"""
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def match_expression(search: str) -> Optional[str]:
+    """An FTS5 query matching every word of the search as a prefix, or None"""
+    words = re.findall(r"\w+", search)
+    return " ".join(f'"{word}"*' for word in words) or None
+
+
+def search_rank():
+    """BM25 score of the matched row; lower is more relevant"""
+    return func.bm25(SEARCH_TABLE, *SEARCH_WEIGHTS)
+
+
+def full_text_search(query, search: str):
+    """
+    Narrow a select of ProductListing to rows matching the search, adding
+    search_rank, title_highlight and description_snippet columns. Returns
+    None when the search has no words to match.
+    """
+    match = match_expression(search)
+    if not match:
+        return None
+    return query.add_columns(
+        search_rank().label("search_rank"),
+        func.highlight(SEARCH_TABLE, 0, MARK_START, MARK_END).label("title_highlight"),
+        func.snippet(SEARCH_TABLE, 1, MARK_START, MARK_END, "…",
+                     SNIPPET_WORDS).label("description_snippet"),
+    ).join(
+        search_table, search_table.c.rowid == ProductListing.id
+    ).where(SEARCH_TABLE.op("MATCH")(match))
+
+
+def substring_search(query, search: str):
+    search_term = f"%{search}%"
+    return query.where(ProductListing.title.ilike(search_term) |
+                       ProductListing.description.ilike(search_term))
+
+
+def highlighted(text: Optional[str]) -> Optional[str]:
+    """HTML-escape FTS5 output, then turn its markers into <mark> tags"""
+    if text is None:
+        return None
+    return html.escape(text).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
@@ -0,0 +1,163 @@
+"""
+Product aggregates
+Keeps the denormalized bid and order columns on products current.
+The write helpers run inside the caller's transaction, so the aggregate
+commits (or rolls back) together with the row it describes, and the
+product's product_listing row is bumped alongside. repair()
+recomputes everything from the source tables, archived rows included,
+and is what fills in the rating columns: the app has no rating write
+path yet.
+
+    python -m scripts.repair_product_stats [--check]
+"""
+
+from sqlalchemy import case, desc, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import (
+    ArchivedBid, ArchivedOrderItem, Bid, OrderItem, Product, ProductListing, ProductType, Rating
+)
+from app.services.product_listing import BID_WEIGHT, ORDER_WEIGHT, popularity
+
+# Aggregate refreshes are not edits, so leave updated_at alone
+KEEP_UPDATED_AT = {"updated_at": Product.updated_at}
+
+
+async def place_bid(db: AsyncSession, product_id: str, user_id: str, bid_price: float):
+    """
+    Record a bid if it beats the current highest bid (or the base price).
+    The check and the update are one conditional UPDATE, so two bidders
+    racing for the same price cannot both win. Returns the new bid count,
+    or None when the bid was too low.
+    """
+    result = await db.execute(
+        update(Product)
+        .where(
+            Product.id == product_id,
+            Product.type == ProductType.AUCTION,
+            func.coalesce(Product.highest_bid, Product.base_price) < bid_price
+        )
+        .values(
+            highest_bid=bid_price,
+            highest_bidder_id=user_id,
+            bid_count=Product.bid_count + 1,
+            **KEEP_UPDATED_AT
+        )
+        .returning(Product.bid_count)
+    )
+    bid_count = result.scalar()
+    if bid_count is None:
+        return None
+
+    db.add(Bid(product_id=product_id, user_id=user_id, bid_price=bid_price))
+    await db.execute(
+        update(ProductListing)
+        .where(ProductListing.product_id == product_id)
+        .values(
+            current_bid=bid_price,
+            bid_count=ProductListing.bid_count + 1,
+            popularity=ProductListing.popularity + BID_WEIGHT
+        )
+    )
+    return bid_count
+
+
+async def record_orders(db: AsyncSession, product_ids):
+    """Count new order items, one per product id given"""
+    counts = {}
+    for product_id in product_ids:
+        counts[product_id] = counts.get(product_id, 0) + 1
+
+    for product_id, count in counts.items():
+        await db.execute(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(order_count=Product.order_count + count, **KEEP_UPDATED_AT)
+        )
+        await db.execute(
+            update(ProductListing)
+            .where(ProductListing.product_id == product_id)
+            .values(
+                order_count=ProductListing.order_count + count,
+                popularity=ProductListing.popularity + ORDER_WEIGHT * count
+            )
+        )
+
+
+# ------------------- Repair -------------------
+
+
+def aggregate_values() -> dict:
+    """
+    Correlated subqueries computing every aggregate from source rows. An
+    auction's bids are archived together, so its top bid is in one table.
+    """
+    def top_bid(model):
+        return (
+            select(model.bid_price, model.user_id)
+            .where(model.product_id == Product.id)
+            .order_by(desc(model.bid_price), model.created_at)
+            .limit(1)
+        )
+
+    def count(model):
+        return select(func.count(model.id)).where(model.product_id == Product.id).scalar_subquery()
+
+    product_ratings = (
+        select(Rating.rating)
+        .join(OrderItem, OrderItem.id == Rating.order_item_id)
+        .where(OrderItem.product_id == Product.id)
+    )
+    return {
+        "highest_bid": func.coalesce(
+            top_bid(Bid).with_only_columns(Bid.bid_price).scalar_subquery(),
+            top_bid(ArchivedBid).with_only_columns(ArchivedBid.bid_price).scalar_subquery()),
+        "highest_bidder_id": func.coalesce(
+            top_bid(Bid).with_only_columns(Bid.user_id).scalar_subquery(),
+            top_bid(ArchivedBid).with_only_columns(ArchivedBid.user_id).scalar_subquery()),
+        "bid_count": count(Bid) + count(ArchivedBid),
+        "rating_avg": product_ratings.with_only_columns(func.avg(Rating.rating)).scalar_subquery(),
+        "rating_count": product_ratings.with_only_columns(func.count(Rating.id)).scalar_subquery(),
+        "order_count": count(OrderItem) + count(ArchivedOrderItem),
+    }
+
+
+def repair(conn) -> int:
+    """Recompute the aggregates of every product; returns rows updated"""
+    result = conn.execute(
+        update(Product).values(**aggregate_values(), **KEEP_UPDATED_AT))
+    copy_to_listing(conn)
+    return result.rowcount
+
+
+def copy_to_listing(conn):
+    """Copy every product's aggregates onto its product_listing row"""
+    def column(expression):
+        return select(expression).where(Product.id == ProductListing.product_id).scalar_subquery()
+
+    conn.execute(update(ProductListing).values(
+        current_bid=case(
+            (ProductListing.type == ProductType.AUCTION,
+             column(func.coalesce(Product.highest_bid, Product.base_price))),
+            else_=None),
+        bid_count=column(Product.bid_count),
+        rating_avg=column(Product.rating_avg),
+        rating_count=column(Product.rating_count),
+        order_count=column(Product.order_count),
+        popularity=column(popularity(Product.order_count, Product.bid_count, Product.rating_count))
+    ))
+
+
+def find_drift(conn) -> list:
+    """Products whose stored aggregates disagree with the source tables"""
+    expected = aggregate_values()
+    columns = [getattr(Product, name) for name in expected]
+    query = select(Product.id, *columns, *expected.values()).where(or_(
+        func.coalesce(Product.highest_bid, -1) != func.coalesce(expected["highest_bid"], -1),
+        func.coalesce(Product.highest_bidder_id, "") != func.coalesce(expected["highest_bidder_id"], ""),
+        Product.bid_count != expected["bid_count"],
+        func.abs(func.coalesce(Product.rating_avg, 0) - func.coalesce(expected["rating_avg"], 0)) > 1e-9,
+        Product.rating_count != expected["rating_count"],
+        Product.order_count != expected["order_count"],
+    ))
+    return conn.execute(query).all()
@@ -8,6 +8,7 @@ import os
 import glob
 from typing import List, Dict, Any, Optional
 from fastapi import Depends
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
@@ -19,7 +20,7 @@ from langchain_community.vectorstores import FAISS
 from langchain.schema import Document
 from langchain_core.prompts import PromptTemplate
 
-from ..database import get_db
+from ..database import get_sync_db
 from ..models import Chat, Message, Category, Product
 
 # Configuration Constants
@@ -46,7 +47,7 @@ Always maintain a helpful, educational tone that celebrates Sri Lankan craftsman
 class VishvaService:
     """Service for Vishva AI Assistant functionality"""
 
-    def __init__(self, db: Session = Depends(get_db)):
+    def __init__(self, db: Session = Depends(get_sync_db)):
         """Initialize Vishva service with database session"""
         self.db = db
 
@@ -158,17 +159,30 @@ class VishvaService:
         """
         return self.db.query(Chat).filter(Chat.id == chat_id).first()
 
-    def get_chat_messages(self, chat_id: str) -> List[Message]:
+    def get_chat_messages(self, chat_id: str, before: Optional[str] = None,
+                          limit: Optional[int] = None) -> List[Message]:
         """
-        Get all messages for a chat
+        Get the messages of a chat, oldest first
 
         Args:
             chat_id: The ID of the chat
+            before: Only messages older than this message ID
+            limit: Only the latest this many of those messages
 
         Returns:
             List[Message]: List of message objects
         """
-        return self.db.query(Message).filter(Message.chat_id == chat_id).order_by(Message.created_at).all()
+        # Pages seek past the (created_at, id) of the before message
+        query = self.db.query(Message).filter(Message.chat_id == chat_id)
+        if before:
+            created_at = self.db.query(Message.created_at).filter(
+                Message.chat_id == chat_id, Message.id == before).scalar()
+            if created_at is None:
+                return []
+            query = query.filter(tuple_(Message.created_at, Message.id) < (created_at, before))
+        if not limit:
+            return query.order_by(Message.created_at, Message.id).all()
+        return query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit).all()[::-1]
 
     def update_chat_title(self, chat_id: str, title: str) -> Chat:
         """
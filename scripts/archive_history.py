@@ -0,0 +1,40 @@
+"""
+Move settled auction bids and long-closed orders into the history tables.
+
+The app does this in the background every ARCHIVE_INTERVAL seconds; run
+this after an upgrade or a bulk load to clear the backlog in one go, with
+the same batches and pause between them.
+
+    python -m scripts.archive_history
+    python -m scripts.archive_history --database sqlite:///./scale.db --pause 0
+"""
+
+import argparse
+import time
+
+from app.config import ARCHIVE_BATCH_PAUSE
+from app.database import DATABASE_URL, create_db_engine
+from app.migrations import run_migrations
+from app.services.archive import archive
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database", default=DATABASE_URL)
+    parser.add_argument("--pause", type=float, default=ARCHIVE_BATCH_PAUSE,
+                        help="seconds to wait between batches")
+    args = parser.parse_args()
+
+    engine = create_db_engine(args.database)
+    run_migrations(engine)
+    start = time.perf_counter()
+    try:
+        moved = archive(engine, pause=args.pause)
+    finally:
+        engine.dispose()
+    print(f"Archived {moved['bids']} bid(s) and {moved['orders']} order(s) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Latency under concurrent load: sync Session vs AsyncSession in async handlers.
+
+Runs the sale listing query (count, page, highest bid per product) behind
+an async endpoint, once on a blocking sync Session (how the handlers used
+to work) and once on an AsyncSession. A trivial /ping endpoint is hit
+alongside it every few milliseconds; its latency, measured from when the
+request was due, shows how long the event loop was blocked.
+Requests go straight through the ASGI interface (no sockets).
+
+    python -m scripts.bench_async_db --clients 32 --requests 100
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from fastapi import Depends, FastAPI
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import desc, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import create_async_db_engine, create_db_engine
+from app.models import Bid, Product, ProductType
+from scripts.bench_sqlite_concurrency import seed
+
+PING_INTERVAL = 0.005  # seconds
+
+
+def listing_query():
+    return select(Product).where(Product.type == ProductType.AUCTION)
+
+
+def highest_bid_query(product_id: str):
+    return (select(Bid.bid_price).where(Bid.product_id == product_id)
+            .order_by(desc(Bid.bid_price)).limit(1))
+
+
+def build_app(kind: str, path: str, pool_size: int) -> tuple:
+    """The app and the engine behind it"""
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return PlainTextResponse("pong")
+
+    if kind == "sync":
+        # One connection per client: a sync session waiting on an empty
+        # pool would block the loop that has to release the others
+        engine = create_db_engine(f"sqlite:///{path}", pool_size=pool_size)
+        SessionLocal = sessionmaker(bind=engine)
+
+        def get_db():
+            with SessionLocal() as db:
+                yield db
+
+        @app.get("/listing")
+        async def listing(db: Session = Depends(get_db)):
+            query = listing_query()
+            total = db.scalar(select(func.count()).select_from(query.subquery()))
+            page = db.scalars(query.order_by(
+                desc(Product.created_at)).limit(12)).all()
+            bids = [db.scalar(highest_bid_query(p.id)) for p in page]
+            return {"total": total, "bids": bids}
+    else:
+        engine = create_async_db_engine(
+            f"sqlite+aiosqlite:///{path}", pool_size=pool_size)
+        AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+        async def get_db():
+            async with AsyncSessionLocal() as db:
+                yield db
+
+        @app.get("/listing")
+        async def listing(db: AsyncSession = Depends(get_db)):
+            query = listing_query()
+            total = await db.scalar(select(func.count()).select_from(query.subquery()))
+            page = (await db.scalars(query.order_by(
+                desc(Product.created_at)).limit(12))).all()
+            bids = [await db.scalar(highest_bid_query(p.id)) for p in page]
+            return {"total": total, "bids": bids}
+
+    return app, engine
+
+
+def build_scope(path: str) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+
+async def call(app, path: str) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    await app(build_scope(path), receive, send)
+    return time.perf_counter() - start
+
+
+async def run(kind: str, path: str, clients: int, requests: int) -> dict:
+    app, engine = build_app(kind, path, clients)
+    latencies = {"/listing": [], "/ping": []}
+
+    async def client(path: str):
+        for _ in range(requests):
+            latencies[path].append(await call(app, path))
+
+    async def pinger():
+        loop = asyncio.get_running_loop()
+        for _ in range(requests):
+            due = loop.time() + PING_INTERVAL
+            await asyncio.sleep(PING_INTERVAL)
+            late = loop.time() - due
+            latencies["/ping"].append(late + await call(app, "/ping"))
+
+    # Warm up (builds the middleware stack and opens pooled connections)
+    for _ in range(20):
+        await call(app, "/listing")
+
+    # Three listing clients for every pinger
+    start = time.perf_counter()
+    await asyncio.gather(*(pinger() if i % 4 == 0 else client("/listing")
+                           for i in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    # aiosqlite connections run on worker threads that must be closed
+    if kind == "async":
+        await engine.dispose()
+    else:
+        engine.dispose()
+
+    return {
+        "rps": sum(len(v) for v in latencies.values()) / elapsed,
+        **{path: percentiles(values) for path, values in latencies.items()}
+    }
+
+
+def percentiles(values) -> tuple:
+    values = sorted(values)
+    cuts = statistics.quantiles(values, n=100)
+    return values[len(values) // 2] * 1000, cuts[98] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--products", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed_engine = create_db_engine(f"sqlite:///{path}")
+        seed(seed_engine, args.products)
+        seed_engine.dispose()
+
+        print(f"{'session':<8} {'req/s':>8} {'listing p50':>12} {'listing p99':>12} "
+              f"{'ping p50':>10} {'ping p99':>10}")
+        for kind in ("sync", "async"):
+            result = asyncio.run(
+                run(kind, path, args.clients, args.requests))
+            listing_p50, listing_p99 = result["/listing"]
+            ping_p50, ping_p99 = result["/ping"]
+            print(f"{kind:<8} {result['rps']:>8.0f} {listing_p50:>10.1f}ms "
+                  f"{listing_p99:>10.1f}ms {ping_p50:>8.1f}ms {ping_p99:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Microbenchmark: call_next auth middleware vs the pure ASGI AuthMiddleware.
+
+Drives each app directly through the ASGI interface (no sockets) on an
+endpoint that only reads the request's user, so the numbers isolate
+per-request middleware and token verification overhead. The bearer runs
+check first that the token was actually verified.
+
+    python -m scripts.bench_auth_middleware --requests 20000
+"""
+
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+
+from app.middleware.auth_middleware import AuthMiddleware, LazyPrincipal, get_static_prefixes
+from app.models import UserRole
+from app.services.auth_service import create_access_token
+from app.services.principal_cache import UserPrincipal
+
+BENCH_USER_ID = "bench-user"
+
+
+async def call_next_auth_middleware(request: Request, call_next):
+    """The BaseHTTPMiddleware-style middleware AuthMiddleware replaced, as the baseline"""
+    # Static assets never need a user
+    if request.url.path.startswith(get_static_prefixes(request.app)):
+        return await call_next(request)
+
+    # Extract token from headers if present
+    authorization = request.headers.get("Authorization")
+
+    request.state.user = None
+
+    if authorization and authorization.startswith("Bearer "):
+        token = authorization.replace("Bearer ", "")
+
+        # Resolved on first access by a handler
+        request.state.user = LazyPrincipal(
+            token, getattr(request.state, "db_sessions", None))
+
+    # Continue processing the request
+    response = await call_next(request)
+    return response
+
+
+def build_app(kind: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping(request: Request):
+        # Claims-carrying tokens resolve without a database lookup
+        user = request.scope.get("state", {}).get("user")
+        if isinstance(user, LazyPrincipal):
+            user = user.resolve()
+        return PlainTextResponse(user.id if user else "anonymous")
+
+    if kind == "call_next":
+        app.middleware("http")(call_next_auth_middleware)
+    elif kind == "asgi":
+        app.add_middleware(AuthMiddleware)
+    return app
+
+
+def build_scope(token: str = None) -> dict:
+    headers = [(b"host", b"bench")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/ping",
+        "raw_path": b"/ping",
+        "root_path": "",
+        "query_string": b"",
+        "headers": headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+
+async def run(app, requests: int, token: str = None, expected: str = None) -> float:
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    # Check the request is answered as the expected user
+    await app(build_scope(token), receive, send)
+    answer = b"".join(body).decode()
+    if expected and answer != expected:
+        raise SystemExit(f"expected the response for {expected!r}, got {answer!r}")
+
+    async def discard(message):
+        pass
+
+    # Warm up (builds the middleware stack and route caches)
+    for _ in range(200):
+        await app(build_scope(token), receive, discard)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(build_scope(token), receive, discard)
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = create_access_token(UserPrincipal(
+        id=BENCH_USER_ID,
+        name="Bench User",
+        email="bench@example.com",
+        phone="0000000000",
+        role=UserRole.BUYER
+    ))
+
+    print(f"{'middleware':<12} {'auth':<10} {'req/s':>10}")
+    for auth in ("anonymous", "bearer"):
+        results = {}
+        for kind in ("none", "call_next", "asgi"):
+            bearer = auth == "bearer"
+            expected = BENCH_USER_ID if bearer and kind != "none" else "anonymous"
+            rps = asyncio.run(run(build_app(kind), args.requests,
+                                  token if bearer else None, expected))
+            results[kind] = rps
+            print(f"{kind:<12} {auth:<10} {rps:>10.0f}")
+        gain = results["asgi"] / results["call_next"] - 1
+        print(f"asgi vs call_next ({auth}): {gain:+.1%}")
+
+
+if __name__ == "__main__":
+    main()
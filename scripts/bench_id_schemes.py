@@ -0,0 +1,86 @@
+"""
+Insert throughput on SQLite: random (uuid4) vs time-ordered (uuid7) ids.
+
+Inserts bids in small committed batches, the way the auction socket writes
+them, into a table already holding --existing rows, once per id scheme.
+Random ids land all over the primary key index, so once it outgrows the
+page cache (kept small here with --cache-kib) most inserts touch a page
+that is not in memory; time-ordered ids append to its right edge.
+
+    python -m scripts.bench_id_schemes --existing 200000 --rows 20000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import event, insert
+
+from app.database import create_db_engine
+from app.models import Bid, uuid7
+from scripts.bench_sqlite_concurrency import seed
+
+SCHEMES = {
+    "uuid4": lambda: str(uuid.uuid4()),
+    "uuid7": uuid7,
+}
+
+
+def insert_bids(engine, new_id, buyer_id, auction_ids, rows: int, batch: int) -> float:
+    """Insert rows bids in committed batches; returns seconds taken"""
+    start = time.perf_counter()
+    for offset in range(0, rows, batch):
+        with engine.begin() as conn:
+            conn.execute(insert(Bid), [
+                {
+                    "id": new_id(),
+                    "product_id": random.choice(auction_ids),
+                    "user_id": buyer_id,
+                    "bid_price": random.uniform(5, 500),
+                    "created_at": datetime.now(),
+                }
+                for _ in range(min(batch, rows - offset))
+            ])
+    return time.perf_counter() - start
+
+
+def run(scheme: str, path: str, args) -> tuple:
+    engine = create_db_engine(f"sqlite:///{path}")
+
+    # Runs after the engine's own pragmas, overriding its cache size
+    @event.listens_for(engine, "connect")
+    def limit_cache(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"PRAGMA cache_size = -{args.cache_kib}")
+
+    new_id = SCHEMES[scheme]
+    buyer_id, auction_ids = seed(engine, 200)
+    insert_bids(engine, new_id, buyer_id, auction_ids, args.existing, 1000)
+    engine.dispose()  # start the timed run with a cold cache
+
+    elapsed = insert_bids(engine, new_id, buyer_id,
+                          auction_ids, args.rows, args.batch)
+    engine.dispose()
+    return args.rows / elapsed, os.path.getsize(path) / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--existing", type=int, default=200000)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=10)
+    parser.add_argument("--cache-kib", type=int, default=2048)
+    args = parser.parse_args()
+
+    print(f"{'ids':<8} {'inserts/s':>10} {'db size':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for scheme in SCHEMES:
+            rate, size = run(scheme, os.path.join(tmp, f"{scheme}.db"), args)
+            print(f"{scheme:<8} {rate:>10.0f} {size:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
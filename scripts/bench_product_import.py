@@ -0,0 +1,110 @@
+"""
+Onboarding a catalog: one create call per product vs the bulk import.
+
+The per-item path does what POST /api/products/ does for each product
+(category lookup, insert, commit, image directory); the bulk path runs
+the same rows as a CSV through app.services.product_import. Both write
+into a fresh SQLite database with the app's engine settings.
+
+    python -m scripts.bench_product_import --products 2000
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database import Base, create_async_db_engine
+from app.models import Category, Product, ProductType, User, UserRole
+from app.services.product_import import import_products, read_rows
+
+
+def catalog_csv(products: int, categories: list) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["title", "description", "type",
+                    "category", "base_price", "weight"])
+    for i in range(products):
+        writer.writerow([
+            f"Product {i}", "Hand carved", random.choice(["Sale", "Auction"]),
+            random.choice(categories), round(random.uniform(5, 500), 2),
+            round(random.uniform(0.1, 5), 2)
+        ])
+    return out.getvalue().encode()
+
+
+async def setup(path: str):
+    engine = create_async_db_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with Session() as db:
+        craftsman = User(name="Bench", phone="0", email="bench@example.com",
+                         password="x", role=UserRole.CRAFTSMAN)
+        categories = [Category(title=title)
+                      for title in ("Masks", "Batik", "Brass", "Pottery")]
+        db.add_all([craftsman, *categories])
+        await db.commit()
+    return engine, Session, craftsman.id
+
+
+async def one_by_one(Session, user_id: str, data: bytes, images_root: str):
+    async with Session() as db:
+        # The form posts category ids; the endpoint still loads each one
+        categories = dict((await db.execute(select(Category.title, Category.id))).all())
+        for _, row in read_rows(io.BytesIO(data), "catalog.csv"):
+            category = await db.get(Category, categories[row["category"]])
+            product = Product(
+                user_id=user_id,
+                category_id=category.id,
+                type=ProductType.__members__[row["type"].upper()],
+                title=row["title"],
+                description=row["description"],
+                base_price=float(row["base_price"]),
+                weight=float(row["weight"])
+            )
+            db.add(product)
+            await db.commit()
+            os.makedirs(os.path.join(images_root, product.id), exist_ok=True)
+
+
+async def run(kind: str, path: str, data: bytes, images_root: str) -> float:
+    engine, Session, user_id = await setup(path)
+    try:
+        start = time.perf_counter()
+        if kind == "per-item":
+            await one_by_one(Session, user_id, data, images_root)
+        else:
+            async with Session() as db:
+                report = await import_products(
+                    db, user_id, read_rows(io.BytesIO(data), "catalog.csv"))
+            assert report["failed"] == 0, report["errors"][:5]
+        return time.perf_counter() - start
+    finally:
+        # aiosqlite connections run on worker threads that must be closed
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=2000)
+    args = parser.parse_args()
+
+    data = catalog_csv(args.products, ["Masks", "Batik", "Brass", "Pottery"])
+    print(f"{'path':<10} {'seconds':>8} {'rows/s':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in ("per-item", "bulk"):
+            seconds = asyncio.run(run(
+                kind, os.path.join(tmp, f"{kind}.db"), data, os.path.join(tmp, "images")))
+            print(f"{kind:<10} {seconds:>8.2f} {args.products / seconds:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Mixed read/write SQLite benchmark: auction bids vs product-listing reads.
+
+Writer threads place bids the way the auction socket does (read the
+highest bid, insert, commit); reader threads run the sale listing query
+with its count and per-product highest-bid lookups. Runs once with the
+old engine settings (rollback journal) and once with create_db_engine
+(WAL and tuned pragmas).
+
+    python -m scripts.bench_sqlite_concurrency --seconds 5 --writers 4 --readers 8
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, desc, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, create_db_engine
+from app.models import Bid, Category, Product, ProductType, User, UserRole
+
+
+def seed(engine, products: int):
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        craftsman = User(name="Bench", phone="0", email="bench@example.com",
+                         password="x", role=UserRole.CRAFTSMAN)
+        buyer = User(name="Buyer", phone="0", email="buyer@example.com",
+                     password="x", role=UserRole.BUYER)
+        category = Category(title="Masks")
+        db.add_all([craftsman, buyer, category])
+        db.flush()
+        for i in range(products):
+            db.add(Product(
+                user_id=craftsman.id,
+                category_id=category.id,
+                type=ProductType.AUCTION if i % 2 else ProductType.SALE,
+                title=f"Product {i}",
+                description="Hand carved",
+                base_price=random.uniform(5, 500)
+            ))
+        db.commit()
+        auction_ids = list(db.scalars(
+            select(Product.id).where(Product.type == ProductType.AUCTION)))
+        return buyer.id, auction_ids
+
+
+def writer(Session, buyer_id, auction_ids, stop, counts):
+    while not stop.is_set():
+        product_id = random.choice(auction_ids)
+        try:
+            with Session() as db:
+                highest = db.scalars(
+                    select(Bid.bid_price).where(Bid.product_id == product_id)
+                    .order_by(desc(Bid.bid_price)).limit(1)).first() or 0
+                db.add(Bid(product_id=product_id,
+                       user_id=buyer_id, bid_price=highest + 1))
+                db.commit()
+            counts["writes"] += 1
+        except OperationalError:
+            counts["errors"] += 1
+
+
+def reader(Session, stop, counts):
+    while not stop.is_set():
+        try:
+            with Session() as db:
+                query = select(Product).where(Product.type == ProductType.AUCTION)
+                db.scalar(select(func.count()).select_from(query.subquery()))
+                page = db.scalars(query.order_by(
+                    desc(Product.created_at)).limit(12)).all()
+                for product in page:
+                    db.scalars(select(Bid.bid_price).where(Bid.product_id == product.id)
+                               .order_by(desc(Bid.bid_price)).limit(1)).first()
+            counts["reads"] += 1
+        except OperationalError:
+            counts["errors"] += 1
+
+
+def run(label, engine, args):
+    buyer_id, auction_ids = seed(engine, args.products)
+    Session = sessionmaker(bind=engine)
+    stop = threading.Event()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+
+    threads = [threading.Thread(target=writer, args=(Session, buyer_id, auction_ids, stop, counts))
+               for _ in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(Session, stop, counts))
+                for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    print(f"{label:<10} {counts['reads'] / args.seconds:>10.0f} "
+          f"{counts['writes'] / args.seconds:>10.0f} {counts['errors']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--products", type=int, default=2000)
+    args = parser.parse_args()
+
+    pool = args.writers + args.readers
+    print(f"{'engine':<10} {'reads/s':>10} {'writes/s':>10} {'errors':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        before = create_engine(f"sqlite:///{os.path.join(tmp, 'before.db')}",
+                               connect_args={"check_same_thread": False},
+                               pool_size=pool)
+        run("before", before, args)
+
+        after = create_db_engine(f"sqlite:///{os.path.join(tmp, 'after.db')}",
+                                 pool_size=pool)
+        run("after", after, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Check that the migrations emit safe DDL on PostgreSQL.
+
+Runs each migration against a mock PostgreSQL engine, which records the
+SQL instead of executing it, with inspection reporting none of the
+migrated columns yet so every conditional step runs. Fails on statements that would break an
+existing database: dropping or creating an enum type (the enum columns of
+other tables still use it) or dropping a table that holds data. Exits
+non-zero on any failure.
+
+    python -m scripts.check_migrations
+"""
+
+import re
+import sys
+from unittest import mock
+
+from sqlalchemy import create_mock_engine
+
+from app.migrations import MIGRATIONS
+
+# Migrations that read rows (backfills) and so cannot run on a mock engine
+READS_DATABASE = {2, 6}
+
+FORBIDDEN = [
+    (re.compile(r"\bDROP TYPE\b", re.I), "drops an enum type"),
+    (re.compile(r"\bCREATE TYPE\b", re.I), "creates an enum type"),
+    (re.compile(r"\bDROP TABLE\b(?!.*\bproduct_search\b)", re.I), "drops a table"),
+]
+
+
+class EmptyInspector:
+    """Inspection of a database none of the migrations have touched"""
+
+    def get_columns(self, table: str) -> list:
+        return []
+
+
+def record_migration(fn) -> tuple:
+    """
+    (statements, error): the SQL a migration function sends to PostgreSQL,
+    up to the error it raised, if any
+    """
+    statements = []
+
+    def executor(sql, *multiparams, **params):
+        statements.append(str(sql.compile(dialect=engine.dialect)).strip())
+
+    engine = create_mock_engine("postgresql://", executor)
+    try:
+        with mock.patch("app.migrations.inspect", lambda conn: EmptyInspector()):
+            fn(engine.connect())
+    except Exception as e:
+        return statements, e
+    return statements, None
+
+
+def check() -> bool:
+    ok = True
+    for version, description, fn in MIGRATIONS:
+        if version in READS_DATABASE:
+            print(f"[skip] {version} {description}: reads the database")
+            continue
+
+        statements, error = record_migration(fn)
+        problems = [
+            f"{problem}: {statement}"
+            for statement in statements
+            for pattern, problem in FORBIDDEN
+            if pattern.search(statement)
+        ]
+        if error:
+            problems.append(f"cannot run on a mock engine: {error!r}")
+
+        status = "FAIL" if problems else "ok"
+        print(f"[{status}] {version} {description}: {len(statements)} statements")
+        if problems:
+            ok = False
+            for problem in problems:
+                print(f"       {problem}")
+    return ok
+
+
+def main():
+    sys.exit(0 if check() else 1)
+
+
+if __name__ == "__main__":
+    main()
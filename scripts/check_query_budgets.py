@@ -0,0 +1,140 @@
+"""
+Check the per-endpoint SQL query budgets.
+
+Seeds a throwaway SQLite database with a few dozen products, bids, orders
+and ratings, calls each endpoint through the app and compares the
+X-DB-Queries header with its budget below. Budgets do not depend on how
+much data there is, so an endpoint that starts querying per row (an N+1)
+fails here. Exits non-zero on any failure.
+
+    python -m scripts.check_query_budgets
+"""
+
+import os
+import sys
+import tempfile
+
+# Point the app at a scratch database before it is imported
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TMP_DIR.name, 'budgets.db')}"
+os.environ.pop("DATABASE_READ_URL", None)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.database import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+from app.middleware.query_stats import assert_query_budget  # noqa: E402
+from app.models import (  # noqa: E402
+    Bid, CartItem, Category, OrderItem, OrderStatus, Product, ProductType, Rating, User, UserRole
+)
+from app.services.auth_service import issue_tokens  # noqa: E402
+from app.services.product_listing import rebuild_listing  # noqa: E402
+from app.services.product_stats import repair  # noqa: E402
+
+# (path, who is signed in, max queries); {sale} and {auction} are product ids
+BUDGETS = [
+    ("/api/products/sale", None, 2),
+    ("/api/products/auction", None, 2),
+    ("/api/products/craftsman", "craftsman", 2),
+    ("/api/landing/featured/sale", None, 2),
+    ("/api/landing/featured/auction", None, 2),
+    ("/api/landing/products/images?ids={sale},{auction}", None, 1),
+    ("/api/categories", None, 1),
+    ("/api/categories/products/sale", None, 2),
+    ("/api/product-details/{sale}", None, 2),
+    ("/api/product-details/related/{sale}", None, 3),
+    ("/api/product-details/{sale}/ratings", None, 2),
+    ("/api/auction-product/{auction}", None, 4),
+    ("/api/auction-product/{auction}/bids", None, 2),
+    ("/api/cart-page/items", "buyer", 2),
+    ("/api/checkout-page/summary", "buyer", 2),
+    ("/api/craftsman/orders", "craftsman", 4),
+    ("/api/craftsman/weekly-sales", "craftsman", 1),
+    ("/api/craftsman/recent-orders", "craftsman", 1),
+]
+
+
+def seed() -> dict:
+    with SessionLocal() as db:
+        craftsman = User(name="Craftsman", phone="0", email="craftsman@example.com",
+                         password="x", role=UserRole.CRAFTSMAN)
+        buyer = User(name="Buyer", phone="0", email="buyer@example.com",
+                     password="x", role=UserRole.BUYER)
+        categories = [Category(title=title)
+                      for title in ("Masks", "Batik", "Brass")]
+        db.add_all([craftsman, buyer, *categories])
+        db.flush()
+
+        products = []
+        for i in range(24):
+            products.append(Product(
+                user_id=craftsman.id,
+                category_id=categories[i % 3].id,
+                type=ProductType.AUCTION if i % 2 else ProductType.SALE,
+                title=f"Product {i}",
+                description="Hand carved",
+                base_price=10 + i
+            ))
+        db.add_all(products)
+        db.flush()
+
+        sale = [p for p in products if p.type == ProductType.SALE]
+        auction = [p for p in products if p.type == ProductType.AUCTION]
+        for product in auction:
+            db.add_all([Bid(product_id=product.id, user_id=buyer.id,
+                            bid_price=product.base_price + n) for n in range(1, 4)])
+        for status, product in zip(list(OrderStatus) * 2, sale):
+            order = OrderItem(user_id=buyer.id, product_id=product.id,
+                              quantity=1, unit_price=product.base_price, status=status)
+            db.add(order)
+            db.flush()
+            db.add(Rating(order_item_id=order.id, rating=4))
+        db.add_all([CartItem(user_id=buyer.id, product_id=p.id, quantity=1)
+                    for p in sale[:4]])
+        db.commit()
+        rebuild_listing(db.connection())
+        repair(db.connection())
+        db.commit()
+
+        return {
+            "sale": sale[0].id,
+            "auction": auction[0].id,
+            "tokens": {
+                "craftsman": issue_tokens(craftsman)["access_token"],
+                "buyer": issue_tokens(buyer)["access_token"],
+            },
+        }
+
+
+def check(client, data: dict) -> bool:
+    ok = True
+    for path, role, budget in BUDGETS:
+        url = path.format(**data)
+        headers = {}
+        if role:
+            headers["Authorization"] = f"Bearer {data['tokens'][role]}"
+
+        # The first call may load the signed-in principal; measure the second
+        client.get(url, headers=headers)
+        response = client.get(url, headers=headers)
+        try:
+            if response.status_code != 200:
+                raise AssertionError(f"status {response.status_code}")
+            assert_query_budget(response, budget)
+        except AssertionError as e:
+            ok = False
+            print(f"[FAIL] {path}: {e}")
+        else:
+            print(f"[ok] {path}: {response.headers['x-db-queries']}/{budget}")
+    return ok
+
+
+def main():
+    with TestClient(app) as client:
+        ok = check(client, seed())
+    TMP_DIR.cleanup()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Check that the hot query paths are served by their indexes.
+
+Builds a database with the pre-index schema, upgrades it with the
+migrations, then runs EXPLAIN QUERY PLAN on each hot query and checks the
+expected index is used (and, for ordered queries, that SQLite does not
+sort in a temp B-tree). Exits non-zero on any failure.
+
+    python -m scripts.check_query_plans
+    python -m scripts.check_query_plans --database sqlite:///./ceylon_handicrafts.db
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import create_engine, desc, select, text, tuple_
+
+from app.database import Base
+from app.migrations import run_migrations
+from app.models import (
+    ArchivedBid, Bid, CartItem, Message, OrderItem, OrderStatus, Product, ProductType
+)
+from app.services.product_images import images_query
+from app.services.product_listing import (
+    ListingFilters, after_cursor, encode_cursor, listing_query
+)
+
+# (description, query, index expected in the plan, must avoid a sort)
+HOT_QUERIES = [
+    (
+        "sale listing, newest first",
+        select(Product).where(Product.type == ProductType.SALE)
+        .order_by(desc(Product.created_at)).limit(12),
+        "ix_products_type_created_at",
+        True,
+    ),
+    (
+        "category page by price",
+        select(Product).where(Product.category_id == "c", Product.base_price >= 50)
+        .order_by(Product.base_price).limit(12),
+        "ix_products_category_id_base_price",
+        True,
+    ),
+    (
+        "sale listing page, newest first",
+        listing_query(ProductType.SALE).limit(12),
+        "ix_product_listing_type_created_at",
+        True,
+    ),
+    (
+        "auction listing page, most popular first",
+        listing_query(ProductType.AUCTION, sort="popular").limit(12),
+        "ix_product_listing_type_popularity",
+        True,
+    ),
+    (
+        "category listing page by price",
+        listing_query(ProductType.SALE, "c", min_price=50, sort="price_low").limit(12),
+        "ix_product_listing_category_type_base_price",
+        True,
+    ),
+    (
+        "category listing cursor page by price, high to low",
+        after_cursor(
+            listing_query(ProductType.AUCTION, "c", sort="price_high").limit(12), "price_high",
+            encode_cursor("price_high", 50, "p", ListingFilters(ProductType.AUCTION, "c")),
+            ListingFilters(ProductType.AUCTION, "c")),
+        "ix_product_listing_category_type_base_price",
+        True,
+    ),
+    (
+        "sale listing search, best match first",
+        listing_query(ProductType.SALE, search="wooden elep", full_text=True).limit(12),
+        "product_search VIRTUAL TABLE",
+        False,
+    ),
+    (
+        "images for a page of products",
+        images_query(["p", "q"]),
+        "ix_attachments_product_id_position",
+        True,
+    ),
+    (
+        "highest bid for an auction",
+        select(Bid).where(Bid.product_id == "p")
+        .order_by(desc(Bid.bid_price)).limit(1),
+        "ix_bids_product_id_bid_price",
+        True,
+    ),
+    (
+        "bid history page, newest first",
+        select(Bid).where(Bid.product_id == "p",
+                          tuple_(Bid.created_at, Bid.id) < (datetime(2025, 1, 1), "b"))
+        .order_by(desc(Bid.created_at), desc(Bid.id)).limit(20),
+        "ix_bids_product_id_created_at_id",
+        True,
+    ),
+    (
+        "archived bid history page, newest first",
+        select(ArchivedBid).where(
+            ArchivedBid.product_id == "p",
+            tuple_(ArchivedBid.created_at, ArchivedBid.id) < (datetime(2025, 1, 1), "b"))
+        .order_by(desc(ArchivedBid.created_at), desc(ArchivedBid.id)).limit(20),
+        "ix_archived_bids_product_id_created_at_id",
+        True,
+    ),
+    (
+        "orders for a product by status",
+        select(OrderItem).where(OrderItem.product_id == "p",
+                                OrderItem.status == OrderStatus.DELIVERED),
+        "ix_order_items_product_id_status",
+        False,
+    ),
+    (
+        "cart item for user and product",
+        select(CartItem).where(CartItem.user_id == "u",
+                               CartItem.product_id == "p"),
+        "ix_cart_items_user_id_product_id",
+        False,
+    ),
+    (
+        "latest message in a chat",
+        select(Message).where(Message.chat_id == "c")
+        .order_by(desc(Message.created_at), desc(Message.id)).limit(1),
+        "ix_messages_chat_id_created_at_id",
+        True,
+    ),
+    (
+        "chat history page, newest first",
+        select(Message).where(Message.chat_id == "c",
+                              tuple_(Message.created_at, Message.id) < (datetime(2025, 1, 1), "m"))
+        .order_by(desc(Message.created_at), desc(Message.id)).limit(20),
+        "ix_messages_chat_id_created_at_id",
+        True,
+    ),
+]
+
+
+def build_pre_index_schema(engine):
+    """Create the tables as they were before the index migration"""
+    import app.models  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.tables.values():
+            for index in table.indexes:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+
+def explain(conn, query) -> str:
+    sql = str(query.compile(dialect=conn.dialect,
+              compile_kwargs={"literal_binds": True}))
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+def check(engine) -> bool:
+    ok = True
+    with engine.connect() as conn:
+        for description, query, index, ordered in HOT_QUERIES:
+            plan = explain(conn, query)
+            problems = []
+            if index not in plan:
+                problems.append(f"does not use {index}")
+            if ordered and "TEMP B-TREE" in plan:
+                problems.append("sorts in a temp B-tree")
+
+            status = "FAIL" if problems else "ok"
+            print(f"[{status}] {description}: {'; '.join(problems) or index}")
+            if problems:
+                ok = False
+                print("       " + plan.replace("\n", "\n       "))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--database", help="check an existing SQLite database (it is migrated first)")
+    args = parser.parse_args()
+
+    if args.database:
+        engine = create_engine(args.database)
+        run_migrations(engine)
+        sys.exit(0 if check(engine) else 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'plans.db')}")
+        build_pre_index_schema(engine)
+        run_migrations(engine)
+        ok = check(engine)
+        engine.dispose()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""
+Fill a database with a synthetic marketplace for load and scale testing.
+
+Creates buyers (with addresses) and craftsmen, categories, sale and
+auction products with image directories, bids, cart items, orders in
+every status, ratings, chats and messages. Activity is skewed the way a
+real marketplace is: a few craftsmen list most products, a few products
+draw most bids and orders, a few buyers place most of them. Rows go in
+with multi-row inserts, a batch of products and everything hanging off
+them per transaction, and the product aggregates are filled in as they
+are generated. The database is migrated first; existing rows are kept.
+
+Every generated user signs in with the password "password".
+
+    python -m scripts.generate_dataset
+    python -m scripts.generate_dataset --database sqlite:///./scale.db --scale 100
+    python -m scripts.generate_dataset --products 50000 --bids 400000 --no-images
+"""
+
+import argparse
+import itertools
+import os
+import random
+import shutil
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app.database import DATABASE_URL, create_db_engine, pwd_context
+from app.migrations import run_migrations
+from app.models import (
+    Bid, CartItem, Category, Chat, Message, OrderItem, OrderStatus, Product,
+    ProductType, Rating, User, UserAddress, UserRole, uuid7
+)
+from app.services.product_images import sync_images
+from app.services.product_listing import refresh_listing
+
+PASSWORD = "password"
+PLACEHOLDER_IMAGE = "app/public/images/auth_featuring.jpg"
+
+# Row counts at --scale 1; --scale 100 is roughly 2.5 million rows
+SIZES = {
+    "users": 1000,
+    "products": 2000,
+    "bids": 10000,
+    "orders": 5000,
+    "cart_items": 2000,
+    "chats": 500,
+    "messages": 5000,
+}
+CRAFTSMAN_SHARE = 0.05
+AUCTION_SHARE = 0.3
+RATED_SHARE = 0.6  # delivered orders that get a rating
+
+# Most orders end up delivered; every status shows up
+ORDER_STATUSES = {
+    OrderStatus.INITIATED: 4,
+    OrderStatus.PAID: 6,
+    OrderStatus.ACCEPTED: 8,
+    OrderStatus.DENIED: 3,
+    OrderStatus.DEPARTED: 10,
+    OrderStatus.DELIVERED: 65,
+    OrderStatus.DELIVER_FAILED: 4,
+}
+RATINGS = {1: 3, 2: 4, 3: 10, 4: 30, 5: 53}
+
+CRAFTS = ["Masks", "Batik", "Brassware", "Pottery", "Lacquerware", "Wood Carvings",
+          "Handloom", "Beeralu Lace", "Jewellery", "Drums", "Coir", "Reed Weaving"]
+ADJECTIVES = ["Hand-carved", "Hand-painted", "Traditional", "Antique-finish",
+              "Miniature", "Ceremonial", "Handwoven", "Engraved", "Large", "Classic"]
+NOUNS = ["Kolam Mask", "Wall Hanging", "Oil Lamp", "Elephant", "Vase", "Tray",
+         "Saree", "Table Runner", "Pendant", "Drum", "Bowl", "Box", "Peacock"]
+CITIES = ["Colombo", "Kandy", "Galle", "Matara", "Jaffna", "Negombo", "Kurunegala",
+          "Anuradhapura", "Ambalangoda", "Ratnapura"]
+
+
+def zipf_weights(n: int, s: float, rng: random.Random) -> list:
+    """Zipf-like weights for n items, in random order"""
+    weights = [1 / (rank + 1) ** s for rank in range(n)]
+    rng.shuffle(weights)
+    return weights
+
+
+def spread(total: int, weights: list, rng: random.Random) -> list:
+    """Split total into whole counts, one per weight, proportional to it"""
+    scale = total / sum(weights) if weights else 0
+    counts = []
+    for weight in weights:
+        expected = weight * scale
+        counts.append(int(expected) + (rng.random() < expected % 1))
+    return counts
+
+
+def picker(items: list, weights: list, rng: random.Random):
+    """Weighted random choice from items, cumulative weights built once"""
+    cum_weights = list(itertools.accumulate(weights))
+    return lambda k=1: rng.choices(items, cum_weights=cum_weights, k=k)
+
+
+def random_time(rng: random.Random, start: datetime, end: datetime) -> datetime:
+    return start + (end - start) * rng.random()
+
+
+def insert_rows(conn, model, rows: list, batch_size: int):
+    for offset in range(0, len(rows), batch_size):
+        conn.execute(insert(model), rows[offset:offset + batch_size])
+
+
+class Generator:
+    def __init__(self, engine, args):
+        self.engine = engine
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.now = datetime.now()
+        self.start = self.now - timedelta(days=args.days)
+        self.counts = {}
+
+    def write(self, model, rows: list, conn=None):
+        if conn is None:
+            with self.engine.begin() as conn:
+                insert_rows(conn, model, rows, self.args.batch_size)
+        else:
+            insert_rows(conn, model, rows, self.args.batch_size)
+        name = model.__tablename__
+        self.counts[name] = self.counts.get(name, 0) + len(rows)
+
+    def users(self):
+        rng = self.rng
+        total = self.args.users
+        craftsmen = max(1, round(total * CRAFTSMAN_SHARE))
+        password = pwd_context.hash(PASSWORD)
+        self.craftsman_ids, self.buyer_ids = [], []
+
+        for offset in range(0, total, self.args.batch_size):
+            users, addresses = [], []
+            for n in range(offset, min(offset + self.args.batch_size, total)):
+                role = UserRole.CRAFTSMAN if n < craftsmen else UserRole.BUYER
+                user_id = uuid7(random_time(rng, self.start, self.now))
+                name = f"{role.value} {n + 1}"
+                users.append({
+                    "id": user_id,
+                    "name": name,
+                    "phone": f"07{rng.randrange(10 ** 8):08d}",
+                    # The random tail of the id keeps emails unique across runs
+                    "email": f"{role.value.lower()}-{user_id[-12:]}@example.com",
+                    "password": password,
+                    "role": role,
+                })
+                addresses.append({
+                    "user_id": user_id,
+                    "country": "Sri Lanka",
+                    "state": "Western",
+                    "city": rng.choice(CITIES),
+                    "postal_code": f"{rng.randrange(10000, 99999)}",
+                    "address_line": f"{rng.randrange(1, 400)} Temple Road",
+                })
+                (self.craftsman_ids if role == UserRole.CRAFTSMAN else self.buyer_ids).append(user_id)
+            with self.engine.begin() as conn:
+                self.write(User, users, conn)
+                self.write(UserAddress, addresses, conn)
+
+        # A handful of craftsmen list most products; a handful of buyers
+        # place most bids and orders
+        self.pick_craftsman = picker(
+            self.craftsman_ids, zipf_weights(len(self.craftsman_ids), 1.1, rng), rng)
+        self.pick_buyer = picker(
+            self.buyer_ids or self.craftsman_ids,
+            zipf_weights(len(self.buyer_ids or self.craftsman_ids), 0.8, rng), rng)
+
+    def categories(self):
+        titles = CRAFTS[:self.args.categories] + [
+            f"Crafts {n}" for n in range(len(CRAFTS), self.args.categories)]
+        rows = [{"id": uuid7(self.start), "title": title,
+                 "description": f"{title} from across Sri Lanka"} for title in titles]
+        self.write(Category, rows)
+        ids = [row["id"] for row in rows]
+        self.pick_category = picker(ids, zipf_weights(len(ids), 0.8, self.rng), self.rng)
+
+    def products(self):
+        rng = self.rng
+        total = self.args.products
+        types = [ProductType.AUCTION if rng.random() < AUCTION_SHARE else ProductType.SALE
+                 for _ in range(total)]
+        popularity = zipf_weights(total, 1.0, rng)
+        bid_counts = spread(self.args.bids, [
+            weight if kind == ProductType.AUCTION else 0
+            for weight, kind in zip(popularity, types)], rng)
+        order_counts = spread(self.args.orders, popularity, rng)
+
+        self.sale_ids, sale_weights = [], []
+        for offset in range(0, total, self.args.batch_size):
+            batch = range(offset, min(offset + self.args.batch_size, total))
+            craftsmen = self.pick_craftsman(len(batch))
+            categories = self.pick_category(len(batch))
+            rows = {Product: [], Bid: [], OrderItem: [], Rating: []}
+            for i, user_id, category_id in zip(batch, craftsmen, categories):
+                product = self.product(user_id, category_id, types[i])
+                self.bids(product, bid_counts[i], rows[Bid])
+                self.orders(product, order_counts[i], rows[OrderItem], rows[Rating])
+                rows[Product].append(product)
+                if types[i] == ProductType.SALE:
+                    self.sale_ids.append(product["id"])
+                    sale_weights.append(popularity[i])
+
+            product_ids = [row["id"] for row in rows[Product]]
+            # Images first so their rows and the listing rows pick them up
+            if not self.args.no_images:
+                self.images(product_ids)
+            # Products first so the rows pointing at them have a parent
+            with self.engine.begin() as conn:
+                for model, model_rows in rows.items():
+                    self.write(model, model_rows, conn)
+                sync_images(conn, product_ids)
+                refresh_listing(conn, product_ids)
+            print(f"  products {batch.stop}/{total}")
+
+        self.pick_sale = picker(self.sale_ids, sale_weights, rng) if self.sale_ids else None
+
+    def product(self, user_id: str, category_id: str, kind: ProductType) -> dict:
+        rng = self.rng
+        created_at = random_time(rng, self.start, self.now)
+        return {
+            "id": uuid7(created_at),
+            "user_id": user_id,
+            "category_id": category_id,
+            "type": kind,
+            "title": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}",
+            "description": "Handmade by a Sri Lankan artisan",
+            # Prices are long-tailed too: mostly small pieces, some large
+            "base_price": round(min(rng.lognormvariate(3.5, 0.9), 5000), 2),
+            "weight": round(rng.uniform(0.1, 8), 2),
+            "length": round(rng.uniform(5, 120), 1),
+            "width": round(rng.uniform(5, 80), 1),
+            "height": round(rng.uniform(1, 60), 1),
+            "created_at": created_at,
+            "updated_at": created_at,
+            "highest_bid": None,
+            "highest_bidder_id": None,
+            "bid_count": 0,
+            "rating_avg": None,
+            "rating_count": 0,
+            "order_count": 0,
+        }
+
+    def bids(self, product: dict, count: int, rows: list):
+        """Rising bids spread over the product's lifetime"""
+        if not count:
+            return
+        rng = self.rng
+        times = sorted(random_time(rng, product["created_at"], self.now) for _ in range(count))
+        price = product["base_price"]
+        for created_at, user_id in zip(times, self.pick_buyer(count)):
+            # Steps relative to the base price so hot auctions stay finite
+            price = round(price + product["base_price"] * rng.uniform(0.02, 0.1) + 1, 2)
+            rows.append({"id": uuid7(created_at), "product_id": product["id"],
+                         "user_id": user_id, "bid_price": price, "created_at": created_at})
+        product.update(highest_bid=price, highest_bidder_id=user_id, bid_count=count)
+
+    def orders(self, product: dict, count: int, rows: list, ratings: list):
+        if not count:
+            return
+        rng = self.rng
+        auction = product["type"] == ProductType.AUCTION
+        statuses = rng.choices(list(ORDER_STATUSES), list(ORDER_STATUSES.values()), k=count)
+        scores = []
+        for status, user_id in zip(statuses, self.pick_buyer(count)):
+            created_at = random_time(rng, product["created_at"], self.now)
+            order_id = uuid7(created_at)
+            rows.append({
+                "id": order_id,
+                "user_id": user_id,
+                "product_id": product["id"],
+                "quantity": 1 if auction else rng.choice((1, 1, 1, 2, 3)),
+                "unit_price": product["highest_bid"] or product["base_price"],
+                "status": status,
+                "created_at": created_at,
+                "updated_at": random_time(rng, created_at, self.now),
+            })
+            if status == OrderStatus.DELIVERED and rng.random() < RATED_SHARE:
+                score = rng.choices(list(RATINGS), list(RATINGS.values()))[0]
+                scores.append(score)
+                ratings.append({
+                    "id": uuid7(random_time(rng, created_at, self.now)),
+                    "order_item_id": order_id,
+                    "rating": score,
+                    "description": "Lovely work" if score >= 4 else None,
+                    "images": None,
+                })
+        product["order_count"] = count
+        if scores:
+            product.update(rating_avg=sum(scores) / len(scores), rating_count=len(scores))
+
+    def images(self, product_ids: list):
+        """An image directory per product, holding a link to a placeholder"""
+        for product_id in product_ids:
+            directory = os.path.join(self.args.images_dir, product_id)
+            os.makedirs(directory, exist_ok=True)
+            target = os.path.join(directory, "placeholder.jpg")
+            try:
+                os.link(PLACEHOLDER_IMAGE, target)
+            except FileExistsError:
+                pass
+            except OSError:
+                shutil.copyfile(PLACEHOLDER_IMAGE, target)
+
+    def cart_items(self):
+        if not self.pick_sale:
+            return
+        rng = self.rng
+        seen = set()
+        rows = []
+        for user_id, product_id in zip(self.pick_buyer(self.args.cart_items),
+                                       self.pick_sale(self.args.cart_items)):
+            if (user_id, product_id) in seen:
+                continue
+            seen.add((user_id, product_id))
+            created_at = random_time(rng, self.now - timedelta(days=30), self.now)
+            rows.append({"id": uuid7(created_at), "user_id": user_id, "product_id": product_id,
+                         "quantity": rng.choice((1, 1, 2)),
+                         "created_at": created_at, "updated_at": created_at})
+        self.write(CartItem, rows)
+
+    def chats(self):
+        rng = self.rng
+        total = self.args.chats
+        message_counts = spread(self.args.messages, zipf_weights(total, 0.7, rng), rng)
+        for offset in range(0, total, self.args.batch_size):
+            batch = range(offset, min(offset + self.args.batch_size, total))
+            chats, messages = [], []
+            for i, user_id in zip(batch, self.pick_buyer(len(batch))):
+                created_at = random_time(rng, self.start, self.now)
+                chat_id = uuid7(created_at)
+                times = sorted(random_time(rng, created_at, self.now)
+                               for _ in range(message_counts[i]))
+                for n, sent_at in enumerate(times):
+                    from_user = n % 2 == 0
+                    messages.append({
+                        "id": uuid7(sent_at),
+                        "chat_id": chat_id,
+                        "is_from_user": from_user,
+                        "message": "Which of these would suit a wedding gift?" if from_user
+                        else "Brass oil lamps and hand-painted masks are popular choices.",
+                        "created_at": sent_at,
+                    })
+                chats.append({"id": chat_id, "title": f"Gift ideas {i + 1}", "user_id": user_id,
+                              "created_at": created_at, "updated_at": times[-1] if times else created_at})
+            with self.engine.begin() as conn:
+                self.write(Chat, chats, conn)
+                self.write(Message, messages, conn)
+
+    def run(self):
+        steps = [("users", self.users), ("categories", self.categories),
+                 ("products, bids, orders and ratings", self.products),
+                 ("cart items", self.cart_items), ("chats and messages", self.chats)]
+        for name, step in steps:
+            start = time.perf_counter()
+            step()
+            print(f"{name}: {time.perf_counter() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database", default=DATABASE_URL)
+    parser.add_argument("--scale", type=float, default=1,
+                        help="multiply every default row count")
+    for name, size in SIZES.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int,
+                            help=f"default {size} x scale")
+    parser.add_argument("--categories", type=int, default=len(CRAFTS))
+    parser.add_argument("--days", type=int, default=365,
+                        help="spread creation times over this many days")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--images-dir", default="app/public/images/products")
+    parser.add_argument("--no-images", action="store_true",
+                        help="skip the per-product image directories")
+    args = parser.parse_args()
+    for name, size in SIZES.items():
+        if getattr(args, name) is None:
+            setattr(args, name, max(1, int(size * args.scale)))
+
+    engine = create_db_engine(args.database)
+    run_migrations(engine)
+    start = time.perf_counter()
+    generator = Generator(engine, args)
+    try:
+        generator.run()
+    finally:
+        engine.dispose()
+
+    seconds = time.perf_counter() - start
+    rows = sum(generator.counts.values())
+    for table, count in generator.counts.items():
+        print(f"{table:<16} {count:>10}")
+    print(f"{rows} rows in {seconds:.1f}s ({rows / seconds:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Rebuild the materialized product_listing table from products, categories
+and product images.
+
+The rows are kept current as products, images, bids, orders and ratings
+change; this rebuilds them after manual data fixes or restores. With
+--images the image rows are first re-read from the product image
+directories, for directories copied in from elsewhere.
+
+    python -m scripts.rebuild_product_listing
+    python -m scripts.rebuild_product_listing --images
+"""
+
+import argparse
+
+from sqlalchemy import select
+
+from app.database import create_db_engine, DATABASE_URL
+from app.models import Product
+from app.services.product_images import sync_images
+from app.services.product_listing import rebuild_listing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database", default=DATABASE_URL)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--images", action="store_true",
+                        help="re-read the image directories first")
+    args = parser.parse_args()
+
+    engine = create_db_engine(args.database)
+    with engine.begin() as conn:
+        if args.images:
+            product_ids = conn.execute(select(Product.id)).scalars().all()
+            images = 0
+            for offset in range(0, len(product_ids), args.batch_size):
+                images += sync_images(conn, product_ids[offset:offset + args.batch_size])
+            print(f"Found {images} image(s)")
+        rebuilt = rebuild_listing(conn, args.batch_size)
+    engine.dispose()
+    print(f"Rebuilt listing rows for {rebuilt} product(s)")
+
+
+if __name__ == "__main__":
+    main()
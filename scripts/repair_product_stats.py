@@ -0,0 +1,45 @@
+"""
+Recompute the denormalized product aggregates from bids, orders and ratings.
+
+The bid and order columns are kept current as those rows are written, and
+ratings have no write path in the app; this rebuilds them all after manual
+data fixes, restores or imported ratings. With --check it only
+reports the products whose stored values have drifted, and exits non-zero
+if there are any.
+
+    python -m scripts.repair_product_stats
+    python -m scripts.repair_product_stats --check
+"""
+
+import argparse
+import sys
+
+from app.database import create_db_engine, DATABASE_URL
+from app.services.product_stats import find_drift, repair
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database", default=DATABASE_URL)
+    parser.add_argument("--check", action="store_true",
+                        help="report drift without changing anything")
+    args = parser.parse_args()
+
+    engine = create_db_engine(args.database)
+    if args.check:
+        with engine.connect() as conn:
+            drifted = find_drift(conn)
+        for row in drifted:
+            print(f"{row.id}: stored {tuple(row[1:7])} expected {tuple(row[7:])}")
+        print(f"{len(drifted)} product(s) out of date")
+        engine.dispose()
+        sys.exit(1 if drifted else 0)
+
+    with engine.begin() as conn:
+        updated = repair(conn)
+    engine.dispose()
+    print(f"Recomputed aggregates for {updated} product(s)")
+
+
+if __name__ == "__main__":
+    main()